@@ -0,0 +1,174 @@
+"""
+Бэкенды, на которых queries.execute_query выполняет SQL из build_query.
+
+  postgres — основной: пул из db.py, агрегаты и лидерборды (USE_ROLLUPS);
+  duckdb   — колоночный встроенный движок по Parquet-файлам из
+             parquet_export.py: videos.parquet и
+             video_snapshots/month=YYYY-MM/data.parquet. Запросы те же,
+             что без агрегатов (use_rollups=False), с заменой плейсхолдеров
+             на $n и date_bin на арифметику по epoch.
+
+Какой бэкенд отвечает на какой query_type — QUERY_BACKENDS, пары через
+запятую, * — все остальные:
+
+  QUERY_BACKENDS="sum_views_for_videos_in_date_range=duckdb,metric_series=duckdb,*=postgres"
+
+duckdb необязателен (pip install duckdb pytz) и нужен, только если он
+упомянут в QUERY_BACKENDS. Parquet отстаёт от PostgreSQL до следующей
+выгрузки: `python load_data.py ... --parquet data/parquet`.
+"""
+import os
+import re
+import itertools
+import threading
+from pathlib import Path
+
+import db
+
+PARQUET_DIR = Path(os.getenv("PARQUET_DIR", "data/parquet"))
+QUERY_BACKENDS = os.getenv("QUERY_BACKENDS", "*=postgres")
+# 0 — по числу ядер
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0"))
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "")
+
+def load_duckdb():
+    """
+    Модуль duckdb или None, если он не установлен. Импортируется при первом
+    обращении, а не при старте бота, которому duckdb может быть не нужен.
+    """
+    try:
+        import duckdb
+    except ImportError:
+        return None
+    return duckdb
+
+
+_DATE_BIN_RE = re.compile(r"date_bin\((\$\d+), ([\w.]+), (\$\d+)\)")
+
+
+class PostgresBackend:
+    name = "postgres"
+    # агрегаты из 003_rollups.sql и 007_leaderboards.sql есть только здесь
+    rollups = True
+
+    def fetch(self, sql: str, params: tuple) -> list[tuple]:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+
+    def explain(self, sql: str, params: tuple) -> str:
+        return "\n".join(row[0] for row in self.fetch("EXPLAIN " + sql, params))
+
+
+class DuckDbBackend:
+    """
+    In-memory DuckDB с представлениями videos и video_snapshots над Parquet.
+
+    Glob в представлении раскрывается при каждом запросе, так что новые
+    и перезаписанные месяцы видны без переоткрытия. Каждый вызов fetch
+    идёт через свой cursor() — DuckDB-соединение нельзя делить между потоками.
+    """
+
+    name = "duckdb"
+    rollups = False
+
+    def __init__(self, parquet_dir: Path = PARQUET_DIR, threads: int = DUCKDB_THREADS):
+        duckdb = load_duckdb()
+        if duckdb is None:
+            raise RuntimeError("для бэкенда duckdb нужен пакет duckdb: pip install duckdb pytz")
+
+        self.parquet_dir = Path(parquet_dir).resolve()
+        if not (self.parquet_dir / "videos.parquet").exists():
+            raise RuntimeError(f"в {self.parquet_dir} нет выгрузки, запустите python parquet_export.py --full")
+
+        self._conn = duckdb.connect()
+        self._conn.execute(f"SET TimeZone = '{db.DB_TIMEZONE}';")
+        if threads:
+            self._conn.execute(f"SET threads = {int(threads)};")
+        if DUCKDB_MEMORY_LIMIT:
+            self._conn.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}';")
+        self._conn.execute(
+            f"CREATE VIEW videos AS SELECT * FROM read_parquet('{self.parquet_dir / 'videos.parquet'}');"
+        )
+        self._conn.execute(
+            f"""
+            CREATE VIEW video_snapshots AS
+            SELECT * EXCLUDE (month)
+            FROM read_parquet('{self.parquet_dir / 'video_snapshots' / '*' / '*.parquet'}', hive_partitioning = true);
+            """
+        )
+
+    @staticmethod
+    def translate(sql: str) -> str:
+        """
+        %s → $1, $2, ...; date_bin(шаг, ts, начало) → те же интервалы через epoch.
+        time_bucket по timestamptz идёт через ICU и на порядок медленнее.
+        """
+        n = itertools.count(1)
+        sql = re.sub(r"%s", lambda m: f"${next(n)}", sql)
+        return _DATE_BIN_RE.sub(
+            lambda m: (
+                f"to_timestamp(epoch({m[3]}::TIMESTAMPTZ) + floor((epoch({m[2]}) - epoch({m[3]}::TIMESTAMPTZ))"
+                f" / epoch({m[1]}::INTERVAL)) * epoch({m[1]}::INTERVAL))"
+            ),
+            sql,
+        )
+
+    def fetch(self, sql: str, params: tuple) -> list[tuple]:
+        cur = self._conn.cursor()
+        try:
+            return cur.execute(self.translate(sql), list(params)).fetchall()
+        finally:
+            cur.close()
+
+    def explain(self, sql: str, params: tuple) -> str:
+        return "\n".join(row[1] for row in self.fetch("EXPLAIN " + sql, params))
+
+    def close(self):
+        self._conn.close()
+
+
+BACKENDS = {"postgres": PostgresBackend, "duckdb": DuckDbBackend}
+
+_instances: dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def parse_routes(spec: str) -> dict[str, str]:
+    routes = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        query_type, _, name = item.partition("=")
+        name = name.strip()
+        if name not in BACKENDS:
+            raise ValueError(f"неизвестный бэкенд {name!r} в QUERY_BACKENDS")
+        routes[query_type.strip()] = name
+    return routes
+
+
+ROUTES = parse_routes(QUERY_BACKENDS)
+
+
+def get_backend(name: str):
+    """
+    Один экземпляр бэкенда на процесс, создаётся при первом обращении.
+    """
+    if name not in _instances:
+        with _lock:
+            if name not in _instances:
+                _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+
+def backend_for(query_type: str, name: str | None = None):
+    return get_backend(name or ROUTES.get(query_type) or ROUTES.get("*", "postgres"))
+
+
+def close_backends():
+    with _lock:
+        for backend in _instances.values():
+            if hasattr(backend, "close"):
+                backend.close()
+        _instances.clear()
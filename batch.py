@@ -0,0 +1,302 @@
+"""
+Пакетное выполнение query_desc: список описаний → список чисел в том же порядке.
+
+Описания группируются по query_type (для snapshots_with_negative_delta —
+ещё по метрике и наличию даты), каждая группа — один set-based подзапрос:
+параметры уходят массивами в unnest(...) WITH ORDINALITY, к ним
+присоединяется таблица, и GROUP BY по номеру строки даёт ответ на каждую.
+Все группы склеиваются через UNION ALL, так что на весь пакет — один
+запрос к базе и один снимок данных.
+
+  python batch.py descs.json            # JSON-массив query_desc → JSON-массив чисел
+  echo '[{"query_type": "total_videos"}]' | python batch.py
+"""
+import sys
+import json
+import logging
+import argparse
+from decimal import Decimal
+from datetime import date
+
+import db
+import metrics
+from queries import USE_ROLLUPS, NEGATIVE_DELTA_COLUMNS, date_range, day_range, time_range
+
+log = logging.getLogger("batch")
+
+def _params(descs: list[dict], *columns) -> tuple[str, list]:
+    """
+    unnest по колонкам: columns — тройки (имя, тип, функция desc → значение).
+    """
+    arrays = [[fn(d) for d in descs] for _, _, fn in columns]
+    args = ", ".join(f"%s::{sql_type}[]" for _, sql_type, _ in columns)
+    names = ", ".join(name for name, _, _ in columns)
+    return f"unnest({args}) WITH ORDINALITY AS p({names}, idx)", arrays
+
+
+def _range_from(key_from: str, key_to: str):
+    return lambda d: date_range(d[key_from], d[key_to])[0]
+
+
+def _range_to(key_from: str, key_to: str):
+    return lambda d: date_range(d[key_from], d[key_to])[1]
+
+
+def _group_sql(qt: str, descs: list[dict], use_rollups: bool) -> tuple[str, list] | None:
+    """
+    SQL группы: строки (idx, value), idx — номер описания в группе с 1;
+    idx NULL — у группы нет параметров, и ответ один на всех.
+    """
+    if qt == "total_videos":
+        return "SELECT NULL::bigint, COUNT(*)::numeric FROM videos", []
+
+    elif qt == "creator_videos_with_min_views":
+        source, params = _params(
+            descs,
+            ("creator_id", "text", lambda d: d["creator_id"]),
+            ("threshold", "bigint", lambda d: d["views_threshold"]),
+        )
+        return (
+            f"""
+            SELECT p.idx, COUNT(v.id)::numeric
+            FROM {source}
+            LEFT JOIN videos AS v
+              ON v.creator_id = p.creator_id AND v.views_count > p.threshold
+            GROUP BY p.idx
+            """,
+            params,
+        )
+
+    elif qt == "creator_videos_in_date_range":
+        source, params = _params(
+            descs,
+            ("creator_id", "text", lambda d: d["creator_id"]),
+            ("ts_from", "timestamptz", _range_from("date_from", "date_to")),
+            ("ts_to", "timestamptz", _range_to("date_from", "date_to")),
+        )
+        return (
+            f"""
+            SELECT p.idx, COUNT(v.id)::numeric
+            FROM {source}
+            LEFT JOIN videos AS v
+              ON v.creator_id = p.creator_id
+             AND v.video_created_at >= p.ts_from
+             AND v.video_created_at < p.ts_to
+            GROUP BY p.idx
+            """,
+            params,
+        )
+
+    elif qt == "videos_with_min_views":
+        source, params = _params(descs, ("threshold", "bigint", lambda d: d["views_threshold"]))
+        return (
+            f"""
+            SELECT p.idx, COUNT(v.id)::numeric
+            FROM {source}
+            LEFT JOIN videos AS v ON v.views_count > p.threshold
+            GROUP BY p.idx
+            """,
+            params,
+        )
+
+    elif qt == "videos_with_new_views_on_date":
+        if use_rollups:
+            source, params = _params(descs, ("day", "date", lambda d: date.fromisoformat(d["date"])))
+            return (
+                f"""
+                SELECT p.idx, COUNT(s.video_id)::numeric
+                FROM {source}
+                LEFT JOIN video_daily_stats AS s
+                  ON s.day = p.day AND s.positive_views_snapshots > 0
+                GROUP BY p.idx
+                """,
+                params,
+            )
+
+        source, params = _params(
+            descs,
+            ("ts_from", "timestamptz", lambda d: day_range(d["date"])[0]),
+            ("ts_to", "timestamptz", lambda d: day_range(d["date"])[1]),
+        )
+        return (
+            f"""
+            SELECT p.idx, COUNT(DISTINCT s.video_id)::numeric
+            FROM {source}
+            LEFT JOIN video_snapshots AS s
+              ON s.created_at >= p.ts_from
+             AND s.created_at < p.ts_to
+             AND s.delta_views_count > 0
+            GROUP BY p.idx
+            """,
+            params,
+        )
+
+    elif qt == "sum_views_for_videos_in_date_range":
+        source, params = _params(
+            descs,
+            ("ts_from", "timestamptz", _range_from("date_from", "date_to")),
+            ("ts_to", "timestamptz", _range_to("date_from", "date_to")),
+        )
+        return (
+            f"""
+            SELECT p.idx, COALESCE(SUM(v.views_count), 0)::numeric
+            FROM {source}
+            LEFT JOIN videos AS v
+              ON v.video_created_at >= p.ts_from
+             AND v.video_created_at < p.ts_to
+            GROUP BY p.idx
+            """,
+            params,
+        )
+
+    elif qt == "snapshots_with_negative_delta":
+        # в группе одна метрика и либо у всех есть дата, либо ни у кого
+        metric = descs[0]["metric"]
+        col = NEGATIVE_DELTA_COLUMNS.get(metric)
+        if not col:
+            return "SELECT NULL::bigint, 0::numeric", []
+
+        if not descs[0].get("date"):
+            if use_rollups:
+                return (
+                    f"SELECT NULL::bigint, COALESCE(SUM(negative_{metric}_snapshots), 0)::numeric FROM daily_stats",
+                    [],
+                )
+            return f"SELECT NULL::bigint, COUNT(*)::numeric FROM video_snapshots WHERE {col} < 0", []
+
+        if use_rollups:
+            source, params = _params(descs, ("day", "date", lambda d: date.fromisoformat(d["date"])))
+            return (
+                f"""
+                SELECT p.idx, COALESCE(SUM(s.negative_{metric}_snapshots), 0)::numeric
+                FROM {source}
+                LEFT JOIN daily_stats AS s ON s.day = p.day
+                GROUP BY p.idx
+                """,
+                params,
+            )
+
+        source, params = _params(
+            descs,
+            ("ts_from", "timestamptz", lambda d: day_range(d["date"])[0]),
+            ("ts_to", "timestamptz", lambda d: day_range(d["date"])[1]),
+        )
+        return (
+            f"""
+            SELECT p.idx, COUNT(s.{col})::numeric
+            FROM {source}
+            LEFT JOIN video_snapshots AS s
+              ON s.{col} < 0
+             AND s.created_at >= p.ts_from
+             AND s.created_at < p.ts_to
+            GROUP BY p.idx
+            """,
+            params,
+        )
+
+    elif qt == "creator_views_delta_in_time_range":
+        # агрегаты здесь не используются: граница по минутам, а join по креатору
+        # и так идёт по индексам (creator_id, video_created_at) и (video_id, created_at)
+        source, params = _params(
+            descs,
+            ("creator_id", "text", lambda d: d["creator_id"]),
+            ("ts_from", "timestamptz", lambda d: time_range(d["date"], d["time_from"], d["time_to"])[0]),
+            ("ts_to", "timestamptz", lambda d: time_range(d["date"], d["time_from"], d["time_to"])[1]),
+        )
+        return (
+            f"""
+            SELECT p.idx, COALESCE(SUM(s.delta_views_count), 0)::numeric
+            FROM {source}
+            LEFT JOIN (videos AS v JOIN video_snapshots AS s ON s.video_id = v.id)
+              ON v.creator_id = p.creator_id
+             AND s.created_at >= p.ts_from
+             AND s.created_at < p.ts_to
+            GROUP BY p.idx
+            """,
+            params,
+        )
+
+    return None
+
+
+def _group_key(query_desc: dict) -> tuple:
+    qt = query_desc.get("query_type")
+    if qt == "snapshots_with_negative_delta":
+        return qt, query_desc.get("metric"), bool(query_desc.get("date"))
+    return (qt,)
+
+
+def build_batch(descs: list[dict], use_rollups: bool = USE_ROLLUPS) -> tuple[str | None, list, list[list[int]]]:
+    """
+    (SQL, параметры, позиции): строка ответа (group, idx, value) относится
+    к описаниям positions[group][idx - 1]. Одинаковые описания считаются один раз.
+    """
+    groups: dict[tuple, dict[str, list[int]]] = {}
+    for pos, desc in enumerate(descs):
+        key = json.dumps({k: v for k, v in desc.items() if v is not None}, sort_keys=True, ensure_ascii=False)
+        groups.setdefault(_group_key(desc), {}).setdefault(key, []).append(pos)
+
+    parts = []
+    params = []
+    positions = []
+    for (qt, *_), unique in groups.items():
+        group_descs = [descs[p[0]] for p in unique.values()]
+        built = _group_sql(qt, group_descs, use_rollups)
+        if built is None:
+            log.warning("unknown query_type: %s", qt)
+            continue
+        sql, group_params = built
+        parts.append(f"SELECT {len(positions)} AS grp, t.* FROM ({sql}) AS t")
+        params += group_params
+        positions.append(list(unique.values()))
+
+    if not parts:
+        return None, [], []
+    return "\nUNION ALL\n".join(parts), params, positions
+
+
+def execute_batch(descs: list[dict], use_rollups: bool = USE_ROLLUPS) -> list[int]:
+    """
+    Ответы на все descs одним запросом; неизвестный query_type → 0, как в execute_query.
+    """
+    results = [0] * len(descs)
+    sql, params, positions = build_batch(descs, use_rollups)
+    if sql is None:
+        return results
+
+    with metrics.span("sql", "batch"):
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+
+    for grp, idx, value in rows:
+        if isinstance(value, Decimal):
+            value = int(value)
+        targets = positions[grp] if idx is None else [positions[grp][idx - 1]]
+        for same in targets:
+            for pos in same:
+                results[pos] = value
+
+    log.debug("batch: %d descs, %d groups", len(descs), len(positions))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетное выполнение query_desc")
+    parser.add_argument("path", nargs="?", help="JSON-массив query_desc; без пути — stdin")
+    args = parser.parse_args()
+
+    if args.path:
+        with open(args.path, "r", encoding="utf-8") as f:
+            descs = json.load(f)
+    else:
+        descs = json.load(sys.stdin)
+
+    json.dump(execute_batch(descs), sys.stdout, ensure_ascii=False)
+    print()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+postgres (по сырым таблицам и с агрегатами) против duckdb по Parquet
+на загруженной базе (только чтение).
+
+Запросы — по одному на query_type, периоды широкие: от первого до
+последнего дня данных, как у отчётов. Parquet должен быть выгружен из
+той же базы: `python parquet_export.py --full`.
+
+  PARQUET_DIR=data/parquet python benchmarks/bench_backends.py --runs 5
+"""
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+import backends
+from queries import execute_query
+from bench_batch import timed
+
+
+def workload() -> list[dict]:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MIN(created_at)::date, MAX(created_at)::date FROM video_snapshots;")
+            first, last = cur.fetchone()
+            cur.execute("SELECT creator_id FROM videos GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1;")
+            creator = cur.fetchone()[0]
+
+    mid = (first + (last - first) / 2).isoformat()
+    first, last = first.isoformat(), last.isoformat()
+    return [
+        {"query_type": "total_videos"},
+        {"query_type": "videos_with_min_views", "views_threshold": 1000},
+        {"query_type": "creator_videos_in_date_range", "creator_id": creator, "date_from": first, "date_to": last},
+        {"query_type": "sum_views_for_videos_in_date_range", "date_from": first, "date_to": last},
+        {"query_type": "videos_with_new_views_on_date", "date": mid},
+        {"query_type": "snapshots_with_negative_delta", "metric": "views", "date": None},
+        {"query_type": "snapshots_with_negative_delta", "metric": "likes", "date": mid},
+        {"query_type": "creator_views_delta_in_time_range", "creator_id": creator,
+         "date": mid, "time_from": "10:00", "time_to": "18:00"},
+        {"query_type": "metric_series", "metric": "views", "bucket": "day", "date_from": first, "date_to": last},
+        {"query_type": "top_series", "metric": "likes", "bucket": "week", "date_from": first, "date_to": last,
+         "group_by": "creator", "top_n": 5},
+        {"query_type": "top_n", "entity": "video", "period": "week", "metric": "views", "date": mid, "limit": 10},
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'query_type':<36} {'pg raw':>8} {'pg rollups':>11} {'duckdb':>8}  ms")
+    for desc in workload():
+        raw_s, raw = timed(lambda: execute_query(desc, use_rollups=False, backend="postgres"), args.runs)
+        rolled_s, _ = timed(lambda: execute_query(desc, use_rollups=True, backend="postgres"), args.runs)
+        duck_s, duck = timed(lambda: execute_query(desc, backend="duckdb"), args.runs)
+        print(f"{desc['query_type']:<36} {raw_s * 1000:>8.2f} {rolled_s * 1000:>11.2f} {duck_s * 1000:>8.2f}"
+              f"{'' if raw == duck else '  MISMATCH'}")
+
+    backends.close_backends()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
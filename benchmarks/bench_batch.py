@@ -0,0 +1,78 @@
+"""
+execute_batch против цикла по execute_query на загруженной базе (только чтение).
+
+Пакет как у дашборда: прирост просмотров по каждому креатору за каждый день,
+плюс видео с новыми просмотрами и отрицательные дельты по дням и видео
+креаторов по неделям. Ответы обоих способов сверяются.
+
+  python benchmarks/bench_batch.py --days 14 --runs 3
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+from datetime import timedelta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+from batch import execute_batch
+from queries import execute_query
+
+
+def dashboard(days: int) -> list[dict]:
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT creator_id FROM videos ORDER BY 1;")
+            creators = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT MIN(created_at) FROM video_snapshots;")
+            first = cur.fetchone()[0].date()
+
+    day_list = [(first + timedelta(days=i)).isoformat() for i in range(days)]
+    descs = [
+        {"query_type": "creator_views_delta_in_time_range", "creator_id": c,
+         "date": d, "time_from": "00:00", "time_to": "23:59:59"}
+        for c in creators for d in day_list
+    ]
+    for d in day_list:
+        descs.append({"query_type": "videos_with_new_views_on_date", "date": d})
+        for metric in ("views", "likes", "comments", "reports"):
+            descs.append({"query_type": "snapshots_with_negative_delta", "metric": metric, "date": d})
+    for c in creators:
+        for week in range(0, days, 7):
+            descs.append({"query_type": "creator_videos_in_date_range", "creator_id": c,
+                          "date_from": day_list[week], "date_to": day_list[min(week + 6, days - 1)]})
+    descs.append({"query_type": "total_videos"})
+    return descs
+
+
+def timed(fn, runs: int) -> tuple[float, list]:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    descs = dashboard(args.days)
+    loop_s, expected = timed(lambda: [execute_query(d) for d in descs], args.runs)
+    batch_s, got = timed(lambda: execute_batch(descs), args.runs)
+
+    mismatches = sum(1 for a, b in zip(expected, got) if a != b)
+    print(f"{len(descs)} query_desc, mismatches: {mismatches}")
+    print(f"loop execute_query: {loop_s * 1000:8.1f} ms  ({len(descs) / loop_s:.0f} q/s)")
+    print(f"execute_batch:      {batch_s * 1000:8.1f} ms  ({len(descs) / batch_s:.0f} q/s)  x{loop_s / batch_s:.1f}")
+
+    db.close_pool()
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Бенчмарк слоя БД бота: N одновременных пользователей шлют сообщения,
+каждое сообщение — один execute_query.
+
+Режимы:
+  connect — как было раньше: новое psycopg2-соединение на сообщение,
+            блокирующий вызов прямо в event loop;
+  pool    — db.run(execute_query, ...) через пул соединений.
+
+Пример:
+  DB_DSN="dbname=video_analytics" python benchmarks/bench_db_pool.py --users 50 --messages 20
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import psycopg2
+
+import db
+from queries import execute_query
+
+QUERY_DESCS = [
+    {"query_type": "total_videos"},
+    {"query_type": "videos_with_min_views", "views_threshold": 1000},
+    {"query_type": "snapshots_with_negative_delta", "metric": "views", "date": None},
+]
+
+
+class _DirectConnection:
+    """Старое поведение: новое соединение на каждый запрос."""
+
+    def __call__(self, statement_timeout_ms=None):
+        return self
+
+    def __enter__(self):
+        self.conn = psycopg2.connect(db.DB_DSN)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.commit()
+        self.conn.close()
+
+
+async def user_session(mode: str, messages: int, latencies: list[float]):
+    for i in range(messages):
+        desc = QUERY_DESCS[i % len(QUERY_DESCS)]
+        started = time.perf_counter()
+        if mode == "pool":
+            await db.run(execute_query, desc)
+        else:
+            execute_query(desc)
+            await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - started)
+
+
+async def run(mode: str, users: int, messages: int) -> dict:
+    latencies: list[float] = []
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(mode, messages, latencies) for _ in range(users)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "users": users,
+        "messages": len(latencies),
+        "msg_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=20, help="сообщений на пользователя")
+    parser.add_argument("--mode", choices=["connect", "pool", "both"], default="both")
+    args = parser.parse_args()
+
+    pooled_connection = db.connection
+    modes = ["connect", "pool"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        db.connection = _DirectConnection() if mode == "connect" else pooled_connection
+        res = asyncio.run(run(mode, args.users, args.messages))
+        print(
+            f"{res['mode']:>8}: users={res['users']} messages={res['messages']} "
+            f"{res['msg_per_sec']:.1f} msg/s, p50={res['p50_ms']:.1f} ms, p99={res['p99_ms']:.1f} ms"
+        )
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Сквозной бенчмарк: загрузка → запросы → обработчик сообщений бота, без сети.
+
+Этапы (--stages, по умолчанию все):
+  ingest   — generate_data.py во временный каталог, схема заново
+             (ВНИМАНИЕ: 001_init.sql на базе из DB_DSN — только отдельная база),
+             load_data по частям; videos/s и snapshots/s;
+  queries  — по --samples случайных query_desc на каждый query_type через
+             execute_query (USE_ROLLUPS и QUERY_BACKENDS из окружения);
+             распределение задержек;
+  handlers — --users пользователей по --messages сообщений одновременно
+             через bot.handle_any_text; модель — fake_openai.FakeOpenAI
+             с задержкой --llm-latency, Telegram — заглушка сообщения.
+             Вопросы частью разбираются правилами, частью «моделью»,
+             частью уходят в фолбэк SQL.
+
+Результат — JSON (--out), сравнение с прошлым прогоном — --compare:
+задержки (*_ms) и пропускная способность (*_per_sec), ухудшение больше
+--tolerance печатается как REGRESSION, код возврата 1.
+
+  DB_DSN="dbname=video_analytics_bench" python benchmarks/bench_e2e.py --videos 20000 --out e2e.json
+  DB_DSN="dbname=video_analytics_bench" python benchmarks/bench_e2e.py --stages queries,handlers --compare e2e.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import date, datetime, timedelta, timezone
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_openai import FakeOpenAI
+from generate_data import generate
+
+MONTHS = ["января", "февраля", "марта", "апреля", "мая", "июня", "июля",
+          "августа", "сентября", "октября", "ноября", "декабря"]
+METRIC_GENITIVE = {"views": "просмотров", "likes": "лайков", "comments": "комментариев", "reports": "жалоб"}
+
+
+def human(d: date) -> str:
+    return f"{d.day} {MONTHS[d.month - 1]} {d.year}"
+
+
+def percentiles(seconds: list[float]) -> dict:
+    if not seconds:
+        return {"n": 0}
+    ms = sorted(s * 1000 for s in seconds)
+
+    def at(q: float) -> float:
+        return round(ms[min(len(ms) - 1, int(q * len(ms)))], 3)
+
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "p50_ms": at(0.50),
+        "p90_ms": at(0.90),
+        "p99_ms": at(0.99),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------- ingest ----------
+
+def stage_ingest(args) -> dict:
+    import load_data
+    from check_result_cache import reset
+
+    reset()
+    if args.partitioned:
+        with load_data.connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute((ROOT / "migrations" / "005_partition_snapshots.sql").read_text())
+        conn.close()
+
+    out = Path(tempfile.mkdtemp(prefix="e2e-"))
+    started = time.perf_counter()
+    paths, videos, snapshots = generate(
+        out, args.videos, seed=args.seed, parts=args.parts, workers=args.workers,
+        creators=args.creators, skew=args.skew, days=args.days, negative_rate=args.negative_rate,
+    )
+    generated_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    load_data.load_data(paths, workers=args.workers, shard_by="file")
+    load_s = time.perf_counter() - started
+
+    return {
+        "videos": videos,
+        "snapshots": snapshots,
+        "generate_s": round(generated_s, 3),
+        "load_s": round(load_s, 3),
+        "videos_per_sec": round(videos / load_s, 1),
+        "snapshots_per_sec": round(snapshots / load_s, 1),
+    }
+
+
+# ---------- queries ----------
+
+def data_context() -> dict:
+    import db
+
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT creator_id FROM videos GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 50;")
+            creators = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT MIN(created_at)::date, MAX(created_at)::date FROM video_snapshots;")
+            first, last = cur.fetchone()
+            cur.execute(
+                "SELECT percentile_disc(ARRAY[0.5, 0.9, 0.99]) WITHIN GROUP (ORDER BY views_count) FROM videos;"
+            )
+            thresholds = cur.fetchone()[0]
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    return {"creators": creators, "days": days, "thresholds": thresholds}
+
+
+def random_desc(qt: str, rng: random.Random, ctx: dict) -> dict:
+    day = rng.choice(ctx["days"])
+    d1, d2 = sorted(rng.sample(ctx["days"], 2)) if len(ctx["days"]) > 1 else (day, day)
+    creator = rng.choice(ctx["creators"])
+    metric = rng.choice(list(METRIC_GENITIVE))
+    hour = rng.randrange(20)
+    return {
+        "total_videos": {},
+        "creator_videos_with_min_views": {"creator_id": creator, "views_threshold": rng.choice(ctx["thresholds"])},
+        "creator_videos_in_date_range": {"creator_id": creator, "date_from": d1.isoformat(), "date_to": d2.isoformat()},
+        "videos_with_min_views": {"views_threshold": rng.choice(ctx["thresholds"])},
+        "videos_with_new_views_on_date": {"date": day.isoformat()},
+        "sum_views_for_videos_in_date_range": {"date_from": d1.isoformat(), "date_to": d2.isoformat()},
+        "snapshots_with_negative_delta": {"metric": metric, "date": rng.choice([None, day.isoformat()])},
+        "creator_views_delta_in_time_range": {"creator_id": creator, "date": day.isoformat(),
+                                              "time_from": f"{hour:02d}:00", "time_to": f"{hour + 4:02d}:00"},
+        "metric_series": {"metric": metric, "bucket": rng.choice(["hour", "day"]), "date_from": d1.isoformat(),
+                          "date_to": min(d2, d1 + timedelta(days=6)).isoformat(),
+                          "creator_id": rng.choice([None, creator])},
+        "top_series": {"metric": metric, "bucket": "day", "date_from": d1.isoformat(), "date_to": d2.isoformat(),
+                       "group_by": rng.choice(["creator", "video"]), "top_n": 5},
+        "top_n": {"entity": rng.choice(["creator", "video"]), "period": rng.choice(["hour", "day", "week"]),
+                  "metric": metric, "date": day.isoformat(), "hour": f"{hour:02d}:00", "limit": 10},
+    }[qt] | {"query_type": qt}
+
+
+QUERY_TYPES = [
+    "total_videos", "creator_videos_with_min_views", "creator_videos_in_date_range", "videos_with_min_views",
+    "videos_with_new_views_on_date", "sum_views_for_videos_in_date_range", "snapshots_with_negative_delta",
+    "creator_views_delta_in_time_range", "metric_series", "top_series", "top_n",
+]
+
+
+def stage_queries(args) -> dict:
+    import db
+    from queries import execute_query
+
+    rng = random.Random(args.seed)
+    ctx = data_context()
+    result = {}
+    for qt in QUERY_TYPES:
+        latencies = []
+        for _ in range(args.samples):
+            desc = random_desc(qt, rng, ctx)
+            started = time.perf_counter()
+            execute_query(desc)
+            latencies.append(time.perf_counter() - started)
+        result[qt] = percentiles(latencies)
+    db.close_pool()
+    return result
+
+
+# ---------- handlers ----------
+
+def messages(rng: random.Random, ctx: dict, n: int) -> tuple[list[str], dict[str, dict]]:
+    """
+    n вопросов и разметка для фейковой модели: текст → query_desc.
+    """
+    llm = {}
+    result = []
+    for _ in range(n):
+        day = rng.choice(ctx["days"])
+        d1, d2 = sorted(rng.sample(ctx["days"], 2)) if len(ctx["days"]) > 1 else (day, day)
+        creator = rng.choice(ctx["creators"])
+        metric = rng.choice(list(METRIC_GENITIVE))
+        threshold = rng.choice(ctx["thresholds"])
+        kind = rng.randrange(10)
+        # 0–5 — правила, 6–8 — модель, 9 — фолбэк SQL
+        if kind == 0:
+            text = "Сколько всего видео есть в системе?"
+        elif kind == 1:
+            text = f"Сколько видео у креатора с id {creator} вышло с {human(d1)} по {human(d2)} включительно?"
+        elif kind == 2:
+            text = f"Сколько видео набрало больше {threshold} просмотров за всё время?"
+        elif kind == 3:
+            text = f"Сколько замеров статистики с отрицательным приростом {METRIC_GENITIVE[metric]} за {day:%d.%m.%Y}?"
+        elif kind == 4:
+            text = f"На сколько в сумме выросли просмотры всех видео автора {creator} с 10:00 до 18:00 {human(day)}?"
+        elif kind == 5:
+            text = f"Топ 10 видео по приросту {METRIC_GENITIVE[metric]} за неделю {human(day)}"
+        elif kind == 6:
+            text = f"Покажи, сколько роликов выложил автор {creator} между {d1:%d.%m} и {d2:%d.%m.%Y}"
+            llm[text] = {"query_type": "creator_videos_in_date_range", "creator_id": creator,
+                         "date_from": d1.isoformat(), "date_to": d2.isoformat()}
+        elif kind == 7:
+            text = f"У скольких роликов прибавились просмотры {human(day)}?"
+            llm[text] = {"query_type": "videos_with_new_views_on_date", "date": day.isoformat()}
+        elif kind == 8:
+            text = f"Какая суммарная аудитория у роликов, выложенных с {human(d1)} по {human(d2)}?"
+            llm[text] = {"query_type": "sum_views_for_videos_in_date_range",
+                         "date_from": d1.isoformat(), "date_to": d2.isoformat()}
+        else:
+            text = rng.choice(["Сколько всего разных креаторов?", "Сколько креаторов выпустили хотя бы одно видео?"])
+        result.append(text)
+    return result, llm
+
+
+class StubMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.replies: list[str] = []
+
+    async def answer(self, text: str, **kwargs):
+        self.replies.append(text)
+
+
+async def run_handlers(args, ctx: dict) -> dict:
+    rng = random.Random(args.seed)
+    texts, llm = messages(rng, ctx, args.users * args.messages)
+
+    def respond(system_prompt: str, user_text: str) -> str:
+        if "JSON" in system_prompt:
+            return json.dumps(llm.get(user_text.strip(), {"query_type": "unknown"}), ensure_ascii=False)
+        return "SELECT COUNT(DISTINCT creator_id) FROM videos;"
+
+    server = FakeOpenAI(latency=args.llm_latency, respond=respond)
+    await server.start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "e2e"
+    os.environ["BOT_TOKEN"] = "123456:" + "A" * 35
+    os.environ["NLP_CACHE_PATH"] = ""
+    os.environ["RESULT_CACHE_PATH"] = ""
+    import bot
+    import db
+    import nlp
+
+    latencies = []
+    errors = 0
+
+    async def user(batch: list[str]):
+        nonlocal errors
+        for text in batch:
+            message = StubMessage(text)
+            started = time.perf_counter()
+            await bot.handle_any_text(message)
+            latencies.append(time.perf_counter() - started)
+            if not message.replies or message.replies[0].startswith(("Ошибка", "Сервер сейчас", "Не смог")):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(texts[i::args.users]) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    await server.stop()
+
+    result = {
+        "users": args.users,
+        "messages": len(texts),
+        "llm_latency_s": args.llm_latency,
+        "messages_per_sec": round(len(texts) / elapsed, 1),
+        "latency": percentiles(latencies),
+        "errors": errors,
+        "routes": dict(nlp.route_stats),
+        "llm_requests": server.requests,
+        "result_cache": bot.results.stats(),
+    }
+    db.close_pool()
+    return result
+
+
+def stage_handlers(args) -> dict:
+    ctx = data_context()
+    import db
+    db.close_pool()
+    return asyncio.run(run_handlers(args, ctx))
+
+
+# ---------- compare ----------
+
+def flatten(d: dict, prefix: str = "") -> dict:
+    result = {}
+    for key, value in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            result |= flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            result[name] = value
+    return result
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> int:
+    now, before = flatten(current), flatten(baseline)
+    regressions = 0
+    for name in sorted(now.keys() & before.keys()):
+        old, new = before[name], now[name]
+        if name.endswith("_ms"):
+            # доли миллисекунды — шум, а не регрессия
+            worse = new > old * (1 + tolerance) and new - old > 0.5
+            better = new < old * (1 - tolerance)
+        elif name.endswith("_per_sec"):
+            worse = new < old * (1 - tolerance)
+            better = new > old * (1 + tolerance)
+        else:
+            continue
+        change = (new - old) / old if old else 0.0
+        if worse:
+            regressions += 1
+            print(f"REGRESSION {name}: {old} → {new} ({change:+.0%})")
+        elif better:
+            print(f"improved   {name}: {old} → {new} ({change:+.0%})")
+    print(f"сравнение с базовым прогоном: {regressions} ухудшений (допуск {tolerance:.0%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк бота без сети")
+    parser.add_argument("--stages", default="ingest,queries,handlers")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--creators", type=int, default=500)
+    parser.add_argument("--skew", type=float, default=1.1)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--negative-rate", type=float, default=0.03)
+    parser.add_argument("--parts", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--partitioned", action="store_true", help="секционировать video_snapshots перед загрузкой")
+    parser.add_argument("--samples", type=int, default=50, help="запросов на query_type")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=10, help="сообщений на пользователя")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--out", type=Path)
+    parser.add_argument("--compare", type=Path, help="JSON прошлого прогона")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    stages = args.stages.split(",")
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "env": {k: os.getenv(k) for k in ("DB_TIMEZONE", "USE_ROLLUPS", "QUERY_BACKENDS", "DB_POOL_MAX")},
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+    }
+    if "ingest" in stages:
+        report["ingest"] = stage_ingest(args)
+        print(f"[E2E] ingest: {report['ingest']}")
+    if "queries" in stages:
+        report["queries"] = stage_queries(args)
+        for qt, stats in report["queries"].items():
+            print(f"[E2E] {qt:<36} p50 {stats['p50_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms")
+    if "handlers" in stages:
+        report["handlers"] = stage_handlers(args)
+        h = report["handlers"]
+        print(f"[E2E] handlers: {h['messages_per_sec']} msg/s, p50 {h['latency']['p50_ms']} ms, "
+              f"p99 {h['latency']['p99_ms']} ms, errors {h['errors']}, routes {h['routes']}")
+
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str) + "\n", encoding="utf-8")
+        print(f"[E2E] результат: {args.out}")
+    if args.compare:
+        return 1 if compare(report, json.loads(args.compare.read_text(encoding="utf-8")), args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
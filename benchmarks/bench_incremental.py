@@ -0,0 +1,188 @@
+"""
+Часовое обновление через load_data --incremental против перезагрузки всего дампа.
+
+ВНИМАНИЕ: как bench_e2e, заново накатывает схему на базе из DB_DSN —
+только отдельная база.
+
+Данные — generate_data.make_video с историей, обрезанной в момент T:
+  база  — снапшоты до T, счётчики videos на T; грузится обычным load_data;
+  час k — снапшоты из (T + k - 1 ч, T + k ч] и новые счётчики видео,
+          в доле --corrupt снапшотов delta_* испорчены (нули).
+
+Для каждого часа: время инкрементальной загрузки и затронутые строки,
+повторный запуск того же файла (должен ничего не менять). Для сравнения —
+повторный прогон базового дампа обычным load_data. В конце проверки:
+delta_* равны разнице с предыдущим снапшотом, счётчики videos — последнему
+снапшоту, исправлено ровно столько delta, сколько испорчено,
+агрегаты сходятся с сырыми таблицами (rollups.check). Код возврата 1 при ошибке.
+
+  DB_DSN="dbname=video_analytics_bench" python benchmarks/bench_incremental.py --videos 200000 --hours 3
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from generate_data import creator_ids, creator_weights, make_video
+
+COUNTERS = ("views_count", "likes_count", "comments_count", "reports_count")
+
+
+def cut(video: dict, lo: datetime | None, hi: datetime) -> dict | None:
+    """
+    Видео со снапшотами из (lo, hi] и счётчиками на hi; None — нечего отдавать.
+    """
+    rows = [
+        s for s in video["snapshots"]
+        if (lo is None or datetime.fromisoformat(s["created_at"]) > lo)
+        and datetime.fromisoformat(s["created_at"]) <= hi
+    ]
+    if not rows:
+        return None
+    last = rows[-1]
+    return video | {c: last[c] for c in COUNTERS} | {"updated_at": last["created_at"], "snapshots": rows}
+
+
+def write_files(out: Path, args) -> tuple[list[Path], int, int]:
+    """
+    База и часовые файлы JSONL. Возвращает (файлы, снапшотов в базе, испорчено delta).
+    """
+    creators = creator_ids(args.seed, 500)
+    cum = creator_weights(500, 1.1)
+    start = datetime(2025, 11, 1, tzinfo=timezone.utc)
+    t0 = start + timedelta(days=args.days) - timedelta(hours=args.hours)
+    bounds = [None, t0] + [t0 + timedelta(hours=k) for k in range(1, args.hours + 1)]
+
+    rng = random.Random(args.seed)
+    files = [(out / f"{k:02d}.jsonl").open("w", encoding="utf-8") for k in range(args.hours + 1)]
+    base_snapshots = corrupted = 0
+    for i in range(args.videos):
+        video = make_video(i, args.seed, creators, cum, start, days=args.days, snapshots=args.snapshots)
+        for k, f in enumerate(files):
+            part = cut(video, bounds[k], bounds[k + 1])
+            if part is None:
+                continue
+            if k == 0:
+                base_snapshots += len(part["snapshots"])
+            else:
+                for s in part["snapshots"]:
+                    if rng.random() < args.corrupt and any(s[f"delta_{c}"] for c in COUNTERS):
+                        s.update({f"delta_{c}": 0 for c in COUNTERS})
+                        corrupted += 1
+            f.write(json.dumps(part) + "\n")
+    for f in files:
+        f.close()
+    return [Path(f.name) for f in files], base_snapshots, corrupted
+
+
+def consistency(cur) -> dict:
+    cur.execute(
+        f"""
+        SELECT COUNT(*) FROM (
+            SELECT {', '.join(f"delta_{c} <> {c} - COALESCE(LAG({c}) OVER w, 0) AS bad_{c}" for c in COUNTERS)}
+            FROM video_snapshots
+            WINDOW w AS (PARTITION BY video_id ORDER BY created_at)
+        ) t
+        WHERE {' OR '.join(f"bad_{c}" for c in COUNTERS)};
+        """
+    )
+    bad_deltas = cur.fetchone()[0]
+    cur.execute(
+        f"""
+        SELECT COUNT(*)
+        FROM videos v
+        JOIN LATERAL (
+            SELECT * FROM video_snapshots s WHERE s.video_id = v.id ORDER BY created_at DESC LIMIT 1
+        ) last ON TRUE
+        WHERE ({', '.join('v.' + c for c in COUNTERS)}) IS DISTINCT FROM ({', '.join('last.' + c for c in COUNTERS)});
+        """
+    )
+    return {"bad_deltas": bad_deltas, "stale_videos": cur.fetchone()[0]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=3, help="длина периода; часы обновлений — в его конце")
+    parser.add_argument("--snapshots", type=int, default=72, help="средняя длина истории видео в часах")
+    parser.add_argument("--hours", type=int, default=3, help="сколько часовых обновлений загрузить")
+    parser.add_argument("--corrupt", type=float, default=0.01, help="доля снапшотов с испорченными delta_*")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="JSON с результатами")
+    args = parser.parse_args()
+
+    import load_data
+    import rollups
+    from check_result_cache import reset
+
+    out = Path(tempfile.mkdtemp(prefix="incremental-"))
+    started = time.perf_counter()
+    (base, *hours), base_snapshots, corrupted = write_files(out, args)
+    print(f"данные: {time.perf_counter() - started:.1f} с, снапшотов в базе {base_snapshots}, испорчено delta {corrupted}")
+
+    reset()
+    started = time.perf_counter()
+    load_data.load_data(base)
+    result = {"base_load_s": round(time.perf_counter() - started, 3), "base_snapshots": base_snapshots, "hours": []}
+
+    started = time.perf_counter()
+    load_data.load_data(base)
+    result["full_reload_s"] = round(time.perf_counter() - started, 3)
+
+    fixed = 0
+    failures = []
+    for path in hours:
+        started = time.perf_counter()
+        summary = load_data.load_data(path, incremental=True, feed="bench")
+        elapsed = time.perf_counter() - started
+        fixed += summary["deltas_mismatched"]
+
+        started = time.perf_counter()
+        again = load_data.load_data(path, incremental=True, feed="bench")
+        rerun = time.perf_counter() - started
+        touched = again["videos_inserted"] + again["videos_updated"] + again["snapshots_inserted"]
+        if touched:
+            failures.append(f"{path.name}: повторный запуск затронул {touched} строк")
+
+        result["hours"].append({
+            "file": path.name,
+            "incremental_s": round(elapsed, 3),
+            "rerun_s": round(rerun, 3),
+            "videos_touched": summary["videos_inserted"] + summary["videos_updated"],
+            "snapshots_inserted": summary["snapshots_inserted"],
+            "deltas_fixed": summary["deltas_mismatched"],
+        })
+
+    with load_data.connect() as conn:
+        with conn.cursor() as cur:
+            result["consistency"] = consistency(cur)
+    conn.close()
+    if any(result["consistency"].values()):
+        failures.append(f"несогласованные данные: {result['consistency']}")
+    if fixed != corrupted:
+        failures.append(f"исправлено delta {fixed}, испорчено {corrupted}")
+    if rollups.check(days=args.days):
+        failures.append("агрегаты расходятся с сырыми таблицами")
+
+    print(f"база: {result['base_load_s']} с, повторный прогон дампа: {result['full_reload_s']} с")
+    for h in result["hours"]:
+        print(
+            f"{h['file']}: {h['incremental_s']} с (повтор {h['rerun_s']} с), videos {h['videos_touched']}, "
+            f"snapshots +{h['snapshots_inserted']}, delta исправлено {h['deltas_fixed']}"
+        )
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if args.out:
+        args.out.write_text(json.dumps(result | {"failures": failures}, ensure_ascii=False, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+top_n по лидербордам (migrations/007_leaderboards.sql) против агрегации
+по video_snapshots на загруженной базе (только чтение).
+
+Для каждой пары (креаторы | видео, час | день | неделя) и метрики — время
+лучшего из --runs прогонов обоими способами и сверка ответов.
+Агрегаты должны быть актуальны: `python rollups.py rebuild`.
+
+  python benchmarks/bench_leaderboards.py --date 2025-11-05 --hour 14:00 --limit 10
+"""
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+from queries import execute_query
+from rollups import LEADERBOARDS, METRICS
+from bench_batch import timed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--date", default="2025-11-05")
+    parser.add_argument("--hour", default="14:00")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    mismatches = 0
+    print(f"{'entity':<8} {'period':<6} {'metric':<9} {'raw ms':>8} {'board ms':>9} {'x':>6}")
+    for entity, period in LEADERBOARDS:
+        for metric in METRICS:
+            desc = {"query_type": "top_n", "entity": entity, "period": period, "metric": metric,
+                    "date": args.date, "hour": args.hour, "limit": args.limit}
+            raw_s, raw = timed(lambda: execute_query(desc, use_rollups=False), args.runs)
+            board_s, board = timed(lambda: execute_query(desc, use_rollups=True), args.runs)
+            mismatches += raw != board
+            print(f"{entity:<8} {period:<6} {metric:<9} {raw_s * 1000:>8.2f} {board_s * 1000:>9.2f} "
+                  f"{raw_s / board_s:>6.1f}{'' if raw == board else '  MISMATCH'}")
+
+    print(f"\nрасхождений: {mismatches}")
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
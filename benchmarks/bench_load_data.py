@@ -0,0 +1,80 @@
+"""
+Сравнение загрузчиков load_data.py: executemany (старый) и потоковый COPY.
+
+Каждый способ запускается в отдельном процессе на пустых таблицах,
+печатается время, rows/s и пиковая память процесса.
+
+ВНИМАНИЕ: скрипт делает TRUNCATE videos, video_snapshots.
+
+Пример:
+  DB_DSN="dbname=video_analytics_bench" python benchmarks/bench_load_data.py data/videos.json
+"""
+import sys
+import time
+import resource
+import argparse
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import psycopg2
+
+import load_data
+
+
+def truncate():
+    with psycopg2.connect(load_data.DB_DSN) as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE videos, video_snapshots;")
+    conn.close()
+
+
+def count_rows() -> int:
+    with psycopg2.connect(load_data.DB_DSN) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT (SELECT COUNT(*) FROM videos) + (SELECT COUNT(*) FROM video_snapshots);")
+            rows = cur.fetchone()[0]
+    conn.close()
+    return rows
+
+
+def _child(method: str, path: Path, batch_size: int, out):
+    started = time.perf_counter()
+    if method == "executemany":
+        load_data.load_data_executemany(path)
+    else:
+        load_data.load_data(path, batch_size)
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    out.send((elapsed, peak_mb))
+
+
+def run(method: str, path: Path, batch_size: int) -> tuple[float, float]:
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_child, args=(method, path, batch_size, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=Path, nargs="?", default=load_data.JSON_PATH)
+    parser.add_argument("--batch-size", type=int, default=load_data.BATCH_SIZE)
+    parser.add_argument("--methods", default="executemany,copy")
+    args = parser.parse_args()
+
+    for method in args.methods.split(","):
+        truncate()
+        elapsed, peak_mb = run(method, args.path, args.batch_size)
+        rows = count_rows()
+        print(
+            f"{method:>12}: {rows} rows in {elapsed:.2f} s, "
+            f"{rows / elapsed:.0f} rows/s, peak RSS {peak_mb:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Несколько вопросов в одном сообщении (multi) против тех же вопросов по одному.
+
+Составные вопросы — по --size случайных скалярных query_desc (bench_e2e.random_desc)
+на данных из DB_DSN, текст — вопросы, которые разбирают правила, через "? ".
+Как в живых составных вопросах, подвопросы одного сообщения — про одного
+креатора и пару дат (одну или обе), так что часть из них делит область чтения.
+Режимы, задержка на составной вопрос:
+  separate  — execute_query на каждый подзапрос по очереди (как отдельные сообщения);
+  parallel  — execute_query на каждый, все сразу через db.run;
+  fused     — группы queries.plan_multi: группа — один запрос с FILTER,
+              группы параллельно через db.run (как делает бот);
+  handlers  — bot.handle_any_text: подвопросы отдельными сообщениями по очереди
+              против одного составного сообщения; кэши разбора и результатов
+              очищаются перед каждым вариантом. С --llm-latency правила
+              выключены и всё разбирает fake_openai.FakeOpenAI с такой
+              задержкой — видно, сколько вызовов модели стоит каждый вариант.
+--users составных вопросов выполняются одновременно. Проверки: правила разбирают
+составной текст в те же query_desc, ответы всех режимов совпадают.
+Код возврата 1 при расхождении. База только читается.
+
+  python benchmarks/bench_multi.py --questions 50 --size 4
+  USE_ROLLUPS=1 python benchmarks/bench_multi.py --users 8
+  python benchmarks/bench_multi.py --questions 20 --llm-latency 0.3
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import date
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_e2e import METRIC_GENITIVE, StubMessage, data_context, human, percentiles, random_desc
+
+SCALAR_TYPES = [
+    "total_videos", "creator_videos_with_min_views", "creator_videos_in_date_range", "videos_with_min_views",
+    "videos_with_new_views_on_date", "sum_views_for_videos_in_date_range", "snapshots_with_negative_delta",
+    "creator_views_delta_in_time_range",
+]
+
+
+def question(d: dict) -> str:
+    """
+    Текст вопроса, который правила nlp разбирают ровно в d.
+    """
+    def day(key: str) -> str:
+        return human(date.fromisoformat(d[key]))
+
+    qt = d["query_type"]
+    if qt == "total_videos":
+        return "Сколько всего видео есть в системе"
+    if qt == "creator_videos_with_min_views":
+        return f"Сколько видео у креатора с id {d['creator_id']} набрали больше {d['views_threshold']} просмотров за всё время"
+    if qt == "creator_videos_in_date_range":
+        return (f"Сколько видео у креатора с id {d['creator_id']} вышло с {day('date_from')} "
+                f"по {day('date_to')} включительно")
+    if qt == "videos_with_min_views":
+        return f"Сколько видео набрало больше {d['views_threshold']} просмотров за всё время"
+    if qt == "videos_with_new_views_on_date":
+        return f"Сколько разных видео получали новые просмотры {day('date')}"
+    if qt == "sum_views_for_videos_in_date_range":
+        return f"Сколько просмотров в сумме набрали видео, опубликованные с {day('date_from')} по {day('date_to')} включительно"
+    if qt == "snapshots_with_negative_delta":
+        when = f" за {day('date')}" if d["date"] else ""
+        return f"Сколько замеров статистики с отрицательным приростом {METRIC_GENITIVE[d['metric']]}{when}"
+    return (f"На сколько в сумме выросли просмотры всех видео автора {d['creator_id']} "
+            f"с {d['time_from']} до {d['time_to']} {day('date')}")
+
+
+def compounds(rng: random.Random, ctx: dict, n: int, size: int) -> list[tuple[str, list[dict]]]:
+    result = []
+    for _ in range(n):
+        d1, d2 = sorted(rng.sample(ctx["days"], 2))
+        topic = ctx | {"creators": [rng.choice(ctx["creators"])], "days": [d1, d2]}
+        descs = [random_desc(qt, rng, topic) for qt in rng.sample(SCALAR_TYPES, size)]
+        result.append(("? ".join(question(d) for d in descs) + "?", descs))
+    return result
+
+
+async def run_mode(mode: str, items: list, users: int) -> tuple[list[float], list]:
+    """
+    (задержки, ответы) по составным вопросам; users потоков по очереди своих вопросов.
+    """
+    import db
+    import bot
+    import nlp
+    from queries import execute_group, execute_query, plan_multi
+
+    latencies = [0.0] * len(items)
+    answers = [None] * len(items)
+
+    async def one(i: int):
+        text, descs = items[i]
+        started = time.perf_counter()
+        if mode == "separate":
+            answers[i] = [await db.run(execute_query, d) for d in descs]
+        elif mode == "parallel":
+            answers[i] = list(await asyncio.gather(*(db.run(execute_query, d) for d in descs)))
+        elif mode == "fused":
+            groups = plan_multi(descs)
+            values = await asyncio.gather(*(db.run(execute_group, [descs[j] for j in g]) for g in groups))
+            answers[i] = [None] * len(descs)
+            for group, group_values in zip(groups, values):
+                for j, value in zip(group, group_values):
+                    answers[i][j] = value
+        elif mode == "handlers_separate":
+            replies = []
+            for part in text.rstrip("?").split("? "):
+                message = StubMessage(part + "?")
+                await bot.handle_any_text(message)
+                replies += message.replies
+            answers[i] = replies
+        else:
+            message = StubMessage(text)
+            await bot.handle_any_text(message)
+            answers[i] = message.replies
+        latencies[i] = time.perf_counter() - started
+
+    async def user(u: int):
+        for i in range(u, len(items), users):
+            await one(i)
+
+    bot.results.clear()
+    nlp.query_cache.clear()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    return latencies, answers
+
+
+async def run(args) -> dict:
+    import db
+    import nlp
+    from queries import USE_ROLLUPS, plan_multi
+
+    rng = random.Random(args.seed)
+    items = compounds(rng, data_context(), args.questions, args.size)
+    failures = []
+    for text, descs in items:
+        parsed = nlp._parse_rules(text)
+        if parsed != {"query_type": "multi", "queries": descs}:
+            failures.append(f"правила разобрали иначе: {text[:80]}…")
+            break
+
+    server = None
+    if args.llm_latency is not None:
+        from fake_openai import FakeOpenAI
+
+        llm = {}
+        for text, descs in items:
+            llm[text] = {"query_type": "multi", "queries": descs}
+            for part, d in zip(text.rstrip("?").split("? "), descs):
+                llm[part + "?"] = d
+
+        def respond(system_prompt: str, user_text: str) -> str:
+            return json.dumps(llm.get(user_text.strip(), {"query_type": "unknown"}), ensure_ascii=False)
+
+        server = FakeOpenAI(latency=args.llm_latency, respond=respond)
+        await server.start()
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "multi")
+        # правила никогда не уверены: весь разбор — кэш или модель
+        nlp.RULES_MIN_CONFIDENCE = 2.0
+
+    statements = sum(len(plan_multi(descs)) for _, descs in items)
+    result = {
+        "questions": args.questions,
+        "size": args.size,
+        "users": args.users,
+        "use_rollups": USE_ROLLUPS,
+        "statements_separate": args.questions * args.size,
+        "statements_fused": statements,
+    }
+    answers = {}
+    for mode in ("separate", "parallel", "fused", "handlers_separate", "handlers_multi"):
+        # первый проход — прогрев соединений и кэшей планов
+        await run_mode(mode, items[: args.users], args.users)
+        calls = nlp.query_cache.stats()["llm_calls"]
+        started = time.perf_counter()
+        latencies, answers[mode] = await run_mode(mode, items, args.users)
+        result[mode] = percentiles(latencies) | {
+            "total_s": round(time.perf_counter() - started, 3),
+            "llm_calls": nlp.query_cache.stats()["llm_calls"] - calls,
+        }
+
+    plain = {mode: [[int(v) for v in a] for a in answers[mode]] for mode in ("separate", "parallel", "fused")}
+    if not plain["separate"] == plain["parallel"] == plain["fused"]:
+        failures.append("ответы separate / parallel / fused различаются")
+    for i, replies in enumerate(answers["handlers_multi"]):
+        text = "\n".join(replies)
+        if not all(f"— {int(v)}" in text for v in plain["separate"][i]):
+            failures.append(f"ответ на составной вопрос {i} не совпал с ответами по одному")
+            break
+    if server is not None:
+        await server.stop()
+    db.close_pool()
+    return result | {"failures": failures}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=50, help="сколько составных вопросов")
+    parser.add_argument("--size", type=int, default=4, help=f"подвопросов в каждом, до {len(SCALAR_TYPES)}")
+    parser.add_argument("--users", type=int, default=1, help="сколько составных вопросов выполнять одновременно")
+    parser.add_argument("--llm-latency", type=float, help="разбирать всё фейковой моделью с такой задержкой, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="JSON с результатами")
+    args = parser.parse_args()
+    if not 2 <= args.size <= len(SCALAR_TYPES):
+        parser.error(f"--size от 2 до {len(SCALAR_TYPES)}")
+
+    os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+    os.environ["NLP_CACHE_PATH"] = ""
+    os.environ["RESULT_CACHE_PATH"] = ""
+    result = asyncio.run(run(args))
+
+    print(
+        f"{args.questions} вопросов по {args.size}, users {args.users}, rollups {result['use_rollups']}; "
+        f"запросов к базе: по одному {result['statements_separate']}, multi {result['statements_fused']}"
+    )
+    for mode in ("separate", "parallel", "fused", "handlers_separate", "handlers_multi"):
+        r = result[mode]
+        line = f"{mode:18} p50 {r['p50_ms']:8.2f} мс  p90 {r['p90_ms']:8.2f} мс  всего {r['total_s']} с"
+        if mode.startswith("handlers") and args.llm_latency is not None:
+            line += f", вызовов модели {r['llm_calls']}"
+        print(line)
+    for failure in result["failures"]:
+        print(f"FAIL {failure}")
+    if args.out:
+        args.out.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
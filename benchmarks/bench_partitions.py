@@ -0,0 +1,114 @@
+"""
+Обычная video_snapshots против секционированной (005_partition_snapshots.sql).
+
+Две схемы с одинаковыми данными из check_explain.generate (снапшоты
+за ~2,5 месяца); во второй таблица переведена на помесячные секции.
+Для запросов по video_snapshots из check_explain.HOT_QUERIES печатается,
+сколько секций осталось в плане, и медиана времени EXPLAIN ANALYZE.
+В конце — удаление старейшего месяца: DELETE против DETACH + DROP.
+
+  python benchmarks/bench_partitions.py --videos 50000 --runs 5
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import psycopg2
+
+import db
+import partitions
+from queries import build_query
+from check_explain import HOT_QUERIES, generate, plan_nodes
+
+PLAIN = "bench_plain"
+PARTITIONED = "bench_partitioned"
+
+
+def connect(schema: str):
+    conn = psycopg2.connect(db.DB_DSN, options=f"-c TimeZone={db.DB_TIMEZONE} -c search_path={schema}")
+    conn.autocommit = True
+    return conn
+
+
+def prepare(schema: str, videos: int, partitioned: bool):
+    conn = connect(schema)
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {schema};")
+    generate(cur, videos)
+    if partitioned:
+        cur.execute((ROOT / "migrations" / "005_partition_snapshots.sql").read_text())
+    cur.execute("VACUUM ANALYZE videos;")
+    cur.execute("VACUUM ANALYZE video_snapshots;")
+    return conn
+
+
+def measure(cur, sql: str, params, runs: int) -> tuple[float, int]:
+    timings = []
+    relations = set()
+    for _ in range(runs):
+        cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+        result = cur.fetchone()[0][0]
+        timings.append(result["Execution Time"])
+        relations = {
+            n["Relation Name"] for n in plan_nodes(result["Plan"])
+            if n.get("Relation Name", "").startswith("video_snapshots")
+        }
+    return statistics.median(timings), len(relations)
+
+
+def retention(cur, partitioned: bool) -> float:
+    """
+    Удалить октябрь 2025 (самый старый месяц в generate), секунды.
+    """
+    started = time.perf_counter()
+    if partitioned:
+        name, _, _ = partitions.existing_partitions(cur)[0]
+        cur.execute(f"ALTER TABLE video_snapshots DETACH PARTITION {name};")
+        cur.execute(f"DROP TABLE {name};")
+    else:
+        cur.execute("DELETE FROM video_snapshots WHERE created_at < timestamptz '2025-11-01 00:00+00';")
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"generating {args.videos} videos x 24 snapshots in two schemas ...")
+    plain = prepare(PLAIN, args.videos, partitioned=False)
+    parted = prepare(PARTITIONED, args.videos, partitioned=True)
+    plain_cur, parted_cur = plain.cursor(), parted.cursor()
+
+    parted_cur.execute("SELECT COUNT(*) FROM pg_inherits WHERE inhparent = 'video_snapshots'::regclass;")
+    total = parted_cur.fetchone()[0]
+
+    print(f"\n{'query':<44} {'plain ms':>9} {'parted ms':>10} {'partitions':>11}")
+    for desc in HOT_QUERIES:
+        sql, params = build_query(desc, use_rollups=False)
+        if "video_snapshots" not in sql:
+            continue
+        plain_ms, _ = measure(plain_cur, sql, params, args.runs)
+        parted_ms, scanned = measure(parted_cur, sql, params, args.runs)
+        label = desc["query_type"] + (f" {desc['date']}" if desc.get("date") else "")
+        print(f"{label:<44} {plain_ms:>9.2f} {parted_ms:>10.2f} {f'{scanned}/{total}':>11}")
+
+    print(
+        f"\ndrop oldest month: DELETE {retention(plain_cur, False):.3f}s, "
+        f"DETACH + DROP {retention(parted_cur, True):.3f}s"
+    )
+
+    for conn, schema in ((plain, PLAIN), (parted, PARTITIONED)):
+        conn.cursor().execute(f"DROP SCHEMA {schema} CASCADE;")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
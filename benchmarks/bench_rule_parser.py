@@ -0,0 +1,90 @@
+"""
+Покрытие и скорость локального разбора nlp.rule_parse на размеченном наборе.
+
+Для каждого вопроса известен правильный query_desc (None — правила должны
+промолчать и отдать вопрос модели). Печатается доля вопросов, закрытых
+правилами, число ошибочных ответов и задержка на вопрос.
+
+  python benchmarks/bench_rule_parser.py
+"""
+import os
+import sys
+import time
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+import nlp
+from replay_query_cache import CORPUS
+
+LABELED = CORPUS + [
+    (
+        "Какое суммарное количество просмотров набрали все видео, опубликованные с 1 ноября 2025 по 30 ноября 2025?",
+        {"query_type": "sum_views_for_videos_in_date_range", "date_from": "2025-11-01", "date_to": "2025-11-30"},
+    ),
+    (
+        "Сколько всего просмотров собрали видео, вышедшие с 1 по 7 декабря 2025 включительно?",
+        {"query_type": "sum_views_for_videos_in_date_range", "date_from": "2025-12-01", "date_to": "2025-12-07"},
+    ),
+    (
+        "Сколько снапшотов, где количество жалоб стало меньше, чем в прошлом замере?",
+        {"query_type": "snapshots_with_negative_delta", "metric": "reports", "date": None},
+    ),
+    (
+        "Сколько замеров статистики с отрицательным приростом комментариев за 27.11.2025?",
+        {"query_type": "snapshots_with_negative_delta", "metric": "comments", "date": "2025-11-27"},
+    ),
+    (
+        "На сколько в сумме выросли просмотры всех видео автора 0a1b2c3d4e5f с 10:00 до 18:00 1 декабря 2025?",
+        {"query_type": "creator_views_delta_in_time_range", "creator_id": "0a1b2c3d4e5f",
+         "date": "2025-12-01", "time_from": "10:00", "time_to": "18:00"},
+    ),
+    ("Сколько видео в системе?", {"query_type": "total_videos"}),
+    # правила должны отдать эти вопросы модели
+    ("Сколько видео вышло в ноябре 2025?", None),
+    ("Какой креатор самый популярный?", None),
+    ("Сколько видео у креатора a1b2c3d4e5 вышло за последнюю неделю?", None),
+    ("Сколько лайков набрали видео креатора a1b2c3d4e5 с 1 по 5 ноября 2025?", None),
+    ("Сколько видео не набрало больше 1000 просмотров?", None),
+    ("Сколько видео набрало меньше 1000 просмотров за всё время?", None),
+    ("Сколько видео у креатора с id 42 не набрали больше 100 просмотров?", None),
+    ("Какие видео сильнее всего потеряли просмотры 28 ноября 2025?", None),
+    ("Какие видео быстрее всего росли по просмотрам 28 ноября 2025 в 14:00?", None),
+]
+
+REPEATS = 200
+
+
+def main():
+    answered = 0
+    wrong = []
+    latencies = []
+
+    for text, expected in LABELED:
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            desc, confidence = nlp.rule_parse(text)
+        latencies.append((time.perf_counter() - started) / REPEATS)
+
+        if desc is None or confidence < nlp.RULES_MIN_CONFIDENCE:
+            continue
+        answered += 1
+        if desc != expected:
+            wrong.append((text, expected, desc))
+
+    answerable = sum(1 for _, expected in LABELED if expected is not None)
+    latencies.sort()
+    print(f"questions: {len(LABELED)}, with a known query_type: {answerable}")
+    print(f"answered by rules: {answered} ({answered / answerable:.0%} coverage), wrong: {len(wrong)}")
+    print(
+        f"latency per question: mean {statistics.mean(latencies) * 1e6:.1f} µs, "
+        f"max {latencies[-1] * 1e6:.1f} µs"
+    )
+    for text, expected, got in wrong:
+        print(f"WRONG: {text}\n  expected {expected}\n  got      {got}")
+
+
+if __name__ == "__main__":
+    main()
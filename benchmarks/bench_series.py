@@ -0,0 +1,92 @@
+"""
+Ряды (metric_series / top_series) против цикла скалярных запросов
+на загруженной базе (только чтение).
+
+top_series по креаторам за день по часам — один проход date_bin/GROUP BY;
+то же самое циклом: creator_views_delta_in_time_range на каждый час каждого
+креатора из топа. Плюс metric_series по дням у одного креатора против
+запроса на каждый день. Значения сверяются. И ряд за несколько лет —
+обрезается ли он до SERIES_MAX_BUCKETS недель.
+
+  python benchmarks/bench_series.py --day 2025-11-05 --top 5 --runs 3
+"""
+import sys
+import argparse
+from pathlib import Path
+from datetime import date, timedelta
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+from queries import execute_query, SERIES_MAX_BUCKETS
+from bench_batch import timed
+
+
+def hourly_loop(creators: list[str], day: str) -> dict[str, list[int]]:
+    return {
+        c: [
+            int(execute_query({
+                "query_type": "creator_views_delta_in_time_range", "creator_id": c, "date": day,
+                "time_from": f"{h:02d}:00", "time_to": f"{h:02d}:59:59.999999",
+            }))
+            for h in range(24)
+        ]
+        for c in creators
+    }
+
+
+def daily_loop(creator: str, days: list[str]) -> list[int]:
+    return [
+        int(execute_query({
+            "query_type": "creator_views_delta_in_time_range", "creator_id": creator, "date": d,
+            "time_from": "00:00", "time_to": "23:59:59.999999",
+        }))
+        for d in days
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--day", default="2025-11-05")
+    parser.add_argument("--days", type=int, default=14, help="длина ряда по дням")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    top = {"query_type": "top_series", "metric": "views", "bucket": "hour",
+           "date_from": args.day, "date_to": args.day, "group_by": "creator", "top_n": args.top}
+    series_s, series = timed(lambda: execute_query(top), args.runs)
+    creators = list(series["series"])
+    loop_s, loop = timed(lambda: hourly_loop(creators, args.day), args.runs)
+    mismatches = sum(series["series"][c] != loop[c] for c in creators)
+    print(f"top_series hour × {len(creators)} creators: series {series_s * 1000:.1f} ms, "
+          f"loop of {24 * len(creators)} queries {loop_s * 1000:.1f} ms "
+          f"({loop_s / series_s:.1f}x), mismatches {mismatches}")
+
+    start = date.fromisoformat(args.day)
+    days = [(start + timedelta(days=i)).isoformat() for i in range(args.days)]
+    one = {"query_type": "metric_series", "metric": "views", "bucket": "day",
+           "date_from": days[0], "date_to": days[-1], "creator_id": creators[0]}
+    series_s, series = timed(lambda: execute_query(one), args.runs)
+    loop_s, loop = timed(lambda: daily_loop(creators[0], days), args.runs)
+    (values,) = series["series"].values()
+    print(f"metric_series day × {args.days}: series {series_s * 1000:.1f} ms, "
+          f"loop {loop_s * 1000:.1f} ms ({loop_s / series_s:.1f}x), "
+          f"{'match' if values == loop else 'MISMATCH'}")
+
+    # диапазон в несколько лет: даже недель больше SERIES_MAX_BUCKETS,
+    # ряд должен обрезаться до последних недель перед date_to
+    long = {**one, "bucket": "day", "date_from": (start - timedelta(days=365 * 5)).isoformat(),
+            "date_to": days[-1]}
+    result = execute_query(long)
+    (values,) = result["series"].values()
+    ok = (result["bucket"] == "week" and len(result["buckets"]) <= SERIES_MAX_BUCKETS
+          and len(values) == len(result["buckets"]))
+    print(f"metric_series 5 years: {len(result['buckets'])} {result['bucket']} buckets "
+          f"(max {SERIES_MAX_BUCKETS}), {'ok' if ok else 'FAIL'}")
+
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
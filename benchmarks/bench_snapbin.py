@@ -0,0 +1,146 @@
+"""
+snapbin против JSON: размер файла, чтение и загрузка.
+
+Данные — generate_data.py во временный каталог, затем snapbin.convert.
+Замеры:
+  - размер JSON и snapbin;
+  - чтение: от файла до строк для COPY (iter_videos + video_row/snapshot_row
+    против SnapBin.batches), без базы;
+  - агрегация: сумма delta_views_count по дням — json.load и цикл против
+    snapbin.daily_totals по отображению (векторно, если есть numpy);
+  - с --load: load_data целиком из каждого формата на пустой схеме
+    (ВНИМАНИЕ: как bench_e2e, пересоздаёт схему в DB_DSN — только отдельная база)
+    и сверка содержимого таблиц.
+
+  python benchmarks/bench_snapbin.py --videos 50000
+  DB_DSN="dbname=video_analytics_bench" python benchmarks/bench_snapbin.py --videos 50000 --load --workers 2
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import snapbin
+import load_data
+from generate_data import generate
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - started, 3)
+
+
+def read_json(path: Path) -> int:
+    rows = 0
+    for v in load_data.iter_videos(path):
+        load_data.video_row(v)
+        rows += 1
+        for s in v["snapshots"]:
+            load_data.snapshot_row(s)
+            rows += 1
+    return rows
+
+
+def read_snapbin(path: Path) -> int:
+    rows = 0
+    with snapbin.SnapBin(path) as sb:
+        for videos_rows, snapshots_rows, _ in sb.batches():
+            rows += len(videos_rows) + len(snapshots_rows)
+    return rows
+
+
+def daily_json(path: Path) -> dict:
+    totals = {}
+    for v in load_data.iter_videos(path):
+        for s in v["snapshots"]:
+            day = datetime.fromisoformat(s["created_at"]).date()
+            totals[day] = totals.get(day, 0) + s["delta_views_count"]
+    return {d: s for d, s in totals.items() if s}
+
+
+def daily_snapbin(path: Path) -> dict:
+    with snapbin.SnapBin(path) as sb:
+        return snapbin.daily_totals(sb)
+
+
+def table_digest() -> list[tuple]:
+    with load_data.connect() as conn:
+        with conn.cursor() as cur:
+            result = []
+            for table in ("videos", "video_snapshots", "daily_stats"):
+                cur.execute(
+                    f"SELECT COUNT(*), md5(string_agg(md5(t::text), '' ORDER BY md5(t::text))) FROM {table} t;"
+                )
+                result.append(cur.fetchone())
+    conn.close()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--load", action="store_true", help="загрузить оба формата в базу DB_DSN")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", type=Path, help="JSON с результатами")
+    args = parser.parse_args()
+
+    out = Path(tempfile.mkdtemp(prefix="snapbin-"))
+    (json_path,), videos, snapshots = generate(out / "videos.json", args.videos, seed=args.seed)
+    bin_path = out / "videos.snapbin"
+    _, convert_s = timed(snapbin.convert, [json_path], bin_path)
+
+    result = {
+        "videos": videos,
+        "snapshots": snapshots,
+        "numpy": snapbin.numpy is not None,
+        "json_mb": round(json_path.stat().st_size / 1e6, 1),
+        "snapbin_mb": round(bin_path.stat().st_size / 1e6, 1),
+        "convert_s": convert_s,
+    }
+    rows_json, result["read_json_s"] = timed(read_json, json_path)
+    rows_bin, result["read_snapbin_s"] = timed(read_snapbin, bin_path)
+    daily_a, result["daily_json_s"] = timed(daily_json, json_path)
+    daily_b, result["daily_snapbin_s"] = timed(daily_snapbin, bin_path)
+
+    failures = []
+    if rows_json != rows_bin:
+        failures.append(f"строк прочитано: json {rows_json}, snapbin {rows_bin}")
+    if daily_a != daily_b:
+        failures.append("суммы по дням не совпали")
+
+    if args.load:
+        from check_result_cache import reset
+
+        digests = {}
+        for name, path in (("json", json_path), ("snapbin", bin_path)):
+            reset()
+            _, result[f"load_{name}_s"] = timed(load_data.load_data, path, workers=args.workers)
+            digests[name] = table_digest()
+        if digests["json"] != digests["snapbin"]:
+            failures.append("таблицы после загрузки из json и snapbin различаются")
+
+    print(f"videos {videos}, snapshots {snapshots}")
+    print(f"размер: JSON {result['json_mb']} МБ, snapbin {result['snapbin_mb']} МБ "
+          f"(x{result['json_mb'] / result['snapbin_mb']:.1f}), конвертация {convert_s} с")
+    print(f"чтение до строк COPY: JSON {result['read_json_s']} с, snapbin {result['read_snapbin_s']} с")
+    print(f"сумма по дням: JSON {result['daily_json_s']} с, snapbin {result['daily_snapbin_s']} с "
+          f"({'numpy' if result['numpy'] else 'без numpy'})")
+    if args.load:
+        print(f"load_data: JSON {result['load_json_s']} с, snapbin {result['load_snapbin_s']} с")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if args.out:
+        args.out.write_text(json.dumps(result | {"failures": failures}, ensure_ascii=False, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+Старт бота: время импорта по модулям и время до первого ответа.
+
+  импорт     — `python -X importtime -c "import bot"`: сколько занимает
+               каждый модуль верхнего уровня (с зависимостями);
+  ответ      — отдельный процесс импортирует bot и задаёт два вопроса через
+               handle_any_text: разбираемый правилами (SQL в базу) и через
+               модель (fake_openai.FakeOpenAI). cold — сразу после импорта,
+               warm — через --delay секунд после запуска bot.warm_up()
+               (столько примерно проходит до первого апдейта при polling);
+  webhook    — сколько webhook.py --workers N стартует до /healthz 200
+               при spawn и forkserver (WEBHOOK_START_METHOD).
+
+База только читается.
+
+  python benchmarks/bench_startup.py
+  python benchmarks/bench_startup.py --workers 4 --skip-webhook
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+RULES_QUESTION = "Сколько всего видео есть в системе?"
+LLM_QUESTION = "Какой креатор самый популярный?"
+ENV = {
+    "BOT_TOKEN": "123456:" + "A" * 35,
+    "OPENAI_API_KEY": "startup",
+    "NLP_CACHE_PATH": "",
+    "RESULT_CACHE_PATH": "",
+    "LOG_LEVEL": "WARNING",
+    "METRICS_PORT": "0",
+}
+
+
+def import_times(module: str = "bot", top: int = 12) -> tuple[float, list[tuple[str, float]]]:
+    """
+    (всего, [(модуль, мс)]) для прямых импортов module, по убыванию.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=os.environ | ENV, cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    total = 0.0
+    children = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        ms = int(cumulative) / 1000
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() == module:
+            total = ms
+        elif depth == 1:
+            children.append((name.strip(), ms))
+    children.sort(key=lambda item: -item[1])
+    return total, children[:top]
+
+
+# ---------- дочерний процесс: импорт и первые ответы ----------
+
+async def child(mode: str, delay: float) -> dict:
+    started = time.time()
+    import bot
+    imported = time.time()
+
+    sys.path.insert(0, str(ROOT / "benchmarks"))
+    from fake_openai import FakeOpenAI
+    from bench_e2e import StubMessage
+
+    def respond(system_prompt: str, user_text: str) -> str:
+        if "JSON" in system_prompt:
+            return json.dumps({"query_type": "total_videos"})
+        return "SELECT COUNT(*) FROM videos;"
+
+    server = FakeOpenAI(latency=0.05, respond=respond)
+    await server.start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    if mode == "warm":
+        asyncio.create_task(bot.warm_up())
+        await asyncio.sleep(delay)
+
+    answers = {}
+    for kind, text in (("rules", RULES_QUESTION), ("llm", LLM_QUESTION)):
+        message = StubMessage(text)
+        t = time.perf_counter()
+        await bot.handle_any_text(message)
+        answers[kind] = {"ms": round((time.perf_counter() - t) * 1000, 1), "reply": message.replies[:1]}
+    await server.stop()
+    return {"import_s": round(imported - started, 3), "answers": answers}
+
+
+def first_answer(mode: str, delay: float) -> dict:
+    spawned = time.time()
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", mode, "--delay", str(delay)],
+        env=os.environ | ENV, cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr[-2000:])
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["wall_s"] = round(time.time() - spawned, 3)
+    return result
+
+
+def webhook_ready(workers: int, method: str, port: int) -> float:
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "webhook.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        env=os.environ | ENV | {"WEBHOOK_START_METHOD": method, "WEBHOOK_URL": ""}, cwd=ROOT,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz") as response:
+                    if response.status == 200:
+                        return round(time.monotonic() - started, 2)
+            except OSError:
+                pass
+            if proc.poll() is not None:
+                raise RuntimeError(f"webhook.py завершился с кодом {proc.returncode}")
+            time.sleep(0.05)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    parser.add_argument("--delay", type=float, default=1.0, help="warm: через сколько секунд после старта первый вопрос")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=18090)
+    parser.add_argument("--skip-webhook", action="store_true")
+    parser.add_argument("--out", type=Path, help="JSON с результатами")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(child(args.child, args.delay)), ensure_ascii=False))
+        return 0
+
+    result = {}
+    for module in ("bot", "nlp"):
+        total, children = import_times(module)
+        result[f"import_{module}_ms"] = total
+        print(f"import {module}: {total:.0f} мс")
+        if module == "bot":
+            for name, ms in children:
+                print(f"  {name:28} {ms:8.1f} мс")
+            result["import_bot_children_ms"] = dict(children)
+
+    for mode in ("cold", "warm"):
+        r = result[mode] = first_answer(mode, args.delay)
+        a = r["answers"]
+        print(
+            f"{mode}: import bot {r['import_s']} с, первый ответ правилами {a['rules']['ms']} мс, "
+            f"первый ответ через модель {a['llm']['ms']} мс"
+        )
+
+    if not args.skip_webhook:
+        for method in ("spawn", "forkserver"):
+            result[f"webhook_{method}_s"] = webhook_ready(args.workers, method, args.port)
+            print(f"webhook.py --workers {args.workers}, {method}: /healthz через {result[f'webhook_{method}_s']} с")
+
+    if args.out:
+        args.out.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
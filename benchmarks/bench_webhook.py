@@ -0,0 +1,166 @@
+"""
+Нагрузочный тест webhook.py: N воркеров против фейкового Telegram Bot API.
+
+Для каждого --workers поднимается fake_telegram.FakeTelegram, запускается
+`python webhook.py` и в него шлются обновления: --chats чатов по
+--messages вопросов «сколько видео набрало больше K просмотров», K в чате
+растёт — ответы в чате не должны расти, иначе нарушен порядок. Ответы,
+склеенные отправителем, разбираются обратно по пустой строке.
+
+Печатает: сколько обновлений в секунду принял ingress, за сколько пришли
+все ответы, задержку ответа (p50/p99), число sendMessage и склеенных
+ответов, 429 от фейка, нарушения порядка и время штатной остановки по SIGTERM.
+Только чтение базы; разбор вопросов — правилами, без модели.
+
+  python benchmarks/bench_webhook.py --workers 1,4 --chats 200 --messages 5
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+from pathlib import Path
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_telegram import FakeTelegram
+from bench_e2e import percentiles
+
+QUESTION = "Сколько видео набрало больше {} просмотров за всё время?"
+
+
+def update(n: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": n,
+        "message": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": text,
+        },
+    }
+
+
+async def post_chat(session: aiohttp.ClientSession, url: str, chat_id: int, messages: int, sent: dict):
+    for j in range(messages):
+        body = update(chat_id * 1000 + j, chat_id, QUESTION.format(j * 1000 + chat_id))
+        while True:
+            started = time.monotonic()
+            async with session.post(url, json=body) as response:
+                if response.status == 200:
+                    sent[chat_id].append(started)
+                    break
+            # 503 — очередь воркера полна, Telegram повторил бы позже
+            await asyncio.sleep(0.05)
+
+
+def replies(tg: FakeTelegram, chat_id: int) -> list[tuple[float, str]]:
+    return [(t, part) for t, text in tg.messages.get(chat_id, []) for part in text.split("\n\n")]
+
+
+async def run(workers: int, args) -> dict:
+    tg = FakeTelegram(latency=args.tg_latency, global_rate=args.global_rate, chat_interval=args.chat_interval)
+    await tg.start()
+    env = os.environ | {
+        "BOT_TOKEN": "123456:" + "A" * 35,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+        "TELEGRAM_API_URL": tg.base_url,
+        "TELEGRAM_GLOBAL_RATE": str(args.global_rate),
+        "TELEGRAM_CHAT_INTERVAL": str(args.chat_interval),
+        "WEBHOOK_URL": "",
+        "WEBHOOK_SECRET": "",
+        "NLP_CACHE_PATH": "",
+        "RESULT_CACHE_PATH": "",
+        "METRICS_PORT": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, str(ROOT / "webhook.py"), "--workers", str(workers),
+        "--host", "127.0.0.1", "--port", str(args.port), env=env, cwd=ROOT,
+    )
+    base = f"http://127.0.0.1:{args.port}"
+    chats = range(1, args.chats + 1)
+    sent = {c: [] for c in chats}
+    total = args.chats * args.messages
+    try:
+        async with aiohttp.ClientSession() as session:
+            # /healthz отвечает 200, когда все воркеры готовы
+            for _ in range(600):
+                try:
+                    async with session.get(base + "/healthz") as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientConnectionError:
+                    pass
+                await asyncio.sleep(0.1)
+
+            started = time.monotonic()
+            await asyncio.gather(*(post_chat(session, base + "/webhook", c, args.messages, sent) for c in chats))
+            posted = time.monotonic() - started
+
+            deadline = time.monotonic() + args.timeout
+            while sum(len(replies(tg, c)) for c in chats) < total and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            answered = max((t for c in chats for t, _ in replies(tg, c)), default=started) - started
+    finally:
+        stop_started = time.monotonic()
+        proc.send_signal(signal.SIGTERM)
+        code = await proc.wait()
+        stopped = time.monotonic() - stop_started
+        await tg.stop()
+
+    latencies = []
+    violations = 0
+    received = 0
+    for c in chats:
+        got = replies(tg, c)
+        received += len(got)
+        latencies += [t - s for (t, _), s in zip(got, sent[c])]
+        values = [int(text) for _, text in got if text.isdigit()]
+        violations += sum(1 for a, b in zip(values, values[1:]) if b > a)
+
+    return {
+        "workers": workers,
+        "updates": total,
+        "replies": received,
+        "ingress_per_sec": round(total / posted, 1),
+        "replies_per_sec": round(received / answered, 1) if answered > 0 else None,
+        "latency": percentiles(latencies),
+        "send_message_calls": sum(len(v) for v in tg.messages.values()),
+        "too_many_requests": tg.too_many,
+        "order_violations": violations,
+        "shutdown_s": round(stopped, 2),
+        "exit_code": code,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,4", help="через запятую")
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=5, help="вопросов на чат")
+    parser.add_argument("--global-rate", type=float, default=300, help="лимит фейка и бота, сообщений/с")
+    parser.add_argument("--chat-interval", type=float, default=1.0)
+    parser.add_argument("--tg-latency", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    for workers in map(int, args.workers.split(",")):
+        r = await run(workers, args)
+        print(
+            f"workers={r['workers']}: {r['replies']}/{r['updates']} ответов, "
+            f"ingress {r['ingress_per_sec']} upd/s, ответы {r['replies_per_sec']}/s, "
+            f"p50 {r['latency'].get('p50_ms')} ms, p99 {r['latency'].get('p99_ms')} ms, "
+            f"sendMessage {r['send_message_calls']}, 429: {r['too_many_requests']}, "
+            f"порядок нарушен: {r['order_violations']}, остановка {r['shutdown_s']} с (код {r['exit_code']})"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Проверка асинхронного клиента модели из nlp.py на локальном фейковом API:
+объединение одинаковых запросов, ограничение параллельности, повторы, таймаут.
+
+  python benchmarks/check_async_llm.py
+"""
+import os
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_openai import FakeOpenAI
+
+USERS = 50
+
+
+def check(name: str, ok: bool, details: str) -> bool:
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {details}")
+    return ok
+
+
+async def main() -> int:
+    server = FakeOpenAI(latency=0.2)
+    await server.start()
+
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ["NLP_CACHE_PATH"] = ""
+    os.environ["LLM_MAX_CONCURRENCY"] = "4"
+    os.environ["LLM_TIMEOUT"] = "1"
+    os.environ["LLM_RETRY_BASE_DELAY"] = "0.05"
+    import nlp
+
+    results = []
+
+    # 1. 50 пользователей с одним вопросом — один запрос к модели
+    started = time.perf_counter()
+    answers = await asyncio.gather(
+        *(nlp.aparse_user_query("Какой креатор самый популярный?") for _ in range(USERS))
+    )
+    elapsed = time.perf_counter() - started
+    results.append(check(
+        "single-flight",
+        server.requests == 1 and all(a == {"query_type": "total_videos"} for a in answers),
+        f"{USERS} callers, {server.requests} model request(s), {elapsed:.2f}s",
+    ))
+
+    # 2. разные вопросы — не больше LLM_MAX_CONCURRENCY одновременно
+    server.requests = server.max_in_flight = 0
+    await asyncio.gather(*(nlp.anl_to_sql(f"вопрос номер {i}") for i in range(12)))
+    results.append(check(
+        "concurrency limit",
+        server.requests == 12 and server.max_in_flight <= nlp.LLM_MAX_CONCURRENCY,
+        f"12 requests, max in flight {server.max_in_flight} (limit {nlp.LLM_MAX_CONCURRENCY})",
+    ))
+
+    # 3. ошибка 500 повторяется и не доходит до пользователя
+    server.requests = 0
+    server.fail_first = 2
+    sql = await nlp.anl_to_sql("ещё один вопрос")
+    results.append(check(
+        "retry",
+        server.requests == 3 and sql.startswith("SELECT"),
+        f"{server.requests} attempts, answer {sql!r}",
+    ))
+
+    # 4. ответ дольше LLM_TIMEOUT — unknown, а не зависание
+    server.requests = 0
+    server.latency = nlp.LLM_TIMEOUT + 1
+    started = time.perf_counter()
+    desc = await nlp.aparse_user_query("совсем медленный вопрос")
+    elapsed = time.perf_counter() - started
+    limit = (nlp.LLM_RETRIES + 1) * nlp.LLM_TIMEOUT + 1
+    results.append(check(
+        "timeout",
+        desc == {"query_type": "unknown"} and elapsed < limit,
+        f"{server.requests} attempts, {elapsed:.2f}s, result {desc}",
+    ))
+
+    await nlp.async_client.close()
+    await server.stop()
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
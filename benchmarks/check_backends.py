@@ -0,0 +1,131 @@
+"""
+Сверка бэкендов postgres и duckdb по всем query_type на сгенерированных данных.
+
+ВНИМАНИЕ: как и check_result_cache.py, заново накатывает 001_init.sql
+на базе из DB_DSN — запускать на отдельной базе.
+
+Детерминированный набор (--seed): креаторы, видео и почасовые снапшоты
+с отрицательными приростами через границу месяца. Загрузка через
+load_data.flush_batch (агрегаты и лидерборды обновляются), выгрузка в
+Parquet во временный каталог, затем каждый запрос выполняется на обоих
+бэкендах: postgres — с агрегатами, duckdb — по Parquet.
+
+  DB_DSN="dbname=video_analytics_check" python benchmarks/check_backends.py --seed 7
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+PARQUET = Path(tempfile.mkdtemp())
+os.environ["PARQUET_DIR"] = str(PARQUET)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import backends
+from queries import execute_query
+from rollups import LEADERBOARDS, METRICS
+from parquet_export import export_parquet
+from check_result_cache import reset, load
+
+import load_data
+
+START = datetime(2025, 10, 27, tzinfo=timezone.utc)
+DAYS = 14
+
+
+def generate(rng: random.Random, videos: int, creators: int) -> list:
+    result = []
+    for i in range(videos):
+        published = START + timedelta(hours=rng.randrange(DAYS * 24 // 2))
+        totals = [0, 0, 0, 0]
+        snapshots = []
+        for h in range(rng.randrange(24, DAYS * 24 // 2)):
+            ts = published + timedelta(hours=h, minutes=rng.randrange(60))
+            deltas = [rng.randrange(-20, 200), rng.randrange(-5, 30), rng.randrange(-2, 8), rng.randrange(-1, 2)]
+            totals = [t + d for t, d in zip(totals, deltas)]
+            snapshots.append({
+                "id": f"s{i}-{h}", "video_id": f"v{i}",
+                "views_count": totals[0], "likes_count": totals[1],
+                "comments_count": totals[2], "reports_count": totals[3],
+                "delta_views_count": deltas[0], "delta_likes_count": deltas[1],
+                "delta_comments_count": deltas[2], "delta_reports_count": deltas[3],
+                "created_at": ts, "updated_at": ts,
+            })
+        v = {
+            "id": f"v{i}", "creator_id": f"c{rng.randrange(creators)}", "video_created_at": published,
+            "views_count": totals[0], "likes_count": totals[1],
+            "comments_count": totals[2], "reports_count": totals[3],
+            "created_at": published, "updated_at": published,
+        }
+        result.append((load_data.video_row(v), [load_data.snapshot_row(s) for s in snapshots]))
+    return result
+
+
+def descs(rng: random.Random, creators: int) -> list[dict]:
+    days = [(START + timedelta(days=d)).date().isoformat() for d in range(DAYS)]
+    cs = [f"c{rng.randrange(creators)}" for _ in range(4)]
+    result = [{"query_type": "total_videos"}]
+    for c in cs:
+        result.append({"query_type": "creator_videos_with_min_views", "creator_id": c,
+                       "views_threshold": rng.randrange(0, 20000)})
+        result.append({"query_type": "creator_videos_in_date_range", "creator_id": c,
+                       "date_from": days[1], "date_to": days[rng.randrange(2, DAYS)]})
+        result.append({"query_type": "creator_views_delta_in_time_range", "creator_id": c,
+                       "date": rng.choice(days), "time_from": "10:00", "time_to": "14:30"})
+        result.append({"query_type": "metric_series", "metric": rng.choice(METRICS), "bucket": "hour",
+                       "date_from": days[5], "date_to": days[5], "creator_id": c})
+    for threshold in (0, 1000, 10000):
+        result.append({"query_type": "videos_with_min_views", "views_threshold": threshold})
+    for d in days:
+        result.append({"query_type": "videos_with_new_views_on_date", "date": d})
+        result.append({"query_type": "snapshots_with_negative_delta", "metric": rng.choice(METRICS), "date": d})
+    result += [{"query_type": "snapshots_with_negative_delta", "metric": m, "date": None} for m in METRICS]
+    result.append({"query_type": "sum_views_for_videos_in_date_range", "date_from": days[0], "date_to": days[6]})
+    for bucket in ("hour", "day", "week"):
+        result.append({"query_type": "metric_series", "metric": "views", "bucket": bucket,
+                       "date_from": days[2], "date_to": days[8], "creator_id": None})
+    for group_by in ("creator", "video"):
+        result.append({"query_type": "top_series", "metric": rng.choice(METRICS), "bucket": "day",
+                       "date_from": days[0], "date_to": days[-1], "group_by": group_by, "top_n": 5})
+    for entity, period in LEADERBOARDS:
+        for m in METRICS:
+            result.append({"query_type": "top_n", "entity": entity, "period": period, "metric": m,
+                           "date": rng.choice(days), "hour": f"{rng.randrange(24):02d}:00", "limit": 10})
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--videos", type=int, default=300)
+    parser.add_argument("--creators", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    reset()
+    load(generate(rng, args.videos, args.creators))
+    export_parquet(PARQUET)
+
+    checked = {}
+    mismatches = 0
+    for desc in descs(rng, args.creators):
+        pg = execute_query(desc, use_rollups=True, backend="postgres")
+        duck = execute_query(desc, backend="duckdb")
+        qt = desc["query_type"]
+        checked[qt] = checked.get(qt, 0) + 1
+        if pg != duck:
+            mismatches += 1
+            print(f"MISMATCH {desc}: postgres={pg}, duckdb={duck}")
+
+    for qt, n in checked.items():
+        print(f"{qt:<36} {n:>3}")
+    print(f"проверено запросов: {sum(checked.values())}, расхождений: {mismatches}")
+    backends.close_backends()
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Регрессионная проверка планов: горячие query_type не должны уходить
+в Seq Scan на большой таблице.
+
+Скрипт создаёт отдельную схему, накатывает в неё 001_init.sql и
+004_query_indexes.sql, генерирует данные (по умолчанию 50 000 видео ×
+24 снапшота), делает VACUUM ANALYZE и смотрит EXPLAIN для SQL, который
+строит queries.build_query. Код возврата 1, если где-то есть Seq Scan.
+
+  python benchmarks/check_explain.py --videos 50000
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import psycopg2
+
+import db
+from queries import build_query
+
+SCHEMA = "explain_check"
+
+HOT_QUERIES = [
+    {"query_type": "creator_videos_in_date_range", "creator_id": "c7",
+     "date_from": "2025-10-10", "date_to": "2025-10-15"},
+    {"query_type": "creator_videos_with_min_views", "creator_id": "c7", "views_threshold": 50000},
+    {"query_type": "sum_views_for_videos_in_date_range", "date_from": "2025-10-10", "date_to": "2025-10-11"},
+    {"query_type": "videos_with_new_views_on_date", "date": "2025-10-20"},
+    {"query_type": "snapshots_with_negative_delta", "metric": "views", "date": "2025-10-20"},
+    {"query_type": "snapshots_with_negative_delta", "metric": "likes", "date": None},
+    {"query_type": "snapshots_with_negative_delta", "metric": "reports", "date": "2025-10-20"},
+    {"query_type": "creator_views_delta_in_time_range", "creator_id": "c7",
+     "date": "2025-10-20", "time_from": "10:00", "time_to": "15:00"},
+]
+
+
+def generate(cur, videos: int):
+    for migration in ("001_init.sql", "004_query_indexes.sql"):
+        cur.execute((ROOT / "migrations" / migration).read_text())
+
+    creators = max(videos // 100, 1)
+    cur.execute(
+        """
+        INSERT INTO videos
+        SELECT 'v' || g, 'c' || (g %% %(creators)s),
+               timestamptz '2025-10-01 00:00+00' + (g %% 1440) * interval '1 hour',
+               (random() * 100000)::bigint, (random() * 5000)::bigint,
+               (random() * 500)::bigint, (random() * 10)::bigint,
+               now(), now()
+        FROM generate_series(1, %(videos)s) AS g;
+        """,
+        {"videos": videos, "creators": creators},
+    )
+    cur.execute(
+        """
+        INSERT INTO video_snapshots
+        SELECT 'v' || g || '-' || h, 'v' || g,
+               0, 0, 0, 0,
+               (random() * 200)::bigint - 5, (random() * 20)::bigint - 1,
+               (random() * 5)::bigint - 1, (random() * 1.05)::bigint - (random() * 1.02)::bigint,
+               timestamptz '2025-10-01 00:00+00' + ((g %% 1440) + h) * interval '1 hour',
+               now()
+        FROM generate_series(1, %(videos)s) AS g, generate_series(1, 24) AS h;
+        """,
+        {"videos": videos},
+    )
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=50000)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему с данными")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(db.DB_DSN, options=f"-c TimeZone={db.DB_TIMEZONE} -c search_path={SCHEMA}")
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+    print(f"generating {args.videos} videos x 24 snapshots ...")
+    generate(cur, args.videos)
+    cur.execute("VACUUM ANALYZE videos;")
+    cur.execute("VACUUM ANALYZE video_snapshots;")
+
+    failures = 0
+    for desc in HOT_QUERIES:
+        sql, params = build_query(desc, use_rollups=False)
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0][0]["Plan"]
+        nodes = list(plan_nodes(plan))
+        seq = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+        scans = ", ".join(
+            f"{n['Node Type']} {n.get('Index Name') or n.get('Relation Name')}"
+            for n in nodes if "Relation Name" in n or "Index Name" in n
+        )
+        label = json.dumps({k: v for k, v in desc.items() if v is not None}, ensure_ascii=False)
+        if seq:
+            failures += 1
+            print(f"FAIL {label}\n     Seq Scan on {', '.join(seq)}")
+        else:
+            print(f"OK   {label}\n     {scans}")
+
+    if not args.keep:
+        cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+    conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
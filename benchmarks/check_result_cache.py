@@ -0,0 +1,168 @@
+"""
+Проверка кэша результатов (result_cache.py) на отдельной базе.
+
+ВНИМАНИЕ: скрипт заново накатывает 001_init.sql (DROP TABLE videos,
+video_snapshots) и чистит агрегаты и журнал изменений.
+
+Сценарий: загрузка ноября → ответы попадают в кэш → загрузка декабря
+сбрасывает только ответы, зависящие от декабря и всей таблицы → загрузка
+снапшота задним числом сбрасывает ответы за этот день → второй экземпляр
+кэша читает общий SQLite-файл. После каждого шага ответы из кэша
+сверяются с execute_query. В конце — время попадания против запроса к базе.
+
+  DB_DSN="dbname=video_analytics_check" python benchmarks/check_result_cache.py
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import load_data
+import rollups
+from queries import execute_query
+from result_cache import ResultCache
+
+QUERIES = {
+    "new_views_nov05": {"query_type": "videos_with_new_views_on_date", "date": "2025-11-05"},
+    "negative_nov06": {"query_type": "snapshots_with_negative_delta", "metric": "views", "date": "2025-11-06"},
+    "creator_nov05": {"query_type": "creator_views_delta_in_time_range", "creator_id": "c1",
+                      "date": "2025-11-05", "time_from": "10:00", "time_to": "12:00"},
+    "total_videos": {"query_type": "total_videos"},
+    "sum_views_dec": {"query_type": "sum_views_for_videos_in_date_range",
+                      "date_from": "2025-12-01", "date_to": "2025-12-03"},
+}
+
+
+def reset():
+    with load_data.connect() as conn:
+        with conn.cursor() as cur:
+            for migration in ("001_init.sql", "002_load_checkpoints.sql", "003_rollups.sql",
+                              "004_query_indexes.sql", "006_data_changes.sql", "007_leaderboards.sql",
+                              "008_ingest_watermarks.sql"):
+                cur.execute((ROOT / "migrations" / migration).read_text())
+            cur.execute(
+                f"TRUNCATE {', '.join(rollups.ROLLUPS)}, data_changes, ingest_watermarks;"
+                "UPDATE data_version SET version = 0;"
+            )
+    conn.close()
+
+
+def video(video_id: str, creator_id: str, published: datetime, snapshots: list[tuple[str, datetime, int]]):
+    v = {
+        "id": video_id, "creator_id": creator_id, "video_created_at": published,
+        "views_count": 0, "likes_count": 0, "comments_count": 0, "reports_count": 0,
+        "created_at": published, "updated_at": published,
+    }
+    rows = [
+        {
+            "id": snapshot_id, "video_id": video_id,
+            "views_count": 0, "likes_count": 0, "comments_count": 0, "reports_count": 0,
+            "delta_views_count": delta, "delta_likes_count": 0,
+            "delta_comments_count": 0, "delta_reports_count": 0,
+            "created_at": ts, "updated_at": ts,
+        }
+        for snapshot_id, ts, delta in snapshots
+    ]
+    return load_data.video_row(v), [load_data.snapshot_row(s) for s in rows]
+
+
+def load(videos: list):
+    with load_data.connect() as conn:
+        with conn.cursor() as cur:
+            load_data.create_staging_tables(cur)
+            load_data.flush_batch(
+                cur,
+                [v for v, _ in videos],
+                [s for _, snapshots in videos for s in snapshots],
+            )
+    conn.close()
+
+
+def check(name: str, ok: bool, details: str) -> bool:
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {details}")
+    return ok
+
+
+def cached_keys(cache: ResultCache) -> set[str]:
+    return {name for name, desc in QUERIES.items() if cache.get(desc) is not None}
+
+
+def consistent(cache: ResultCache) -> bool:
+    return all(cache.execute(desc) == execute_query(desc) for desc in QUERIES.values())
+
+
+def main() -> int:
+    reset()
+    results = []
+    store = Path(tempfile.mkdtemp()) / "results.sqlite"
+
+    nov = datetime(2025, 11, 1, tzinfo=timezone.utc)
+    load([
+        video(f"v{i}", f"c{i % 3}", nov + timedelta(days=i % 10),
+              [(f"v{i}-{h}", nov + timedelta(days=4, hours=h), h % 7 - 2) for h in range(48)])
+        for i in range(30)
+    ])
+
+    cache = ResultCache(path=store)
+    for desc in QUERIES.values():
+        cache.execute(desc)
+    kept = cached_keys(cache)
+    results.append(check(
+        "fill", kept == set(QUERIES) and consistent(cache),
+        f"cached {sorted(kept)}, version {cache.version}",
+    ))
+
+    # декабрьское видео: трогает videos за декабрь и снапшоты за 2 декабря
+    dec = datetime(2025, 12, 2, 9, tzinfo=timezone.utc)
+    load([video("v-dec", "c1", dec, [("v-dec-1", dec + timedelta(hours=1), 50)])])
+    cache.refresh()
+    expected = {"new_views_nov05", "negative_nov06", "creator_nov05"}
+    kept = cached_keys(cache)
+    results.append(check(
+        "december load", kept == expected and consistent(cache),
+        f"kept {sorted(kept)}, version {cache.version}",
+    ))
+
+    # снапшот задним числом за 5 ноября 11:30 у старого видео
+    late = datetime(2025, 11, 5, 11, 30, tzinfo=timezone.utc)
+    for desc in QUERIES.values():
+        cache.execute(desc)
+    load([video("v1", "c1", nov, [("v1-late", late, 1000)])])
+    cache.refresh()
+    expected = {"negative_nov06", "total_videos", "sum_views_dec"}
+    kept = cached_keys(cache)
+    results.append(check(
+        "late snapshot", kept == expected and consistent(cache),
+        f"kept {sorted(kept)}, version {cache.version}",
+    ))
+
+    # второй процесс: те же ответы из общего файла, без запросов к базе
+    other = ResultCache(path=store)
+    other.refresh()
+    hits = cached_keys(other)
+    results.append(check(
+        "shared store", hits == set(QUERIES),
+        f"{len(hits)}/{len(QUERIES)} answered from {store.name}",
+    ))
+
+    desc = QUERIES["creator_nov05"]
+    runs = 1000
+    started = time.perf_counter()
+    for _ in range(runs):
+        cache.get(desc)
+    hit_us = (time.perf_counter() - started) / runs * 1e6
+    started = time.perf_counter()
+    for _ in range(runs // 10):
+        execute_query(desc)
+    query_us = (time.perf_counter() - started) / (runs // 10) * 1e6
+    print(f"\nhit {hit_us:.1f} µs, execute_query {query_us:.0f} µs ({query_us / hit_us:.0f}x)")
+
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Проверка sql_guard на загруженной базе (только чтение).
+
+Опасный и лишний SQL должен отклоняться проверкой, тяжёлый — по стоимости
+плана или по statement_timeout, обычный — выполняться и совпадать с прямым
+запросом. В конце — сколько стоит проверка против повтора из FallbackSqlCache.
+
+  python benchmarks/check_sql_guard.py
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from psycopg2 import errors
+
+import db
+from sql_guard import FALLBACK_STATEMENT_TIMEOUT_MS, FallbackSqlCache, SqlRejected, run_guarded, validate_sql
+
+REJECTED_BY_VALIDATION = [
+    "SELECT COUNT(*) FROM videos; DROP TABLE videos",
+    "WITH d AS (DELETE FROM videos RETURNING id) SELECT COUNT(*) FROM d",
+    "SELECT pg_sleep(60)",
+    "SELECT COUNT(*) FROM pg_catalog.pg_authid",
+    "SELECT usename FROM pg_user",
+    "SELECT COUNT(*) FROM videos /* */",
+    "SELECT COUNT(*) FROM videos FOR UPDATE",
+    "SELECT set_config('statement_timeout', '0', false) FROM videos",
+    "SELECT COUNT(*) FROM videos WHERE $$x$$ = 'x'",
+    # алиас колонки с именем системной таблицы не делает её разрешённой
+    "SELECT max(query) AS query FROM pg_stat_activity AS pg_stat_activity",
+    "SELECT max(passwd) AS passwd, 1 AS pg_shadow FROM pg_shadow",
+    "SELECT count(*) AS pg_settings FROM pg_settings",
+    "SELECT (SELECT max(usename) AS usename FROM pg_user) AS pg_user FROM videos",
+    "SELECT COUNT(*) FROM videos pg_shadow, pg_shadow",
+    "SELECT (SELECT max(passwd) FROM videos x, pg_shadow) FROM videos pg_shadow",
+    # без RECURSIVE имя CTE внутри его тела — настоящая таблица
+    "WITH pg_shadow AS (SELECT passwd FROM pg_shadow) SELECT COUNT(*) FROM pg_shadow, videos",
+    "SELECT (WITH pg_user AS (SELECT id FROM videos) SELECT COUNT(*) FROM pg_user)",
+    # тип в cast(... AS тип) проверяется так же, как после ::
+    "SELECT count(*) FROM videos WHERE id = cast(1 as regclass)",
+    # алиас не разрешает выражение, которое он называет
+    "SELECT current_user AS current_user FROM videos",
+    "SELECT pg_backend_pid AS pg_backend_pid FROM videos",
+    "SELECT x FROM (SELECT 1 AS current_schema FROM videos) t, videos WHERE current_schema = 'x'",
+]
+
+HEAVY = "SELECT COUNT(*) FROM video_snapshots a, video_snapshots b, video_snapshots c"
+SLOW = "SELECT COUNT(*) FROM video_snapshots a, video_snapshots b"
+
+NORMAL = [
+    "SELECT COUNT(*) FROM videos",
+    "SELECT COALESCE(SUM(s.delta_views_count), 0) FROM video_snapshots s "
+    "JOIN videos v ON v.id = s.video_id WHERE s.created_at >= '2025-11-05' AND s.created_at < '2025-11-06'",
+    "SELECT EXTRACT(HOUR FROM created_at) AS h FROM video_snapshots "
+    "GROUP BY h ORDER BY SUM(delta_views_count) DESC LIMIT 1",
+    "WITH t AS (SELECT creator_id, COUNT(*) AS n FROM videos GROUP BY creator_id) SELECT MAX(n) FROM t;",
+    "SELECT COUNT(*) FROM videos v, (SELECT video_id FROM video_snapshots GROUP BY video_id) AS s "
+    "WHERE s.video_id = v.id",
+    "WITH a AS (SELECT id FROM videos), b AS (SELECT a.id FROM a JOIN videos v ON v.id = a.id) "
+    "SELECT COUNT(*) FROM b",
+    "SELECT COUNT(*) FROM videos WHERE video_created_at >= CAST('2025-11-01' AS timestamp with time zone)",
+    "SELECT n FROM (SELECT creator_id, COUNT(*) AS n FROM videos GROUP BY creator_id) AS t ORDER BY n DESC LIMIT 1",
+]
+
+
+def check(name: str, ok: bool, details: str) -> bool:
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {details}")
+    return ok
+
+
+def main() -> int:
+    results = []
+
+    for sql in REJECTED_BY_VALIDATION:
+        try:
+            validate_sql(sql)
+            results.append(check("reject", False, f"accepted {sql!r}"))
+        except SqlRejected as e:
+            results.append(check("reject", True, f"{e} — {sql[:50]!r}"))
+
+    try:
+        run_guarded(validate_sql(HEAVY))
+        results.append(check("cost limit", False, "heavy plan was executed"))
+    except SqlRejected as e:
+        results.append(check("cost limit", True, str(e)))
+
+    started = time.perf_counter()
+    try:
+        run_guarded(validate_sql(SLOW), check_cost=False)
+        results.append(check("timeout", False, "slow query finished"))
+    except errors.QueryCanceled:
+        elapsed = time.perf_counter() - started
+        results.append(check(
+            "timeout", elapsed < FALLBACK_STATEMENT_TIMEOUT_MS / 1000 + 1,
+            f"cancelled after {elapsed:.2f}s (limit {FALLBACK_STATEMENT_TIMEOUT_MS} ms)",
+        ))
+
+    for sql in NORMAL:
+        value, cost = run_guarded(validate_sql(sql))
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                expected = cur.fetchone()[0]
+        results.append(check("normal", value == expected, f"{value} (cost {cost:.0f}) — {sql[:50]!r}"))
+
+    cache = FallbackSqlCache()
+    question = "Сколько видео у самого активного креатора?"
+    runs = 50
+    started = time.perf_counter()
+    for _ in range(runs):
+        sql = validate_sql(NORMAL[-1])
+        run_guarded(sql)
+    first = (time.perf_counter() - started) / runs * 1000
+    cache.put(question, sql)
+    started = time.perf_counter()
+    for _ in range(runs):
+        run_guarded(cache.get("  сколько видео у самого   активного креатора? "), check_cost=False)
+    repeat = (time.perf_counter() - started) / runs * 1000
+    print(f"\nvalidate + EXPLAIN + run {first:.2f} ms, cached repeat {repeat:.2f} ms (plus the model call skipped)")
+
+    db.close_pool()
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
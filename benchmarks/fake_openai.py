@@ -0,0 +1,85 @@
+"""
+Локальный фейковый OpenAI Responses API для проверок и бенчмарков без сети.
+
+  server = FakeOpenAI(latency=0.2)
+  await server.start()
+  os.environ["OPENAI_BASE_URL"] = server.base_url
+
+Ответ задаётся функцией respond(system_prompt, user_text) -> str.
+По умолчанию: для разбора запроса — {"query_type": "total_videos"},
+для генерации SQL — SELECT COUNT(*) FROM videos.
+"""
+import json
+import asyncio
+import itertools
+
+from aiohttp import web
+
+
+def default_respond(system_prompt: str, user_text: str) -> str:
+    if "JSON" in system_prompt:
+        return json.dumps({"query_type": "total_videos"})
+    return "SELECT COUNT(*) FROM videos;"
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.0, respond=default_respond, fail_first: int = 0):
+        self.latency = latency
+        self.respond = respond
+        # сколько первых запросов ответить 500, чтобы проверить повторы
+        self.fail_first = fail_first
+
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/v1/responses", self._responses)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _responses(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return web.json_response({"error": {"message": "fake failure"}}, status=500)
+
+            messages = {m["role"]: m["content"] for m in body["input"]}
+            text = self.respond(messages.get("system", ""), messages.get("user", ""))
+            n = next(self._ids)
+            return web.json_response({
+                "id": f"resp_{n}",
+                "object": "response",
+                "created_at": 0,
+                "model": body.get("model", "fake"),
+                "status": "completed",
+                "output": [{
+                    "type": "message",
+                    "id": f"msg_{n}",
+                    "status": "completed",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}],
+                }],
+                "parallel_tool_calls": False,
+                "tool_choice": "auto",
+                "tools": [],
+            })
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,89 @@
+"""
+Локальный фейковый Telegram Bot API для нагрузочных тестов без сети.
+
+  server = FakeTelegram(global_rate=30, chat_interval=1.0)
+  await server.start()
+  env["TELEGRAM_API_URL"] = server.base_url
+
+Принимает sendMessage, запоминает сообщения по чатам со временем получения.
+Лимиты как у Telegram: чаще chat_interval в один чат или больше global_rate
+сообщений в секунду всего — 429 с parameters.retry_after.
+"""
+import time
+import asyncio
+import itertools
+from collections import deque, defaultdict
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0, global_rate: float = 30, chat_interval: float = 1.0, retry_after: int = 1):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.retry_after = retry_after
+
+        # chat_id → [(время получения, текст)]
+        self.messages: dict[int, list[tuple[float, str]]] = defaultdict(list)
+        self.requests = 0
+        self.too_many = 0
+        self._last_chat: dict[int, float] = {}
+        self._recent: deque[float] = deque()
+        self._ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._method)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _limited(self, chat_id: int, now: float) -> bool:
+        # небольшой допуск: таймеры отправителя и сервера не совпадают до миллисекунд
+        if now - self._last_chat.get(chat_id, float("-inf")) < self.chat_interval * 0.9:
+            return True
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        return len(self._recent) >= self.global_rate * 1.1
+
+    async def _method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = await request.post()
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = int(form["chat_id"])
+        now = time.monotonic()
+        if self._limited(chat_id, now):
+            self.too_many += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        self._last_chat[chat_id] = now
+        self._recent.append(now)
+        self.messages[chat_id].append((now, form["text"]))
+        return web.json_response({
+            "ok": True,
+            "result": {
+                "message_id": next(self._ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": form["text"],
+            },
+        })
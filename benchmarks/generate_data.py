@@ -0,0 +1,198 @@
+"""
+Детерминированный генератор videos со снапшотами в формате data/videos.json.
+
+Модель данных:
+  - креаторы с весами по Ципфу (--skew): немногие выпускают большую часть видео;
+  - у видео «виральность» из логнормального распределения (тот же --skew
+    как сигма), прирост просмотров в час затухает с возрастом видео;
+  - снапшоты раз в час от публикации, длина истории ~ экспоненциальная со
+    средним --snapshots часов и обрезается концом периода;
+  - с вероятностью --negative-rate прирост метрики отрицательный
+    (пересчёт, удалённые лайки), но счётчик не уходит ниже нуля.
+
+Каждое видео генерируется своим Random(seed, номер видео), поэтому
+результат не зависит от --parts и --workers: разбиение на части и
+параллельная генерация дают те же строки.
+
+  python benchmarks/generate_data.py data/videos.json --videos 10000
+  python benchmarks/generate_data.py data/gen --videos 10000000 --parts 64 --workers 8   # data/gen/part-000.jsonl ...
+
+Части в JSONL грузятся как есть: python load_data.py data/gen/part-*.jsonl --workers 8 --shard-by file
+"""
+import json
+import math
+import random
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+START = "2025-11-01"
+DAYS = 30
+CREATORS = 1000
+SKEW = 1.1
+SNAPSHOTS = 24
+NEGATIVE_RATE = 0.03
+# за сколько часов прирост просмотров падает в e раз
+DECAY_HOURS = 36.0
+
+
+def creator_ids(seed: int, creators: int) -> list[str]:
+    rng = random.Random(seed)
+    return [f"{rng.getrandbits(128):032x}" for _ in range(creators)]
+
+
+def creator_weights(creators: int, skew: float) -> list[float]:
+    """
+    Накопленные веса Ципфа для random.choices(cum_weights=...).
+    """
+    total = 0.0
+    cum = []
+    for k in range(1, creators + 1):
+        total += 1.0 / k ** skew
+        cum.append(total)
+    return cum
+
+
+def _step(rng: random.Random, expected: float, total: int, negative_rate: float) -> int:
+    if total > 0 and rng.random() < negative_rate:
+        return -rng.randint(1, max(1, min(total, int(expected * 0.2) + 1)))
+    return max(0, round(rng.gauss(expected, math.sqrt(expected) + 0.5)))
+
+
+def make_video(
+    i: int,
+    seed: int,
+    creators: list[str],
+    cum_weights: list[float],
+    start: datetime,
+    days: int = DAYS,
+    skew: float = SKEW,
+    snapshots: int = SNAPSHOTS,
+    negative_rate: float = NEGATIVE_RATE,
+) -> dict:
+    rng = random.Random(seed * 1_000_003 + i)
+    end = start + timedelta(days=days)
+    published = start + timedelta(seconds=rng.randrange(days * 86400))
+    hours = min(max(1, int(rng.expovariate(1 / snapshots))), int((end - published).total_seconds() // 3600))
+
+    virality = 100 * rng.lognormvariate(0, skew)
+    like_rate = rng.uniform(0.01, 0.08)
+    comment_rate = rng.uniform(0.001, 0.01)
+    video_id = f"{rng.getrandbits(128):032x}"
+
+    views = likes = comments = reports = 0
+    rows = []
+    ts = published
+    for h in range(1, hours + 1):
+        ts = published + timedelta(hours=h)
+        expected = virality * math.exp(-h / DECAY_HOURS)
+        dv = _step(rng, expected, views, negative_rate)
+        dl = _step(rng, max(dv, 0) * like_rate, likes, negative_rate)
+        dc = _step(rng, max(dv, 0) * comment_rate, comments, negative_rate)
+        dr = 1 if rng.random() < 0.002 else (-1 if reports and rng.random() < negative_rate * 0.1 else 0)
+        views, likes, comments, reports = views + dv, likes + dl, comments + dc, reports + dr
+        stamp = ts.isoformat()
+        rows.append({
+            "id": f"{rng.getrandbits(128):032x}", "video_id": video_id,
+            "views_count": views, "likes_count": likes, "comments_count": comments, "reports_count": reports,
+            "delta_views_count": dv, "delta_likes_count": dl,
+            "delta_comments_count": dc, "delta_reports_count": dr,
+            "created_at": stamp, "updated_at": stamp,
+        })
+
+    return {
+        "id": video_id,
+        "creator_id": rng.choices(creators, cum_weights=cum_weights)[0],
+        "video_created_at": published.isoformat(),
+        "views_count": views, "likes_count": likes, "comments_count": comments, "reports_count": reports,
+        "created_at": published.isoformat(), "updated_at": ts.isoformat(),
+        "snapshots": rows,
+    }
+
+
+def write_part(path: Path, first: int, last: int, seed: int, config: dict, as_json: bool) -> tuple[int, int]:
+    """
+    Видео с номерами [first; last) в path. Возвращает (видео, снапшотов).
+    """
+    creators = creator_ids(seed, config["creators"])
+    cum = creator_weights(config["creators"], config["skew"])
+    start = datetime.fromisoformat(config["start"]).replace(tzinfo=timezone.utc)
+    params = {k: config[k] for k in ("days", "skew", "snapshots", "negative_rate")}
+
+    snapshots = 0
+    with path.open("w", encoding="utf-8") as f:
+        if as_json:
+            f.write('{"videos": [\n')
+        for i in range(first, last):
+            video = make_video(i, seed, creators, cum, start, **params)
+            snapshots += len(video["snapshots"])
+            if as_json and i > first:
+                f.write(",\n")
+            f.write(json.dumps(video, ensure_ascii=False))
+            if not as_json:
+                f.write("\n")
+        if as_json:
+            f.write("\n]}\n")
+    return last - first, snapshots
+
+
+def generate(
+    out: Path,
+    videos: int,
+    seed: int = 1,
+    parts: int = 1,
+    workers: int = 1,
+    start: str = START,
+    days: int = DAYS,
+    creators: int = CREATORS,
+    skew: float = SKEW,
+    snapshots: int = SNAPSHOTS,
+    negative_rate: float = NEGATIVE_RATE,
+) -> tuple[list[Path], int, int]:
+    """
+    Один файл out (*.json, parts=1) или каталог out с part-NNN.jsonl.
+    Возвращает (файлы, видео, снапшотов).
+    """
+    config = {"start": start, "days": days, "creators": creators, "skew": skew,
+              "snapshots": snapshots, "negative_rate": negative_rate}
+    out = Path(out)
+    if parts == 1 and out.suffix == ".json":
+        out.parent.mkdir(parents=True, exist_ok=True)
+        jobs = [(out, 0, videos)]
+    else:
+        out.mkdir(parents=True, exist_ok=True)
+        bounds = [videos * k // parts for k in range(parts + 1)]
+        jobs = [(out / f"part-{k:03d}.jsonl", bounds[k], bounds[k + 1]) for k in range(parts)]
+    as_json = out.suffix == ".json"
+
+    if workers == 1:
+        counts = [write_part(path, a, b, seed, config, as_json) for path, a, b in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(write_part, path, a, b, seed, config, as_json) for path, a, b in jobs]
+            counts = [f.result() for f in futures]
+
+    return [path for path, _, _ in jobs], sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Синтетические videos со снапшотами")
+    parser.add_argument("out", type=Path, help="файл *.json или каталог для part-NNN.jsonl")
+    parser.add_argument("--videos", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--parts", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--start", default=START, help="первый день периода, YYYY-MM-DD (UTC)")
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--creators", type=int, default=CREATORS)
+    parser.add_argument("--skew", type=float, default=SKEW, help="показатель Ципфа для креаторов и сигма виральности")
+    parser.add_argument("--snapshots", type=int, default=SNAPSHOTS, help="средняя длина истории видео в часах")
+    parser.add_argument("--negative-rate", type=float, default=NEGATIVE_RATE)
+    args = parser.parse_args()
+
+    paths, n_videos, n_snapshots = generate(
+        args.out, args.videos, args.seed, args.parts, args.workers,
+        args.start, args.days, args.creators, args.skew, args.snapshots, args.negative_rate,
+    )
+    print(f"{len(paths)} файл(ов), videos: {n_videos}, snapshots: {n_snapshots}")
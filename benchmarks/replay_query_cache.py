@@ -0,0 +1,147 @@
+"""
+Прогон корпуса формулировок через nlp.parse_user_query с кэшем.
+
+Вместо модели — заглушка, которая для каждого текста возвращает эталонный
+разбор из корпуса (то, что вернул бы некэшированный вызов). Скрипт
+проверяет, что ответ из кэша для каждой формулировки совпадает с эталоном,
+и печатает hit rate. Код возврата 1 при любом расхождении.
+
+  python benchmarks/replay_query_cache.py
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "replay")
+os.environ["NLP_CACHE_PATH"] = ""
+
+import nlp
+from query_cache import QueryCache
+
+CORPUS = [
+    ("Сколько всего видео есть в системе?", {"query_type": "total_videos"}),
+    ("сколько  всего видео есть в системе", {"query_type": "total_videos"}),
+    (
+        "Сколько видео у креатора с id aca1061a9d324ecf8c3fa2bb32d7be63 вышло с 1 ноября 2025 по 5 ноября 2025 включительно?",
+        {"query_type": "creator_videos_in_date_range", "creator_id": "aca1061a9d324ecf8c3fa2bb32d7be63",
+         "date_from": "2025-11-01", "date_to": "2025-11-05"},
+    ),
+    (
+        "Сколько видео у креатора с id 8b76e572635b400c9052286a56176e03 вышло с 3 декабря 2025 по 17 декабря 2025 включительно?",
+        {"query_type": "creator_videos_in_date_range", "creator_id": "8b76e572635b400c9052286a56176e03",
+         "date_from": "2025-12-03", "date_to": "2025-12-17"},
+    ),
+    (
+        "Сколько видео у креатора с id aca1061a9d324ecf8c3fa2bb32d7be63 вышло с 1 по 5 ноября 2025 включительно?",
+        {"query_type": "creator_videos_in_date_range", "creator_id": "aca1061a9d324ecf8c3fa2bb32d7be63",
+         "date_from": "2025-11-01", "date_to": "2025-11-05"},
+    ),
+    (
+        "Сколько видео у креатора с id Creator42x вышло с 10 по 20 октября 2025 включительно?",
+        {"query_type": "creator_videos_in_date_range", "creator_id": "Creator42x",
+         "date_from": "2025-10-10", "date_to": "2025-10-20"},
+    ),
+    (
+        "Сколько видео набрало больше 100 000 просмотров за всё время?",
+        {"query_type": "videos_with_min_views", "views_threshold": 100000},
+    ),
+    (
+        "Сколько видео набрало больше 5000 просмотров за всё время?",
+        {"query_type": "videos_with_min_views", "views_threshold": 5000},
+    ),
+    (
+        "Сколько видео набрало больше 10 тысяч просмотров за всё время?",
+        {"query_type": "videos_with_min_views", "views_threshold": 10000},
+    ),
+    (
+        "Сколько видео набрало больше 2 тысяч просмотров за всё время?",
+        {"query_type": "videos_with_min_views", "views_threshold": 2000},
+    ),
+    (
+        "Сколько видео получали новые просмотры 28 ноября 2025 года?",
+        {"query_type": "videos_with_new_views_on_date", "date": "2025-11-28"},
+    ),
+    (
+        "Сколько разных видео получали новые просмотры 27 ноября 2025?",
+        {"query_type": "videos_with_new_views_on_date", "date": "2025-11-27"},
+    ),
+    (
+        "Сколько разных видео получали новые просмотры 2025-11-29?",
+        {"query_type": "videos_with_new_views_on_date", "date": "2025-11-29"},
+    ),
+    (
+        "Сколько разных видео получали новые просмотры 30 ноября 2025?",
+        {"query_type": "videos_with_new_views_on_date", "date": "2025-11-30"},
+    ),
+    (
+        "Сколько замеров с отрицательным приростом лайков было 28 ноября 2025?",
+        {"query_type": "snapshots_with_negative_delta", "metric": "likes", "date": "2025-11-28"},
+    ),
+    (
+        "Сколько замеров с отрицательным приростом лайков было 1 декабря 2025?",
+        {"query_type": "snapshots_with_negative_delta", "metric": "likes", "date": "2025-12-01"},
+    ),
+    (
+        "Сколько замеров с отрицательным приростом просмотров?",
+        {"query_type": "snapshots_with_negative_delta", "metric": "views", "date": None},
+    ),
+    (
+        "На сколько выросли просмотры видео креатора cd87be38b50b4fdd8342bb3c383f3c7d 28 ноября 2025 с 10:00 до 15:00?",
+        {"query_type": "creator_views_delta_in_time_range", "creator_id": "cd87be38b50b4fdd8342bb3c383f3c7d",
+         "date": "2025-11-28", "time_from": "10:00", "time_to": "15:00"},
+    ),
+    (
+        "На сколько выросли просмотры видео креатора 6f1c0b7e2a 29 ноября 2025 с 9:00 до 12:30?",
+        {"query_type": "creator_views_delta_in_time_range", "creator_id": "6f1c0b7e2a",
+         "date": "2025-11-29", "time_from": "09:00", "time_to": "12:30"},
+    ),
+    (
+        "Сколько видео у креатора a1b2c3d4e5 набрали больше 1000 просмотров?",
+        {"query_type": "creator_videos_with_min_views", "creator_id": "a1b2c3d4e5", "views_threshold": 1000},
+    ),
+    (
+        "Сколько видео у креатора f9e8d7c6b5 набрали больше 250 просмотров?",
+        {"query_type": "creator_videos_with_min_views", "creator_id": "f9e8d7c6b5", "views_threshold": 250},
+    ),
+    # дату модель вычисляет сама — такой ответ кэшировать нельзя
+    (
+        "Сколько разных видео получали новые просмотры вчера?",
+        {"query_type": "videos_with_new_views_on_date", "date": "2026-10-17"},
+    ),
+]
+
+LLM_LATENCY = 0.001
+
+
+def main() -> int:
+    expected = {text: desc for text, desc in CORPUS}
+    llm_calls = []
+
+    def fake_llm(user_text: str) -> dict:
+        llm_calls.append(user_text)
+        time.sleep(LLM_LATENCY)
+        return dict(expected[user_text])
+
+    nlp._parse_with_llm = fake_llm
+    nlp.query_cache = QueryCache(max_size=100, ttl=0, path=None)
+
+    failures = 0
+    for text, desc in CORPUS:
+        got = nlp.parse_user_query(text)
+        if got != desc:
+            failures += 1
+            print(f"MISMATCH: {text}\n  expected {desc}\n  got      {got}")
+
+    stats = nlp.query_cache.stats()
+    print(
+        f"{len(CORPUS)} questions, {len(llm_calls)} model calls, "
+        f"hit rate {stats['hit_rate']:.0%}, uncacheable {stats['uncacheable']}, "
+        f"mismatches {failures}"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,261 +1,404 @@
 import os
+import time
 import asyncio
+import logging
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandStart
 from aiogram.types import Message
 
-import psycopg2
 from dotenv import load_dotenv
+from psycopg2 import errors
 
 load_dotenv()
 
 
-from nlp import parse_user_query, nl_to_sql 
+import db
+import nlp
+import metrics
+from backends import ROUTES, close_backends, get_backend
+from batch import execute_batch
+from nlp import aresolve_user_query, anl_to_sql, query_cache, route_stats
+from queries import MULTI_MAX_QUERIES, MULTI_TYPE, NON_SCALAR_TYPES, plan_multi
+from render import render_multi, render_result
+from result_cache import ResultCache, RESULT_CACHE_POLL, cache_key
+from sql_guard import FallbackSqlCache, SqlRejected, run_guarded, validate_sql
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-DB_DSN = os.getenv("DB_DSN", "dbname=video_analytics")
+# сколько вопросов принимает /batch за раз
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "40"))
+# свой Bot API сервер (локальный telegram-bot-api, фейк для нагрузочных тестов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+# сколько соединений пула открыть при прогреве
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
 
-if not BOT_TOKEN:
-    raise RuntimeError("Не задан BOT_TOKEN в .env")
+log = logging.getLogger("bot")
 
-
-def get_conn():
-    return psycopg2.connect(DB_DSN)
-
-
-bot = Bot(BOT_TOKEN)
+_bot: Bot | None = None
 dp = Dispatcher()
+results = ResultCache()
+fallback_sql = FallbackSqlCache()
+# sender.Sender в воркерах webhook.py: ответы идут через очередь с лимитами;
+# None — прямой message.answer, как при polling
+sender = None
+
+
+def get_bot() -> Bot:
+    """
+    Bot создаётся при первом обращении: обработчики можно импортировать
+    и вызывать без BOT_TOKEN (бенчмарки, проверки).
+    """
+    global _bot
+    if _bot is None:
+        if not BOT_TOKEN:
+            raise RuntimeError("Не задан BOT_TOKEN в .env")
+        _bot = Bot(
+            BOT_TOKEN,
+            session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+        )
+    return _bot
+
+metrics.collector("bot_parse_route_total", "counter", "Чем разобран вопрос", lambda: dict(route_stats), "route")
+metrics.collector(
+    "bot_query_cache_lookups_total", "counter", "Кэш разбора запросов",
+    lambda: {k: query_cache.stats()[k] for k in ("hits", "misses")}, "result",
+)
+metrics.collector(
+    "bot_result_cache_lookups_total", "counter", "Кэш результатов",
+    lambda: {k: results.stats()[k] for k in ("hits", "misses")}, "result",
+)
+metrics.collector("bot_result_cache_entries", "gauge", "Записей в кэше результатов", lambda: results.stats()["entries"])
+metrics.collector("bot_data_version", "gauge", "Версия данных из data_changes", lambda: results.stats()["version"] or 0)
 
 
 @dp.message(CommandStart())
 async def cmd_start(message: Message):
-    await message.answer(
+    await _send(
+        message,
         "Привет! Я бот для аналитики по видео.\n"
         "Задавай вопросы вроде:\n"
         "• Сколько всего видео есть в системе?\n"
         "• Сколько видео у креатора с id ... вышло с 1 ноября 2025 по 5 ноября 2025 включительно?\n"
         "• На сколько просмотров в сумме выросли все видео 28 ноября 2025?\n"
+        "• Как росли просмотры по часам 28 ноября 2025?\n"
+        "• Топ 10 видео по приросту лайков за неделю 3 ноября 2025\n"
+        "Можно спросить несколько вещей в одном сообщении — отвечу списком.\n"
+        "Несколько вопросов сразу — /batch и по вопросу на строку.\n"
     )
 
 
-def execute_query(query_desc: dict) -> int:
-    qt = query_desc.get("query_type")
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-
-            if qt == "total_videos":
-                cur.execute("SELECT COUNT(*) FROM videos;")
-                count = cur.fetchone()[0]
-                print("[DEBUG total_videos] count =", count)
-                return count
-
-            elif qt == "creator_videos_with_min_views":
-                creator_id = query_desc["creator_id"]
-                threshold = query_desc["views_threshold"]
-                print(f"[DEBUG creator_videos_with_min_views] creator_id={creator_id}, threshold={threshold}")
-
-                cur.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM videos
-                    WHERE creator_id = %s
-                      AND views_count > %s;
-                    """,
-                    (creator_id, threshold),
-                )
-                count = cur.fetchone()[0]
-                print("[DEBUG creator_videos_with_min_views] count =", count)
-                return count
-
-            elif qt == "creator_videos_in_date_range":
-                creator_id = query_desc["creator_id"]
-                date_from = query_desc["date_from"]
-                date_to = query_desc["date_to"]
-
-                print(
-                    f"[DEBUG] creator_videos_in_date_range creator_id={creator_id}, "
-                    f"date_from={date_from}, date_to={date_to}"
-                )
-
-                cur.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM videos
-                    WHERE creator_id = %s
-                      AND video_created_at::date BETWEEN %s AND %s;
-                    """,
-                    (creator_id, date_from, date_to),
-                )
-                count = cur.fetchone()[0]
-                print("[DEBUG] count =", count)
-                return count
-
-            elif qt == "videos_with_min_views":
-                threshold = query_desc["views_threshold"]
-                cur.execute(
-                    """
-                    SELECT COUNT(*)
-                    FROM videos
-                    WHERE views_count > %s;
-                    """,
-                    (threshold,),
-                )
-                return cur.fetchone()[0]
-
-            elif qt == "videos_with_new_views_on_date":
-                date = query_desc["date"]
-                cur.execute(
-                    """
-                    SELECT COUNT(DISTINCT video_id)
-                    FROM video_snapshots
-                    WHERE created_at::date = %s
-                      AND delta_views_count > 0;
-                    """,
-                    (date,),
-                )
-                return cur.fetchone()[0]
-
-            elif qt == "sum_views_for_videos_in_date_range":
-                date_from = query_desc["date_from"]
-                date_to = query_desc["date_to"]
-                print(f"[DEBUG sum_views_for_videos_in_date_range] {date_from}..{date_to}")
-
-                cur.execute(
-                    """
-                    SELECT COALESCE(SUM(views_count), 0)
-                    FROM videos
-                    WHERE video_created_at::date BETWEEN %s AND %s;
-                    """,
-                    (date_from, date_to),
-                )
-                total = cur.fetchone()[0]
-                print("[DEBUG sum_views_for_videos_in_date_range] total =", total)
-                return total
-
-            elif qt == "snapshots_with_negative_delta":
-                metric = query_desc["metric"]
-                date = query_desc.get("date")
-
-                column_map = {
-                    "views": "delta_views_count",
-                    "likes": "delta_likes_count",
-                    "comments": "delta_comments_count",
-                    "reports": "delta_reports_count",
-                }
-                col = column_map.get(metric)
-                if not col:
-                    return 0
-
-                if date:
-                    query = f"""
-                        SELECT COUNT(*)
-                        FROM video_snapshots
-                        WHERE {col} < 0
-                          AND created_at::date = %s;
-                    """
-                    params = (date,)
-                else:
-                    query = f"""
-                        SELECT COUNT(*)
-                        FROM video_snapshots
-                        WHERE {col} < 0;
-                    """
-                    params = ()
-
-                cur.execute(query, params)
-                count = cur.fetchone()[0]
-                print("[DEBUG snapshots_with_negative_delta] count =", count)
-                return count
-
-            elif qt == "creator_views_delta_in_time_range":
-                creator_id = query_desc["creator_id"]
-                date = query_desc["date"]
-                time_from = query_desc["time_from"]
-                time_to = query_desc["time_to"]
-
-                dt_from = f"{date} {time_from}:00"
-                dt_to = f"{date} {time_to}:00"
-
-                print(
-                    f"[DEBUG creator_views_delta_in_time_range] creator_id={creator_id}, "
-                    f"dt_from={dt_from}, dt_to={dt_to}"
-                )
-
-                cur.execute(
-                    """
-                    SELECT COALESCE(SUM(s.delta_views_count), 0)
-                    FROM video_snapshots AS s
-                    JOIN videos AS v ON v.id = s.video_id
-                    WHERE v.creator_id = %s
-                      AND s.created_at >= %s
-                      AND s.created_at <= %s;
-                    """,
-                    (creator_id, dt_from, dt_to),
-                )
-                total = cur.fetchone()[0]
-                print("[DEBUG creator_views_delta_in_time_range] total =", total)
-                return total
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message):
+    stats = query_cache.stats()
+    cached = results.stats()
+    fallback = fallback_sql.stats()
+    await _send(
+        message,
+        f"Кэш разбора запросов: {stats['entries']} шаблонов\n"
+        f"Попаданий: {stats['hits']}, промахов: {stats['misses']} "
+        f"({stats['hit_rate']:.0%})\n"
+        f"Вызовов модели: {stats['llm_calls']}, "
+        f"сэкономлено ≈{stats['saved_seconds']:.1f} с\n"
+        f"Разобрано правилами: {route_stats['rules']}, из кэша: {route_stats['cache']}, "
+        f"моделью: {route_stats['llm']}\n"
+        f"Кэш результатов: {cached['entries']} записей, "
+        f"попаданий {cached['hits']}, промахов {cached['misses']} ({cached['hit_rate']:.0%}), "
+        f"сброшено {cached['invalidated']}, версия данных {cached['version']}\n"
+        f"Проверенный SQL фолбэка: {fallback['entries']} вопросов, "
+        f"повторов {fallback['hits']}, отклонено {fallback['rejected']}"
+    )
 
-            else:
-                print("[WARN] unknown query_type:", qt)
-                return 0
+
+@dp.message(Command("batch"))
+async def cmd_batch(message: Message):
+    """
+    /batch и дальше по вопросу на строку — ответы одним запросом к базе.
+    """
+    questions = [line.strip() for line in message.text.splitlines()[1:] if line.strip()]
+    if not questions:
+        await _send(message, "Напиши после /batch вопросы, по одному на строку.")
+        return
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        await _send(message, f"Не больше {BATCH_MAX_QUESTIONS} вопросов за раз.")
+        return
+
+    with metrics.trace(route="batch", query_type="batch", questions=len(questions)):
+        await _handle_batch(message, questions)
+
+
+async def _handle_batch(message: Message, questions: list[str]):
+    with metrics.span("parse"):
+        resolved = await asyncio.gather(*(aresolve_user_query(q) for q in questions), return_exceptions=True)
+    descs = []
+    for q, r in zip(questions, resolved):
+        if isinstance(r, Exception):
+            log.error("aresolve_user_query: %r", r)
+            descs.append(None)
+        else:
+            log.debug("batch/%s %s %s", r[1], q, r[0])
+            descs.append(r[0] if r[0].get("query_type") not in (None, "unknown") else None)
+
+    # ряды и лидеры в пакет не входят: ответ на них — не одно число
+    answers = {
+        i: "не одно число, спроси отдельным сообщением"
+        for i, d in enumerate(descs)
+        if d is not None and d.get("query_type") in NON_SCALAR_TYPES
+    }
+    descs = [None if i in answers else d for i, d in enumerate(descs)]
+    known = [d for d in descs if d is not None]
+    try:
+        values = iter(await db.run(execute_batch, known) if known else [])
+    except db.PoolExhausted:
+        metrics.tag(outcome="overloaded")
+        await _send(message, "Сервер сейчас перегружен, попробуй чуть позже.")
+        return
+    except Exception as e:
+        log.error("execute_batch: %r", e)
+        metrics.tag(outcome="error")
+        await _send(message, "Ошибка при выполнении запроса к базе.")
+        return
+
+    lines = []
+    for i, (q, d) in enumerate(zip(questions, descs), 1):
+        answer = next(values) if d is not None else answers.get(i - 1, "не понял вопрос")
+        lines.append(f"{i}. {q[:60]} — {answer}")
+    await _send(message, "\n".join(lines))
+
+
+async def _send(message: Message, text: str, **kwargs):
+    with metrics.span("send"):
+        if sender is not None:
+            sender.send(message.chat.id, text, **kwargs)
+        else:
+            await message.answer(text, **kwargs)
 
 
 @dp.message(F.text)
 async def handle_any_text(message: Message):
+    with metrics.trace():
+        await _handle_text(message)
+
+
+async def _handle_text(message: Message):
     user_text = message.text.strip()
-    print("[USER]", user_text)
+    log.debug("user: %s", user_text)
 
     # 1. Пытаемся через query_type
     try:
-        query_desc = parse_user_query(user_text)
-        print("[QUERY_DESC]", query_desc)
+        with metrics.span("parse"):
+            query_desc, source = await aresolve_user_query(user_text)
+        metrics.tag(route=source, query_type=query_desc.get("query_type") or "unknown")
+        log.debug("query_desc/%s: %s", source, query_desc)
     except Exception as e:
-        print("ERROR parse_user_query:", repr(e))
+        log.error("aresolve_user_query: %r", e)
         query_desc = None
 
+    if query_desc and query_desc.get("query_type") == MULTI_TYPE:
+        await _handle_multi(message, query_desc["queries"])
+        return
+
     if query_desc and query_desc.get("query_type") not in (None, "unknown"):
         try:
-            result = execute_query(query_desc)
-            print("[RESULT]", result)
-            await message.answer(str(result))
+            with metrics.span("result_cache"):
+                result = results.get(query_desc, memory_only=True)
+            metrics.tag(result_cache="hit" if result is not None else "miss")
+            if result is None:
+                # SQLite-файл кэша (если есть) и сам запрос — в потоке, не в event loop
+                result = await db.run(results.execute if results.path else results.compute, query_desc)
+            log.debug("result: %s", result)
+            if query_desc["query_type"] in NON_SCALAR_TYPES:
+                for part in render_result(query_desc["query_type"], result):
+                    await _send(message, part, parse_mode="HTML")
+            else:
+                await _send(message, str(result))
+            return
+        except db.PoolExhausted:
+            metrics.tag(outcome="overloaded")
+            await _send(message, "Сервер сейчас перегружен, попробуй чуть позже.")
             return
         except Exception as e:
-            print("ERROR execute_query:", repr(e))
-            await message.answer("Ошибка при выполнении запроса к базе.")
+            log.error("execute_query: %r", e)
+            metrics.tag(outcome="error")
+            await _send(message, "Ошибка при выполнении запроса к базе.")
+            return
+
+    # 2. Фолбэк: SQL от модели, только после проверки и с ограничениями
+    metrics.tag(route="fallback", query_type="fallback")
+    sql = fallback_sql.get(user_text)
+    checked = sql is not None
+    if not checked:
+        try:
+            sql = await anl_to_sql(user_text, db.DB_DSN)
+            log.debug("fallback sql: %s", sql)
+        except Exception as e:
+            log.error("anl_to_sql: %r", e)
+            metrics.tag(outcome="error")
+            await _send(message, "Не смог разобрать запрос, попробуй переформулировать.")
+            return
+
+        try:
+            sql = validate_sql(sql)
+        except SqlRejected as e:
+            log.info("fallback rejected: %s", e, extra={"sql": sql})
+            fallback_sql.record_rejected()
+            metrics.tag(outcome="rejected")
+            await _send(message, "Не смог составить безопасный SQL-запрос для этого вопроса.")
             return
 
     try:
-        sql = nl_to_sql(user_text, DB_DSN)
-        print("[FALLBACK SQL]", sql)
+        with metrics.span("fallback_sql"):
+            value, cost = await db.run(run_guarded, sql, not checked)
+    except SqlRejected as e:
+        log.info("fallback rejected: %s", e, extra={"sql": sql})
+        fallback_sql.record_rejected()
+        metrics.tag(outcome="rejected")
+        await _send(message, "Запрос получается слишком тяжёлым, попробуй сузить условия, например период.")
+        return
+    except errors.QueryCanceled:
+        log.warning("fallback timeout", extra={"sql": sql})
+        metrics.tag(outcome="timeout")
+        await _send(message, "Запрос выполнялся слишком долго, попробуй сузить условия, например период.")
+        return
+    except db.PoolExhausted:
+        metrics.tag(outcome="overloaded")
+        await _send(message, "Сервер сейчас перегружен, попробуй чуть позже.")
+        return
     except Exception as e:
-        print("ERROR nl_to_sql:", repr(e))
-        await message.answer("Не смог разобрать запрос, попробуй переформулировать.")
+        log.error("executing fallback SQL: %r", e, extra={"sql": sql})
+        metrics.tag(outcome="error")
+        await _send(message, "Ошибка при выполнении запроса к базе.")
         return
 
-    if not sql.lower().lstrip().startswith("select"):
-        await message.answer("Не смог составить безопасный SQL-запрос для этого вопроса.")
+    if not checked:
+        fallback_sql.put(user_text, sql)
+    log.debug("fallback result: %s, cost=%s", value, cost)
+    await _send(message, str(value))
+
+
+async def _handle_multi(message: Message, queries: list[dict]):
+    """
+    Несколько вопросов в одном сообщении. Каждый подзапрос сначала ищется
+    в кэше результатов; остальные делятся на группы queries.plan_multi —
+    группа считается одним проходом по таблице, группы идут параллельно на пуле.
+    """
+    if len(queries) > MULTI_MAX_QUERIES:
+        await _send(message, f"Не больше {MULTI_MAX_QUERIES} вопросов в одном сообщении.")
         return
 
+    known = [i for i, d in enumerate(queries) if d.get("query_type") not in (None, "unknown")]
+    values: dict[int, object] = {}
+    with metrics.span("result_cache"):
+        for i in known:
+            value = results.get(queries[i], memory_only=True)
+            if value is not None:
+                values[i] = value
+    missing = [i for i in known if i not in values]
+    if missing and results.path:
+        stored = await asyncio.to_thread(results.get_many, [queries[i] for i in missing])
+        values.update((i, value) for i, value in zip(missing, stored) if value is not None)
+        missing = [i for i in missing if i not in values]
+    metrics.tag(result_cache="miss" if missing else "hit", questions=len(queries))
+
+    # одинаковые подзапросы считаются один раз
+    first: dict[str, int] = {}
+    for i in missing:
+        first.setdefault(cache_key(queries[i]), i)
+    todo = list(first.values())
+
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql)
-                row = cur.fetchone()
-                value = row[0] if row and row[0] is not None else 0
+        groups = plan_multi([queries[i] for i in todo])
+        computed = await asyncio.gather(
+            *(db.run(results.compute_group, [queries[todo[j]] for j in group]) for group in groups),
+            return_exceptions=True,
+        )
+        for group, group_values in zip(groups, computed):
+            if isinstance(group_values, Exception):
+                raise group_values
+            for j, value in zip(group, group_values):
+                values[todo[j]] = value
+    except db.PoolExhausted:
+        metrics.tag(outcome="overloaded")
+        await _send(message, "Сервер сейчас перегружен, попробуй чуть позже.")
+        return
     except Exception as e:
-        print("ERROR executing fallback SQL:", repr(e))
-        await message.answer("Ошибка при выполнении запроса к базе.")
+        log.error("execute_query: %r", e)
+        metrics.tag(outcome="error")
+        await _send(message, "Ошибка при выполнении запроса к базе.")
         return
 
-    print("[RESULT/FALLBACK]", value)
-    await message.answer(str(value))
+    for i in missing:
+        values[i] = values[first[cache_key(queries[i])]]
+    log.debug("multi: %d queries, %d groups, %d from cache", len(queries), len(groups), len(known) - len(missing))
+    for part in render_multi(queries, [values.get(i) for i in range(len(queries))]):
+        await _send(message, part, parse_mode="HTML")
+
+
+async def refresh_results():
+    """
+    Раз в RESULT_CACHE_POLL секунд дочитывать журнал изменений данных.
+    """
+    while True:
+        await asyncio.sleep(RESULT_CACHE_POLL)
+        try:
+            await db.run(results.refresh)
+        except Exception as e:
+            log.error("result cache refresh: %r", e)
+
+
+async def warm_up():
+    """
+    Прогрев в фоне после старта: соединения пула, версия данных кэша
+    результатов, бэкенды запросов и клиент модели. Всё это и так создаётся
+    при первом использовании — прогрев убирает задержку с первых вопросов,
+    обработчики его не ждут.
+    """
+    started = time.perf_counter()
+
+    async def pool():
+        opened = await asyncio.to_thread(db.warm_up, WARMUP_CONNECTIONS)
+        # без версии данных кэш результатов считает всё устаревшим
+        await db.run(results.refresh)
+        return opened
+
+    async def backends():
+        for name in set(ROUTES.values()):
+            await asyncio.to_thread(get_backend, name)
+
+    async def llm():
+        if not os.getenv("OPENAI_API_KEY"):
+            log.warning("OPENAI_API_KEY не задан: вопросы вне правил и кэша разобрать не получится")
+            return
+        await asyncio.to_thread(nlp.get_async_client)
+
+    opened, *failures = await asyncio.gather(pool(), backends(), llm(), return_exceptions=True)
+    for e in (opened, *failures):
+        if isinstance(e, Exception):
+            log.error("warm-up: %r", e)
+    log.info(
+        "warm-up done",
+        extra={"connections": opened if isinstance(opened, int) else 0,
+               "ms": round((time.perf_counter() - started) * 1000, 1)},
+    )
 
 
 async def main():
-    await dp.start_polling(bot)
+    metrics.setup_logging()
+    server = metrics.start_http_server()
+    refresher = asyncio.create_task(refresh_results())
+    warming = asyncio.create_task(warm_up())
+    try:
+        await dp.start_polling(get_bot())
+    finally:
+        warming.cancel()
+        refresher.cancel()
+        if server is not None:
+            server.shutdown()
+        close_backends()
+        db.close_pool()
+        query_cache.flush()
+        metrics.stop_logging()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+import metrics
+
+DB_DSN = os.getenv("DB_DSN", "dbname=video_analytics")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# сколько свободных соединений держать открытыми (не больше DB_POOL_MAX);
+# DB_POOL_MIN — сколько открыть при старте
+DB_POOL_KEEP = int(os.getenv("DB_POOL_KEEP", str(DB_POOL_MAX)))
+# таймаут одного запроса (SET LOCAL statement_timeout), мс
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+# сколько ждём свободное соединение, прежде чем отказать пользователю, сек
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "2"))
+# соединение, простоявшее дольше этого, проверяем через SELECT 1, сек
+DB_HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "UTC")
+
+log = logging.getLogger("db")
+
+
+class PoolExhausted(RuntimeError):
+    """Все соединения заняты дольше DB_ACQUIRE_TIMEOUT."""
+
+
+class DbPool:
+    """
+    Пул psycopg2-соединений + ограниченный пул потоков для вызова из asyncio.
+
+    Блокирующие вызовы БД уходят в executor, поэтому event loop бота
+    не замирает, пока идёт один запрос. Потоков ровно столько же,
+    сколько соединений, а сверх этого запросы ждут не дольше
+    acquire_timeout и получают PoolExhausted.
+    """
+
+    def __init__(
+        self,
+        dsn: str = DB_DSN,
+        minconn: int = DB_POOL_MIN,
+        maxconn: int = DB_POOL_MAX,
+        keepconn: int = DB_POOL_KEEP,
+        statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS,
+        acquire_timeout: float = DB_ACQUIRE_TIMEOUT,
+        healthcheck_interval: float = DB_HEALTHCHECK_INTERVAL,
+        timezone: str = DB_TIMEZONE,
+    ):
+        self.dsn = dsn
+        self.maxconn = maxconn
+        self.statement_timeout_ms = statement_timeout_ms
+        self.acquire_timeout = acquire_timeout
+        self.healthcheck_interval = healthcheck_interval
+
+        self._pool = ThreadedConnectionPool(
+            minconn, maxconn, dsn, options=f"-c TimeZone={timezone}"
+        )
+        # после старта minconn у psycopg2 значит одно: возвращённое соединение
+        # сверх него закрывается, и при параллельных запросах каждый открывал
+        # бы новое подключение. Порог для этого — отдельная настройка keepconn
+        self._pool.minconn = max(minconn, min(keepconn, maxconn))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used: dict[int, float] = {}
+        self._executor = ThreadPoolExecutor(max_workers=maxconn, thread_name_prefix="db")
+        self._async_slots: asyncio.Semaphore | None = None
+
+    def _checkout(self):
+        conn = self._pool.getconn()
+        idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if conn.closed or idle > self.healthcheck_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+            except psycopg2.Error:
+                log.warning("dropping broken pooled connection")
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        return conn
+
+    @contextmanager
+    def connection(self, statement_timeout_ms: int | None = None):
+        """
+        Соединение из пула на одну транзакцию.
+
+        Коммит при успехе, откат при исключении; statement_timeout
+        выставляется через SET LOCAL и действует только в этой транзакции.
+        """
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolExhausted("нет свободных соединений с БД")
+
+        conn = None
+        broken = False
+        try:
+            conn = self._checkout()
+            metrics.observe_span("acquire", time.perf_counter() - started)
+            timeout_ms = statement_timeout_ms or self.statement_timeout_ms
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s;", (timeout_ms,))
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if conn is not None:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn, close=broken or bool(conn.closed))
+            self._slots.release()
+
+    def warm_up(self, connections: int) -> int:
+        """
+        Открыть заранее до connections соединений (не больше maxconn),
+        чтобы первые запросы не ждали подключения. Возвращает, сколько
+        соединений было взято из пула одновременно.
+        """
+        taken = []
+        try:
+            for _ in range(min(connections, self.maxconn)):
+                if not self._slots.acquire(blocking=False):
+                    break
+                try:
+                    taken.append(self._checkout())
+                except BaseException:
+                    self._slots.release()
+                    raise
+        finally:
+            for conn in taken:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+                self._slots.release()
+        return len(taken)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Выполнить блокирующую функцию fn в пуле потоков БД.
+
+        Если все слоты заняты дольше acquire_timeout — PoolExhausted,
+        вместо бесконечной очереди в executor. fn выполняется в копии
+        контекста вызывающего: спаны из потока попадают в его metrics.trace.
+        """
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.maxconn)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise PoolExhausted("нет свободных соединений с БД") from None
+        metrics.observe_span("db_queue", time.perf_counter() - started)
+
+        try:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, partial(context.run, fn, *args, **kwargs))
+        finally:
+            self._async_slots.release()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._pool.closeall()
+
+
+_pool: DbPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> DbPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DbPool()
+    return _pool
+
+
+def connection(statement_timeout_ms: int | None = None):
+    return get_pool().connection(statement_timeout_ms)
+
+
+async def run(fn, *args, **kwargs):
+    return await get_pool().run(fn, *args, **kwargs)
+
+
+def warm_up(connections: int) -> int:
+    return get_pool().warm_up(connections)
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -1,52 +1,839 @@
+import io
+import os
+import csv
 import json
+import time
+import zlib
+import argparse
 import psycopg2
 from pathlib import Path
+from zoneinfo import ZoneInfo
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 
-DB_DSN = "dbname=video_analytics"
+import rollups
+import snapbin
+import partitions
+import result_cache
+import parquet_export
+
+DB_DSN = os.getenv("DB_DSN", "dbname=video_analytics")
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "UTC")
 JSON_PATH = Path("data/videos.json")
+# сколько строк (videos + snapshots) копим в памяти до одного COPY
+BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", "50000"))
+READ_CHUNK_SIZE = 1 << 20
+# --incremental: сколько часов до водяного знака перечитывать — запас на снапшоты,
+# которые пришли в файл позже соседних
+INGEST_LOOKBACK_HOURS = float(os.getenv("INGEST_LOOKBACK_HOURS", "2"))
+DELTA_MODES = ("derive", "verify", "trust")
 
+# вторичные индексы из migrations/001_init.sql и 004_query_indexes.sql; при --drop-indexes
+# удаляются на время загрузки и строятся заново в конце
+SECONDARY_INDEXES = {
+    "idx_videos_creator_created_at":
+        "CREATE INDEX IF NOT EXISTS idx_videos_creator_created_at ON videos (creator_id, video_created_at);",
+    "idx_videos_views":
+        "CREATE INDEX IF NOT EXISTS idx_videos_views ON videos (views_count);",
+    "idx_snapshots_created_at":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_created_at ON video_snapshots (created_at);",
+    "idx_snapshots_delta_views":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_delta_views ON video_snapshots (delta_views_count);",
+    "idx_videos_created_at_views":
+        "CREATE INDEX IF NOT EXISTS idx_videos_created_at_views ON videos (video_created_at) INCLUDE (views_count);",
+    "idx_snapshots_video_created_at":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_video_created_at "
+        "ON video_snapshots (video_id, created_at) INCLUDE (delta_views_count);",
+    "idx_snapshots_positive_views":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_positive_views "
+        "ON video_snapshots (created_at, video_id) WHERE delta_views_count > 0;",
+    "idx_snapshots_negative_views":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_negative_views "
+        "ON video_snapshots (created_at) WHERE delta_views_count < 0;",
+    "idx_snapshots_negative_likes":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_negative_likes "
+        "ON video_snapshots (created_at) WHERE delta_likes_count < 0;",
+    "idx_snapshots_negative_comments":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_negative_comments "
+        "ON video_snapshots (created_at) WHERE delta_comments_count < 0;",
+    "idx_snapshots_negative_reports":
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_negative_reports "
+        "ON video_snapshots (created_at) WHERE delta_reports_count < 0;",
+}
 
-def load_data():
-    with JSON_PATH.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+VIDEO_COLUMNS = (
+    "id", "creator_id", "video_created_at",
+    "views_count", "likes_count", "comments_count", "reports_count",
+    "created_at", "updated_at",
+)
+SNAPSHOT_COLUMNS = (
+    "id", "video_id",
+    "views_count", "likes_count", "comments_count", "reports_count",
+    "delta_views_count", "delta_likes_count", "delta_comments_count", "delta_reports_count",
+    "created_at", "updated_at",
+)
+TEXT_COLUMNS = ("id", "creator_id", "video_id")
+
+
+def iter_videos(path: Path = JSON_PATH, chunk_size: int = READ_CHUNK_SIZE):
+    """
+    Потоково отдаёт элементы массива "videos" из {"videos": [...]}.
+
+    В памяти держим только текущий кусок файла и одно видео со снапшотами,
+    как ijson.items(f, "videos.item"), но без внешней зависимости.
+    """
+    decoder = json.JSONDecoder()
+
+    with Path(path).open("r", encoding="utf-8") as f:
+        buf = ""
+        pos = -1
+        while pos < 0:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError(f"{path}: не найден массив \"videos\"")
+            buf += chunk
+            key = buf.find('"videos"')
+            if key >= 0:
+                bracket = buf.find("[", key)
+                if bracket >= 0:
+                    pos = bracket + 1
+
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f"{path}: массив \"videos\" не закрыт")
+                buf, pos = buf[pos:], 0
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf += chunk
+                continue
+
+            if buf[pos] == "]":
+                return
+
+            try:
+                video, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                buf, pos = buf[pos:], 0
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf += chunk
+                continue
+
+            yield video
+            pos = end
+
+
+def iter_videos_jsonl(path: Path, start: int = 0, end: int | None = None):
+    """
+    Видео из JSONL (одно видео на строку) в байтовом диапазоне [start, end).
+
+    Строка принадлежит диапазону, в котором она начинается. Вместе с видео
+    отдаётся смещение следующей строки — его и пишем в чекпоинт.
+    """
+    with Path(path).open("rb") as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+
+        while end is None or f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            if line.strip():
+                yield json.loads(line), f.tell()
+
+
+def connect():
+    # тот же часовой пояс сессии, что у бота: от него зависят границы дней в агрегатах
+    return psycopg2.connect(DB_DSN, options=f"-c TimeZone={DB_TIMEZONE}")
+
+
+def video_row(v: dict) -> tuple:
+    return tuple(v[c] for c in VIDEO_COLUMNS)
+
+
+def snapshot_row(s: dict) -> tuple:
+    return tuple(s[c] for c in SNAPSHOT_COLUMNS)
+
+
+def copy_rows(cur, table: str, columns: tuple, rows: list[tuple]):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buf,
+    )
+
+
+def create_staging_tables(cur):
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS staging_videos
+            (LIKE videos INCLUDING DEFAULTS);
+        CREATE TEMP TABLE IF NOT EXISTS staging_snapshots
+            (LIKE video_snapshots INCLUDING DEFAULTS);
+        CREATE TEMP TABLE IF NOT EXISTS snapshot_base
+            (LIKE video_snapshots INCLUDING DEFAULTS);
+        """
+    )
+    # для .snapbin: время приходит микросекундами от эпохи и переводится на сервере
+    for table, columns in (("staging_videos_epoch", VIDEO_COLUMNS), ("staging_snapshots_epoch", SNAPSHOT_COLUMNS)):
+        cur.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {table} ("
+            + ", ".join(f"{c} {'TEXT' if c in TEXT_COLUMNS else 'BIGINT'}" for c in columns)
+            + ");"
+        )
+    rollups.create_new_snapshots_table(cur)
+
+
+def copy_staging(cur, videos_rows: list[tuple], snapshots_rows: list[tuple], epoch: bool = False):
+    if not epoch:
+        copy_rows(cur, "staging_videos", VIDEO_COLUMNS, videos_rows)
+        copy_rows(cur, "staging_snapshots", SNAPSHOT_COLUMNS, snapshots_rows)
+        return
+
+    for table, columns, rows in (
+        ("staging_videos", VIDEO_COLUMNS, videos_rows),
+        ("staging_snapshots", SNAPSHOT_COLUMNS, snapshots_rows),
+    ):
+        copy_rows(cur, f"{table}_epoch", columns, rows)
+        values = ", ".join(
+            f"'epoch'::timestamptz + {c} * interval '1 microsecond'" if c in snapbin.TIMESTAMP_COLUMNS else c
+            for c in columns
+        )
+        cur.execute(
+            f"""
+            INSERT INTO {table} ({', '.join(columns)}) SELECT {values} FROM {table}_epoch;
+            TRUNCATE {table}_epoch;
+            """
+        )
+
+
+def ensure_partitions(cur):
+    # для секционированной video_snapshots недостающие секции создаются
+    # до вставки, чтобы строки не оседали в DEFAULT
+    if partitions.is_partitioned(cur):
+        cur.execute("SELECT MIN(created_at), MAX(created_at) FROM staging_snapshots;")
+        lo, hi = cur.fetchone()
+        if lo is not None:
+            partitions.ensure_range(cur, lo, hi)
+
+
+def merge_snapshots(cur) -> tuple:
+    """
+    staging_snapshots → video_snapshots через ON CONFLICT DO NOTHING.
+    Реально вставленные снапшоты добавляются в агрегаты; возвращает
+    (MIN(created_at), MAX(created_at), COUNT(*)) вставленных.
+    """
+    cur.execute(
+        f"""
+        WITH inserted AS (
+            INSERT INTO video_snapshots ({', '.join(SNAPSHOT_COLUMNS)})
+            SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM staging_snapshots
+            ON CONFLICT DO NOTHING
+            RETURNING video_id, created_at,
+                      delta_views_count, delta_likes_count,
+                      delta_comments_count, delta_reports_count
+        )
+        INSERT INTO new_snapshots SELECT * FROM inserted;
+
+        TRUNCATE staging_videos, staging_snapshots;
+
+        SELECT MIN(created_at), MAX(created_at), COUNT(*) FROM new_snapshots;
+        """
+    )
+    snapshots_changed = cur.fetchone()
+
+    rollups.apply_new_snapshots(cur)
+    cur.execute("TRUNCATE new_snapshots;")
+    return snapshots_changed
+
+
+def flush_batch(cur, videos_rows: list[tuple], snapshots_rows: list[tuple], epoch: bool = False):
+    """
+    COPY пачки в staging-таблицы и слияние в основные через ON CONFLICT.
+    Реально вставленные снапшоты (без дублей) добавляются в агрегаты,
+    их диапазоны дат — в журнал data_changes для кэша результатов.
+    epoch — время в строках микросекундами от эпохи (из .snapbin).
+    """
+    copy_staging(cur, videos_rows, snapshots_rows, epoch)
+    ensure_partitions(cur)
+
+    cur.execute(
+        f"""
+        WITH inserted AS (
+            INSERT INTO videos ({', '.join(VIDEO_COLUMNS)})
+            SELECT {', '.join(VIDEO_COLUMNS)} FROM staging_videos
+            ON CONFLICT (id) DO NOTHING
+            RETURNING video_created_at
+        )
+        SELECT MIN(video_created_at), MAX(video_created_at), COUNT(*) FROM inserted;
+        """
+    )
+    videos_changed = cur.fetchone()
+    snapshots_changed = merge_snapshots(cur)
+    result_cache.record_changes(cur, [("videos", *videos_changed), ("video_snapshots", *snapshots_changed)])
+
+
+COUNTERS = ("views_count", "likes_count", "comments_count", "reports_count")
+DELTAS = tuple(f"delta_{c}" for c in COUNTERS)
+
+# delta_* новых снапшотов от предыдущего: последнего сохранённого (snapshot_base)
+# или предыдущего в пачке; у первого снапшота видео предыдущий — нули
+DERIVED_DELTAS_SQL = f"""
+    WITH chain AS (
+        SELECT id, video_id, created_at, {', '.join(COUNTERS)} FROM staging_snapshots
+        UNION ALL
+        SELECT id, video_id, created_at, {', '.join(COUNTERS)} FROM snapshot_base
+    ), derived AS (
+        SELECT id, {', '.join(f"{c} - COALESCE(LAG({c}) OVER w, 0) AS delta_{c}" for c in COUNTERS)}
+        FROM chain
+        WINDOW w AS (PARTITION BY video_id ORDER BY created_at, id)
+    )
+"""
+DELTAS_DIFFER = f"({', '.join('s.' + d for d in DELTAS)}) IS DISTINCT FROM ({', '.join('d.' + d for d in DELTAS)})"
+
+
+def flush_incremental(
+    cur,
+    videos_rows: list[tuple],
+    snapshots_rows: list[tuple],
+    deltas: str = "derive",
+    epoch: bool = False,
+) -> dict:
+    """
+    Инкрементальное слияние пачки:
+      - videos: новые вставляются, у существующих обновляются счётчики,
+        если они изменились и входная строка не старше сохранённой;
+      - снапшоты добавляются только новее последнего сохранённого снапшота
+        своего видео — повторная загрузка того же файла ничего не меняет;
+      - delta_* пересчитываются от предыдущего снапшота (deltas="derive"),
+        только сверяются (verify) или берутся из входа как есть (trust).
+    Возвращает счётчики затронутых строк; epoch — как у flush_batch.
+    """
+    copy_staging(cur, videos_rows, snapshots_rows, epoch)
+    ensure_partitions(cur)
+
+    changed = ", ".join(f"videos.{c}" for c in (*COUNTERS, "updated_at"))
+    excluded = ", ".join(f"EXCLUDED.{c}" for c in (*COUNTERS, "updated_at"))
+    cur.execute(
+        f"""
+        WITH upserted AS (
+            INSERT INTO videos ({', '.join(VIDEO_COLUMNS)})
+            SELECT DISTINCT ON (id) {', '.join(VIDEO_COLUMNS)} FROM staging_videos
+            ORDER BY id, updated_at DESC
+            ON CONFLICT (id) DO UPDATE
+            SET {', '.join(f"{c} = EXCLUDED.{c}" for c in (*COUNTERS, "updated_at"))}
+            WHERE videos.updated_at <= EXCLUDED.updated_at
+              AND ({changed}) IS DISTINCT FROM ({excluded})
+            RETURNING video_created_at, xmax = 0 AS inserted
+        )
+        SELECT MIN(video_created_at), MAX(video_created_at), COUNT(*),
+               COUNT(*) FILTER (WHERE inserted)
+        FROM upserted;
+        """
+    )
+    *videos_changed, videos_inserted = cur.fetchone()
+
+    # последний сохранённый снапшот каждого видео пачки — индекс (video_id, created_at)
+    cur.execute(
+        """
+        INSERT INTO snapshot_base
+        SELECT last.*
+        FROM (SELECT DISTINCT video_id FROM staging_snapshots) v
+        CROSS JOIN LATERAL (
+            SELECT * FROM video_snapshots s
+            WHERE s.video_id = v.video_id
+            ORDER BY s.created_at DESC
+            LIMIT 1
+        ) last;
+        """
+    )
+    cur.execute(
+        """
+        DELETE FROM staging_snapshots a USING staging_snapshots b
+        WHERE a.id = b.id AND a.ctid > b.ctid;
+        """
+    )
+    skipped = cur.rowcount
+    # уже загруженные и запоздавшие: не новее последнего сохранённого снапшота видео
+    cur.execute(
+        """
+        DELETE FROM staging_snapshots s USING snapshot_base b
+        WHERE s.video_id = b.video_id AND s.created_at <= b.created_at;
+        """
+    )
+    skipped += cur.rowcount
+
+    fixed = 0
+    if deltas == "derive":
+        cur.execute(
+            f"""
+            {DERIVED_DELTAS_SQL}
+            UPDATE staging_snapshots s
+            SET {', '.join(f"{d} = d.{d}" for d in DELTAS)}
+            FROM derived d
+            WHERE s.id = d.id AND {DELTAS_DIFFER};
+            """
+        )
+        fixed = cur.rowcount
+    elif deltas == "verify":
+        cur.execute(
+            f"""
+            {DERIVED_DELTAS_SQL}
+            SELECT COUNT(*) FROM staging_snapshots s JOIN derived d ON d.id = s.id
+            WHERE {DELTAS_DIFFER};
+            """
+        )
+        fixed = cur.fetchone()[0]
+    cur.execute("TRUNCATE snapshot_base;")
+
+    snapshots_changed = merge_snapshots(cur)
+    result_cache.record_changes(cur, [("videos", *videos_changed), ("video_snapshots", *snapshots_changed)])
+    return {
+        "videos_inserted": videos_inserted,
+        "videos_updated": videos_changed[2] - videos_inserted,
+        "snapshots_inserted": snapshots_changed[2],
+        "snapshots_skipped": skipped,
+        # derive — исправлено, verify — не сошлось с пересчитанными
+        "deltas_mismatched": fixed,
+    }
+
+
+def shard_of(video_id: str, shards: int) -> int:
+    return zlib.crc32(video_id.encode()) % shards
+
+
+def plan_shards(paths: list[Path], workers: int, shard_by: str) -> list[dict]:
+    """
+    Разбиение входа на шарды:
+      file  — один шард на файл;
+      range — каждый JSONL-файл режется на workers байтовых диапазонов,
+              .snapbin — на workers диапазонов номеров видео;
+      hash  — workers шардов, шард k берёт видео с crc32(video_id) % workers == k.
+
+    .snapbin читается только через file и range: видео в нём уже лежат
+    вместе со своими снапшотами, деление по номерам даёт то же, что hash.
+    """
+    binary = [p.suffix == ".snapbin" for p in paths]
+    if any(binary) and shard_by == "hash":
+        if not all(binary):
+            raise ValueError(".snapbin и JSON в одной загрузке — только --shard-by file")
+        shard_by = "range"
+
+    if shard_by == "file":
+        return [
+            {"name": f"file:{p}", "paths": [p], **({"format": "snapbin"} if p.suffix == ".snapbin" else {})}
+            for p in paths
+        ]
+
+    if shard_by == "range":
+        shards = []
+        for p in paths:
+            if p.suffix == ".snapbin":
+                with snapbin.SnapBin(p) as sb:
+                    size = sb.videos
+                step = -(-size // workers)
+                shards += [
+                    {
+                        "name": f"range:{p}:{k}/{workers}",
+                        "paths": [p],
+                        "format": "snapbin",
+                        "start": k * step,
+                        "end": min((k + 1) * step, size),
+                    }
+                    for k in range(workers)
+                ]
+                continue
+            if p.suffix != ".jsonl":
+                raise ValueError(f"{p}: деление по байтам возможно только для .jsonl")
+            size = p.stat().st_size
+            step = -(-size // workers)
+            for k in range(workers):
+                shards.append({
+                    "name": f"range:{p}:{k}/{workers}",
+                    "paths": [p],
+                    "start": k * step,
+                    "end": min((k + 1) * step, size),
+                })
+        return shards
+
+    if shard_by == "hash":
+        return [
+            {"name": f"hash:{k}/{workers}", "paths": paths, "modulo": workers, "remainder": k}
+            for k in range(workers)
+        ]
 
-    videos = data["videos"]  
+    raise ValueError(f"неизвестный способ шардирования: {shard_by}")
+
+
+def iter_shard(shard: dict, position: int):
+    """
+    Видео шарда начиная с чекпоинта position.
+
+    Отдаёт (video, новая позиция): для range это байтовое смещение,
+    для остальных — число уже обработанных видео шарда.
+    """
+    if "start" in shard:
+        start = max(shard["start"], position)
+        yield from iter_videos_jsonl(shard["paths"][0], start, shard["end"])
+        return
+
+    seen = 0
+    for p in shard["paths"]:
+        videos = (v for v, _ in iter_videos_jsonl(p)) if p.suffix == ".jsonl" else iter_videos(p)
+        for v in videos:
+            if "modulo" in shard and shard_of(v["id"], shard["modulo"]) != shard["remainder"]:
+                continue
+            seen += 1
+            if seen <= position:
+                continue
+            yield v, seen
+
+
+def read_checkpoint(cur, source: str, shard: str) -> tuple[int, bool]:
+    cur.execute(
+        "SELECT position, done FROM load_checkpoints WHERE source = %s AND shard = %s;",
+        (source, shard),
+    )
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (0, False)
+
+
+def save_checkpoint(cur, source: str, shard: str, position: int, videos: int, snapshots: int, done: bool = False):
+    cur.execute(
+        """
+        INSERT INTO load_checkpoints (source, shard, position, videos_loaded, snapshots_loaded, done, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, now())
+        ON CONFLICT (source, shard) DO UPDATE
+        SET position = EXCLUDED.position,
+            videos_loaded = load_checkpoints.videos_loaded + EXCLUDED.videos_loaded,
+            snapshots_loaded = load_checkpoints.snapshots_loaded + EXCLUDED.snapshots_loaded,
+            done = EXCLUDED.done,
+            updated_at = now();
+        """,
+        (source, shard, position, videos, snapshots, done),
+    )
+
+
+def parse_ts(value) -> datetime:
+    ts = datetime.fromisoformat(value)
+    # без смещения — как PostgreSQL: в часовом поясе сессии
+    return ts if ts.tzinfo else ts.replace(tzinfo=ZoneInfo(DB_TIMEZONE))
+
+
+def iter_snapbin(shard: dict, position: int, batch_size: int):
+    """
+    Пачки строк шарда .snapbin с чекпоинта position (номер видео):
+    (videos_rows, snapshots_rows, новая позиция), время — микросекунды от эпохи.
+    """
+    with snapbin.SnapBin(shard["paths"][0]) as sb:
+        start = max(shard.get("start", 0), position)
+        yield from sb.batches(start, shard.get("end", sb.videos), batch_size)
+
+
+def filter_epoch_rows(videos_rows: list[tuple], snapshots_rows: list[tuple], cutoff: datetime | None, stats: dict):
+    """
+    То же, что отбор по cutoff в load_shard, для строк из .snapbin.
+    """
+    created_at = SNAPSHOT_COLUMNS.index("created_at")
+    updated_at = VIDEO_COLUMNS.index("updated_at")
+    if snapshots_rows:
+        latest = snapbin.from_epoch_us(max(r[created_at] for r in snapshots_rows))
+        if stats["max_created_at"] is None or latest > stats["max_created_at"]:
+            stats["max_created_at"] = latest
+    if cutoff is None:
+        return videos_rows, snapshots_rows
+
+    cutoff_us = (cutoff - snapbin.EPOCH) // timedelta(microseconds=1)
+    fresh = [r for r in snapshots_rows if r[created_at] > cutoff_us]
+    stats["filtered"] += len(snapshots_rows) - len(fresh)
+    touched = {r[1] for r in fresh}
+    return [v for v in videos_rows if v[0] in touched or v[updated_at] > cutoff_us], fresh
+
+
+def read_watermark(cur, feed: str) -> datetime | None:
+    cur.execute("SELECT watermark FROM ingest_watermarks WHERE feed = %s;", (feed,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def save_watermark(cur, feed: str, watermark: datetime, videos_touched: int, snapshots_inserted: int):
+    cur.execute(
+        """
+        INSERT INTO ingest_watermarks (feed, watermark, runs, videos_touched, snapshots_inserted, updated_at)
+        VALUES (%s, %s, 1, %s, %s, now())
+        ON CONFLICT (feed) DO UPDATE
+        SET watermark = GREATEST(ingest_watermarks.watermark, EXCLUDED.watermark),
+            runs = ingest_watermarks.runs + 1,
+            videos_touched = EXCLUDED.videos_touched,
+            snapshots_inserted = EXCLUDED.snapshots_inserted,
+            updated_at = now();
+        """,
+        (feed, watermark, videos_touched, snapshots_inserted),
+    )
+
+
+def load_shard(
+    source: str,
+    shard: dict,
+    batch_size: int = BATCH_SIZE,
+    incremental: dict | None = None,
+) -> tuple[int, int, dict]:
+    """
+    Загрузка одного шарда на своём соединении.
+
+    Каждая пачка коммитится вместе с чекпоинтом в одной транзакции,
+    поэтому после обрыва загрузка продолжается с последней пачки.
+
+    incremental = {"cutoff": datetime | None, "deltas": режим} — пачки идут
+    через flush_incremental, снапшоты не новее cutoff отбрасываются при чтении,
+    видео без новых снапшотов и не обновлявшиеся после cutoff — тоже.
+    В stats — счётчики затронутых строк и самый поздний прочитанный снапшот.
+    """
+    conn = connect()
+    cur = conn.cursor()
+    create_staging_tables(cur)
+
+    position, done = read_checkpoint(cur, source, shard["name"])
+    if done:
+        conn.close()
+        return 0, 0, {}
+    if position:
+        print(f"[load {shard['name']}] продолжаем с позиции {position}")
 
     videos_rows = []
     snapshots_rows = []
+    total_videos = 0
+    total_snapshots = 0
+    stats = {"filtered": 0, "max_created_at": None}
+    started = time.perf_counter()
+    cutoff = incremental["cutoff"] if incremental else None
+    epoch = shard.get("format") == "snapbin"
 
-    for v in videos:
-        videos_rows.append(
-            (
-                v["id"],
-                v["creator_id"],
-                v["video_created_at"],
-                v["views_count"],
-                v["likes_count"],
-                v["comments_count"],
-                v["reports_count"],
-                v["created_at"],
-                v["updated_at"],
+    def flush():
+        nonlocal total_videos, total_snapshots
+        if incremental:
+            counts = flush_incremental(cur, videos_rows, snapshots_rows, incremental["deltas"], epoch)
+            for key, value in counts.items():
+                stats[key] = stats.get(key, 0) + value
+        else:
+            flush_batch(cur, videos_rows, snapshots_rows, epoch)
+        save_checkpoint(cur, source, shard["name"], position, len(videos_rows), len(snapshots_rows))
+        conn.commit()
+
+        total_videos += len(videos_rows)
+        total_snapshots += len(snapshots_rows)
+        videos_rows.clear()
+        snapshots_rows.clear()
+
+        elapsed = time.perf_counter() - started
+        rows = total_videos + total_snapshots
+        print(
+            f"[load {shard['name']}] videos: {total_videos}, snapshots: {total_snapshots}, "
+            f"{rows / elapsed:.0f} rows/s"
+        )
+
+    if epoch:
+        # .snapbin отдаёт готовые пачки строк, без разбора каждого видео
+        for batch_videos, batch_snapshots, position in iter_snapbin(shard, position, batch_size):
+            if incremental:
+                batch_videos, batch_snapshots = filter_epoch_rows(batch_videos, batch_snapshots, cutoff, stats)
+            videos_rows += batch_videos
+            snapshots_rows += batch_snapshots
+            if len(videos_rows) + len(snapshots_rows) >= batch_size:
+                flush()
+    else:
+        for v, position in iter_shard(shard, position):
+            snapshots = v["snapshots"]
+            if incremental:
+                stamps = [parse_ts(s["created_at"]) for s in snapshots]
+                if cutoff is not None:
+                    fresh = [s for s, ts in zip(snapshots, stamps) if ts > cutoff]
+                    stats["filtered"] += len(snapshots) - len(fresh)
+                    if not fresh and parse_ts(v["updated_at"]) <= cutoff:
+                        continue
+                    snapshots = fresh
+                if stamps:
+                    latest = max(stamps)
+                    if stats["max_created_at"] is None or latest > stats["max_created_at"]:
+                        stats["max_created_at"] = latest
+
+            videos_rows.append(video_row(v))
+            for s in snapshots:
+                snapshots_rows.append(snapshot_row(s))
+
+            if len(videos_rows) + len(snapshots_rows) >= batch_size:
+                flush()
+
+    if videos_rows or snapshots_rows:
+        flush()
+
+    save_checkpoint(cur, source, shard["name"], position, 0, 0, done=True)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return total_videos, total_snapshots, stats
+
+
+def drop_secondary_indexes():
+    with connect() as conn:
+        with conn.cursor() as cur:
+            for name in SECONDARY_INDEXES:
+                cur.execute(f"DROP INDEX IF EXISTS {name};")
+    conn.close()
+
+
+def create_secondary_indexes():
+    with connect() as conn:
+        with conn.cursor() as cur:
+            for name, ddl in SECONDARY_INDEXES.items():
+                print(f"[load] CREATE INDEX {name}")
+                cur.execute(ddl)
+    conn.close()
+
+
+def load_data(
+    paths: list[Path] | Path = JSON_PATH,
+    batch_size: int = BATCH_SIZE,
+    workers: int = 1,
+    shard_by: str = "hash",
+    drop_indexes: bool = False,
+    parquet_dir: Path | None = None,
+    incremental: bool = False,
+    feed: str = "default",
+    deltas: str = "derive",
+    lookback_hours: float = INGEST_LOOKBACK_HOURS,
+) -> dict:
+    """
+    Потоковая загрузка: память ограничена batch_size строк, а не размером файла.
+
+    При workers > 1 шарды грузятся параллельно в пуле процессов, у каждого
+    своё соединение. Незавершённая прошлая загрузка тех же файлов
+    с тем же разбиением продолжается с чекпоинтов.
+
+    С parquet_dir после загрузки перевыгружаются в Parquet месяцы снапшотов,
+    которые она изменила (для бэкенда duckdb).
+
+    Файлы .snapbin (snapbin.py) читаются через mmap готовыми столбцами,
+    без разбора JSON.
+
+    incremental — часовое обновление потока feed: читаются только снапшоты
+    новее его водяного знака минус lookback_hours, videos обновляются на месте,
+    delta_* по режиму deltas (см. flush_incremental). Файлы одного потока
+    передаются в хронологическом порядке; при workers > 1 — только shard_by="hash",
+    чтобы все снапшоты видео шли через один шард. В конце водяной знак
+    сдвигается на самый поздний прочитанный снапшот.
+    """
+    if incremental:
+        if deltas not in DELTA_MODES:
+            raise ValueError(f"неизвестный режим delta: {deltas}")
+        if workers > 1 and shard_by != "hash":
+            raise ValueError("параллельная инкрементальная загрузка — только с shard_by=\"hash\"")
+        if drop_indexes:
+            raise ValueError("инкрементальной загрузке нужен индекс (video_id, created_at)")
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    paths = [Path(p).resolve() for p in paths]
+    if incremental and workers > 1 and len(paths) > 1 and any(p.suffix == ".snapbin" for p in paths):
+        # .snapbin делится по номерам видео, одно видео из разных файлов попало бы в разные шарды
+        raise ValueError("параллельная инкрементальная загрузка .snapbin — по одному файлу за запуск")
+    shards = plan_shards(paths, workers, shard_by)
+    source = ",".join(str(p) for p in paths)
+
+    with connect() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT COUNT(*) FILTER (WHERE done), COUNT(*) FROM load_checkpoints "
+                "WHERE source = %s AND shard = ANY(%s);",
+                (source, [s["name"] for s in shards]),
             )
+            finished, known = cur.fetchone()
+            # прошлая загрузка завершилась целиком — это новая загрузка, а не продолжение
+            if known and finished == len(shards):
+                cur.execute("DELETE FROM load_checkpoints WHERE source = %s;", (source,))
+            start_version = parquet_export.current_version(cur)
+            watermark = read_watermark(cur, feed) if incremental else None
+    conn.close()
+
+    options = None
+    if incremental:
+        cutoff = watermark - timedelta(hours=lookback_hours) if watermark else None
+        options = {"cutoff": cutoff, "deltas": deltas}
+        print(f"[load] поток {feed}: водяной знак {watermark}, читаем снапшоты новее {cutoff}")
+
+    if drop_indexes:
+        drop_secondary_indexes()
+
+    if workers == 1:
+        results = [load_shard(source, s, batch_size, options) for s in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(load_shard, source, s, batch_size, options) for s in shards]
+            results = [f.result() for f in futures]
+
+    if drop_indexes:
+        create_secondary_indexes()
+
+    total_videos = sum(r[0] for r in results)
+    total_snapshots = sum(r[1] for r in results)
+    print(f"Загружено videos: {total_videos}, snapshots: {total_snapshots}")
+    summary = {"videos": total_videos, "snapshots": total_snapshots}
+
+    if incremental:
+        for key in ("filtered", "videos_inserted", "videos_updated",
+                    "snapshots_inserted", "snapshots_skipped", "deltas_mismatched"):
+            summary[key] = sum(r[2].get(key, 0) for r in results)
+        latest = [r[2]["max_created_at"] for r in results if r[2].get("max_created_at")]
+        new_watermark = max([*latest, *([watermark] if watermark else [])], default=None)
+        if new_watermark is not None:
+            with connect() as conn:
+                with conn.cursor() as cur:
+                    save_watermark(
+                        cur, feed, new_watermark,
+                        summary["videos_inserted"] + summary["videos_updated"], summary["snapshots_inserted"],
+                    )
+            conn.close()
+        summary["watermark"] = new_watermark
+        print(
+            f"Поток {feed}: videos +{summary['videos_inserted']} новых, {summary['videos_updated']} обновлено; "
+            f"snapshots +{summary['snapshots_inserted']}, уже были {summary['snapshots_skipped']}, "
+            f"до водяного знака {summary['filtered']}; "
+            f"delta_* {'исправлено' if deltas == 'derive' else 'не сошлось'}: {summary['deltas_mismatched']}; "
+            f"водяной знак {new_watermark}"
         )
 
+    if parquet_dir is not None:
+        parquet_export.export_parquet(parquet_dir, since_version=start_version)
+    return summary
+
+
+def load_data_executemany(path: Path = JSON_PATH):
+    """
+    Прежний способ загрузки: весь файл в память и executemany построчно.
+    Оставлен для сравнения в benchmarks/bench_load_data.py; агрегаты и data_changes не обновляет.
+    """
+    with Path(path).open("r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    videos = data["videos"]
+
+    videos_rows = []
+    snapshots_rows = []
+
+    for v in videos:
+        videos_rows.append(video_row(v))
         for s in v["snapshots"]:
-            snapshots_rows.append(
-                (
-                    s["id"],
-                    s["video_id"],  
-                    s["views_count"],
-                    s["likes_count"],
-                    s["comments_count"],
-                    s["reports_count"],
-                    s["delta_views_count"],
-                    s["delta_likes_count"],
-                    s["delta_comments_count"],
-                    s["delta_reports_count"],
-                    s["created_at"],
-                    s["updated_at"],
-                )
-            )
+            snapshots_rows.append(snapshot_row(s))
 
     conn = psycopg2.connect(DB_DSN)
     cur = conn.cursor()
@@ -73,7 +860,7 @@ def load_data():
             created_at, updated_at
         )
         VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        ON CONFLICT (id) DO NOTHING
+        ON CONFLICT DO NOTHING
         """,
         snapshots_rows,
     )
@@ -86,4 +873,32 @@ def load_data():
 
 
 if __name__ == "__main__":
-    load_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Загрузка videos.json / *.jsonl / *.snapbin в PostgreSQL")
+    parser.add_argument("paths", nargs="*", type=Path, default=[JSON_PATH])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--shard-by", choices=["hash", "file", "range"], default="hash")
+    parser.add_argument(
+        "--drop-indexes", action="store_true",
+        help="удалить вторичные индексы на время загрузки и построить заново в конце",
+    )
+    parser.add_argument(
+        "--parquet", type=Path, metavar="DIR",
+        help="после загрузки перевыгрузить изменённые месяцы в Parquet (бэкенд duckdb)",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="только снапшоты новее водяного знака, videos обновляются на месте",
+    )
+    parser.add_argument("--feed", default="default", help="имя потока для водяного знака (--incremental)")
+    parser.add_argument(
+        "--deltas", choices=DELTA_MODES, default="derive",
+        help="delta_* при --incremental: пересчитать от предыдущего снапшота, только сверить или взять из файла",
+    )
+    parser.add_argument("--lookback-hours", type=float, default=INGEST_LOOKBACK_HOURS)
+    args = parser.parse_args()
+
+    load_data(
+        args.paths, args.batch_size, args.workers, args.shard_by, args.drop_indexes, args.parquet,
+        args.incremental, args.feed, args.deltas, args.lookback_hours,
+    )
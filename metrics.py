@@ -0,0 +1,409 @@
+"""
+Метрики и структурированный лог бота.
+
+  - trace(): одно сообщение пользователя. Спаны внутри (parse, llm,
+    parse_cache, result_cache, acquire, sql, fallback_sql, send)
+    суммируются по имени и в конце попадают в гистограмму
+    bot_span_seconds{span, query_type} и в одну запись лога "message" —
+    с query_type, который стал известен только после разбора.
+    Контекст переживает db.run: задача в пуле потоков видит тот же trace.
+  - Counter / Histogram / collector(): счётчики в формате Prometheus,
+    отдаются по http://METRICS_HOST:METRICS_PORT/metrics из отдельного потока.
+  - setup_logging(): все логгеры пишут через QueueHandler, форматирование
+    и вывод — в потоке QueueListener, обработчик сообщения не ждёт stdout.
+  - slow_query(): запросы execute_query дольше SLOW_QUERY_MS — в логгер
+    slow_query с query_desc, SQL, параметрами и EXPLAIN (и в SLOW_QUERY_LOG).
+"""
+import os
+import json
+import time
+import queue
+import bisect
+import logging
+import threading
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# json — по строке JSON на запись, text — для чтения глазами
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# 0 — не поднимать HTTP-эндпоинт
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 — лог медленных запросов выключен
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# файл JSONL для медленных запросов; пусто — только в общий лог
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "")
+
+# границы корзин гистограмм, секунды
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger("bot.message")
+slow_log = logging.getLogger("slow_query")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_str(self.labels, k)} {v:g}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами; хранит счётчики по корзинам,
+    сумму и число наблюдений на каждый набор меток.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # корзины, +Inf, сумма, число
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def count(self, **labels) -> int:
+        counts = self._values.get(tuple(labels.get(n, "") for n in self.labels))
+        return counts[-1] if counts else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts in items:
+            total = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                total += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {total}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {counts[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+class _Collector:
+    """
+    Значения, которые уже считают другие модули (кэши, маршруты разбора):
+    fn() → число или {значение метки: число}.
+    """
+
+    def __init__(self, name: str, kind: str, help: str, fn, label: str | None = None):
+        self.name, self.kind, self.help, self.fn, self.label = name, kind, help, fn, label
+
+    def render(self) -> list[str]:
+        value = self.fn()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if isinstance(value, dict):
+            lines += [f"{self.name}{_label_str((self.label,), (k,))} {v:g}" for k, v in sorted(value.items())]
+        else:
+            lines.append(f"{self.name} {value:g}")
+        return lines
+
+
+REGISTRY: dict[str, object] = {}
+
+
+def _register(metric):
+    REGISTRY[metric.name] = metric
+    return metric
+
+
+def collector(name: str, kind: str, help: str, fn, label: str | None = None):
+    return _register(_Collector(name, kind, help, fn, label))
+
+
+MESSAGES = _register(Counter(
+    "bot_messages_total", "Сообщения пользователей", ("route", "query_type", "outcome"),
+))
+MESSAGE_SECONDS = _register(Histogram(
+    "bot_message_seconds", "Обработка сообщения целиком", ("route", "query_type"),
+))
+SPAN_SECONDS = _register(Histogram(
+    "bot_span_seconds", "Время этапа обработки сообщения", ("span", "query_type"),
+))
+SLOW_QUERIES = _register(Counter(
+    "bot_slow_queries_total", "Запросы execute_query дольше SLOW_QUERY_MS", ("query_type", "backend"),
+))
+LLM_RETRIES = _register(Counter(
+    "bot_llm_retries_total", "Повторы запроса к модели после ошибки", ("error",),
+))
+SENT_MESSAGES = _register(Counter(
+    "bot_sent_messages_total", "Вызовы sendMessage из sender.Sender",
+))
+COALESCED_MESSAGES = _register(Counter(
+    "bot_coalesced_messages_total", "Ответы, склеенные с предыдущим в одно сообщение",
+))
+SEND_RETRIES = _register(Counter(
+    "bot_send_retries_total", "Повторы и ошибки sendMessage", ("reason",),
+))
+WEBHOOK_UPDATES = _register(Counter(
+    "bot_webhook_updates_total", "Обновления, принятые webhook.py, по воркерам", ("worker",),
+))
+WEBHOOK_REJECTED = _register(Counter(
+    "bot_webhook_rejected_total", "Обновления, отклонённые с 503: очередь воркера полна", ("worker",),
+))
+
+
+def render() -> str:
+    lines = []
+    for metric in list(REGISTRY.values()):
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# ---------- спаны ----------
+
+_trace: ContextVar[dict | None] = ContextVar("trace", default=None)
+
+
+def observe_span(name: str, seconds: float, query_type: str | None = None):
+    """
+    Внутри trace — прибавить к спану сообщения, вне — сразу в гистограмму.
+    """
+    record = _trace.get()
+    if record is None:
+        SPAN_SECONDS.observe(seconds, span=name, query_type=query_type or "none")
+        return
+    spans = record["spans"]
+    spans[name] = spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str, query_type: str | None = None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_span(name, time.perf_counter() - started, query_type)
+
+
+def tag(**tags):
+    """
+    Метки текущего сообщения: query_type, route, outcome.
+    """
+    record = _trace.get()
+    if record is not None:
+        record["tags"].update(tags)
+
+
+@contextmanager
+def trace(**tags):
+    """
+    Одно сообщение: спаны копятся в record и в конце уходят в метрики и лог.
+    Исключение без outcome — outcome="error".
+    """
+    record = {"tags": {"route": "none", "query_type": "none", "outcome": "ok", **tags}, "spans": {}}
+    token = _trace.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record["tags"]["outcome"] = "error"
+        raise
+    finally:
+        _trace.reset(token)
+        total = time.perf_counter() - started
+        tags = record["tags"]
+        qt = tags["query_type"]
+        MESSAGES.inc(route=tags["route"], query_type=qt, outcome=tags["outcome"])
+        MESSAGE_SECONDS.observe(total, route=tags["route"], query_type=qt)
+        for name, seconds in record["spans"].items():
+            SPAN_SECONDS.observe(seconds, span=name, query_type=qt)
+        if log.isEnabledFor(logging.INFO):
+            log.info("message", extra={
+                **tags,
+                "total_ms": round(total * 1000, 3),
+                "spans_ms": {k: round(v * 1000, 3) for k, v in record["spans"].items()},
+            })
+
+
+def slow_query(query_desc: dict, sql: str, params, seconds: float, backend: str, explain=None):
+    """
+    Записать запрос в slow_query, если он дольше SLOW_QUERY_MS.
+    explain() вызывается только для медленных запросов.
+    """
+    if not SLOW_QUERY_MS or seconds * 1000 < SLOW_QUERY_MS:
+        return
+    qt = query_desc.get("query_type")
+    SLOW_QUERIES.inc(query_type=qt, backend=backend)
+    plan = None
+    if explain is not None:
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = f"EXPLAIN не выполнен: {e!r}"
+    slow_log.warning("slow query", extra={
+        "query_type": qt,
+        "backend": backend,
+        "duration_ms": round(seconds * 1000, 3),
+        "query_desc": query_desc,
+        "sql": " ".join(sql.split()),
+        "params": [str(p) for p in params],
+        "plan": plan,
+    })
+
+
+# ---------- лог ----------
+
+_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(_fields(record))
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={json.dumps(v, ensure_ascii=False, default=str)}" for k, v in fields.items())
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # форматирует уже поток слушателя; здесь только подставить args,
+        # пока объекты в них не изменились
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.msg = f"{record.msg}\n{record.exc_text}"
+            record.exc_info = None
+        return record
+
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, slow_path: str = SLOW_QUERY_LOG):
+    """
+    Корневой логгер → очередь → поток QueueListener → stderr (и SLOW_QUERY_LOG).
+    Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+    stream = logging.StreamHandler()
+    stream.setFormatter(formatter)
+    handlers = [stream]
+    if slow_path:
+        slow_file = logging.FileHandler(slow_path, encoding="utf-8")
+        slow_file.setFormatter(JsonFormatter())
+        slow_file.addFilter(lambda r: r.name == "slow_query")
+        handlers.append(slow_file)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [_QueueHandler(records)]
+    root.setLevel(level.upper())
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """
+    Дописать очередь и остановить поток слушателя.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+# ---------- HTTP ----------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer | None:
+    """
+    /metrics в фоновом потоке; port=0 — выключено.
+    """
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.getLogger("bot").info("metrics endpoint", extra={"url": f"http://{host}:{port}/metrics"})
+    return server
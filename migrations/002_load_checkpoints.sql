@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS load_checkpoints (
+    source            TEXT NOT NULL,
+    shard             TEXT NOT NULL,
+    position          BIGINT NOT NULL DEFAULT 0,
+    videos_loaded     BIGINT NOT NULL DEFAULT 0,
+    snapshots_loaded  BIGINT NOT NULL DEFAULT 0,
+    done              BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (source, shard)
+);
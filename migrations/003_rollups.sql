@@ -0,0 +1,44 @@
+-- Агрегаты по video_snapshots, которые load_data поддерживает инкрементально.
+-- Границы дней/часов — в часовом поясе сессии загрузчика (DB_TIMEZONE).
+
+-- видео × день
+CREATE TABLE IF NOT EXISTS video_daily_stats (
+    video_id                     TEXT NOT NULL,
+    day                          DATE NOT NULL,
+    snapshots                    BIGINT NOT NULL DEFAULT 0,
+    delta_views                  BIGINT NOT NULL DEFAULT 0,
+    delta_likes                  BIGINT NOT NULL DEFAULT 0,
+    delta_comments               BIGINT NOT NULL DEFAULT 0,
+    delta_reports                BIGINT NOT NULL DEFAULT 0,
+    positive_views_snapshots     BIGINT NOT NULL DEFAULT 0,
+    negative_views_snapshots     BIGINT NOT NULL DEFAULT 0,
+    negative_likes_snapshots     BIGINT NOT NULL DEFAULT 0,
+    negative_comments_snapshots  BIGINT NOT NULL DEFAULT 0,
+    negative_reports_snapshots   BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (video_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_video_daily_stats_day_positive
+    ON video_daily_stats (day) WHERE positive_views_snapshots > 0;
+
+-- креатор × час
+CREATE TABLE IF NOT EXISTS creator_hourly_stats (
+    creator_id                   TEXT NOT NULL,
+    hour                         TIMESTAMPTZ NOT NULL,
+    snapshots                    BIGINT NOT NULL DEFAULT 0,
+    delta_views                  BIGINT NOT NULL DEFAULT 0,
+    delta_likes                  BIGINT NOT NULL DEFAULT 0,
+    delta_comments               BIGINT NOT NULL DEFAULT 0,
+    delta_reports                BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (creator_id, hour)
+);
+
+-- день целиком: счётчики отрицательных приростов
+CREATE TABLE IF NOT EXISTS daily_stats (
+    day                          DATE PRIMARY KEY,
+    snapshots                    BIGINT NOT NULL DEFAULT 0,
+    negative_views_snapshots     BIGINT NOT NULL DEFAULT 0,
+    negative_likes_snapshots     BIGINT NOT NULL DEFAULT 0,
+    negative_comments_snapshots  BIGINT NOT NULL DEFAULT 0,
+    negative_reports_snapshots   BIGINT NOT NULL DEFAULT 0
+);
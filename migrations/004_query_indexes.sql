@@ -0,0 +1,23 @@
+-- Индексы под полуоткрытые диапазоны timestamptz из queries.build_query.
+
+-- sum_views_for_videos_in_date_range: index-only по дате публикации
+CREATE INDEX IF NOT EXISTS idx_videos_created_at_views
+    ON videos (video_created_at) INCLUDE (views_count);
+
+-- creator_views_delta_in_time_range: снапшоты видео креатора за интервал
+CREATE INDEX IF NOT EXISTS idx_snapshots_video_created_at
+    ON video_snapshots (video_id, created_at) INCLUDE (delta_views_count);
+
+-- videos_with_new_views_on_date: только снапшоты с приростом просмотров
+CREATE INDEX IF NOT EXISTS idx_snapshots_positive_views
+    ON video_snapshots (created_at, video_id) WHERE delta_views_count > 0;
+
+-- snapshots_with_negative_delta: по частичному индексу на метрику
+CREATE INDEX IF NOT EXISTS idx_snapshots_negative_views
+    ON video_snapshots (created_at) WHERE delta_views_count < 0;
+CREATE INDEX IF NOT EXISTS idx_snapshots_negative_likes
+    ON video_snapshots (created_at) WHERE delta_likes_count < 0;
+CREATE INDEX IF NOT EXISTS idx_snapshots_negative_comments
+    ON video_snapshots (created_at) WHERE delta_comments_count < 0;
+CREATE INDEX IF NOT EXISTS idx_snapshots_negative_reports
+    ON video_snapshots (created_at) WHERE delta_reports_count < 0;
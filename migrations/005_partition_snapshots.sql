@@ -0,0 +1,78 @@
+-- Перевод video_snapshots в секционированную по created_at таблицу.
+-- Секции по месяцам создаются на весь диапазон существующих данных,
+-- дальше ими управляет partitions.py (в том числе по дням).
+-- Границы месяцев — в часовом поясе сессии: запускать с PGTZ=$DB_TIMEZONE.
+
+BEGIN;
+
+DROP INDEX IF EXISTS idx_snapshots_created_at;
+DROP INDEX IF EXISTS idx_snapshots_delta_views;
+DROP INDEX IF EXISTS idx_snapshots_video_created_at;
+DROP INDEX IF EXISTS idx_snapshots_positive_views;
+DROP INDEX IF EXISTS idx_snapshots_negative_views;
+DROP INDEX IF EXISTS idx_snapshots_negative_likes;
+DROP INDEX IF EXISTS idx_snapshots_negative_comments;
+DROP INDEX IF EXISTS idx_snapshots_negative_reports;
+
+ALTER TABLE video_snapshots RENAME TO video_snapshots_old;
+ALTER TABLE video_snapshots_old RENAME CONSTRAINT video_snapshots_pkey TO video_snapshots_old_pkey;
+
+-- ключ секционирования обязан входить в первичный ключ
+CREATE TABLE video_snapshots (
+    id                     TEXT NOT NULL,
+    video_id               TEXT NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+    views_count            BIGINT NOT NULL,
+    likes_count            BIGINT NOT NULL,
+    comments_count         BIGINT NOT NULL,
+    reports_count          BIGINT NOT NULL,
+    delta_views_count      BIGINT NOT NULL,
+    delta_likes_count      BIGINT NOT NULL,
+    delta_comments_count   BIGINT NOT NULL,
+    delta_reports_count    BIGINT NOT NULL,
+    created_at             TIMESTAMPTZ NOT NULL,
+    updated_at             TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- сюда попадают строки, для которых ещё нет секции
+CREATE TABLE video_snapshots_default PARTITION OF video_snapshots DEFAULT;
+
+DO $$
+DECLARE
+    m     timestamptz;
+    last  timestamptz;
+BEGIN
+    SELECT date_trunc('month', min(created_at)), date_trunc('month', max(created_at))
+    INTO m, last
+    FROM video_snapshots_old;
+
+    WHILE m IS NOT NULL AND m <= last LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF video_snapshots FOR VALUES FROM (%L) TO (%L)',
+            'video_snapshots_p' || to_char(m, 'YYYYMM'), m, m + interval '1 month'
+        );
+        m := m + interval '1 month';
+    END LOOP;
+END $$;
+
+INSERT INTO video_snapshots SELECT * FROM video_snapshots_old;
+DROP TABLE video_snapshots_old;
+
+CREATE INDEX idx_snapshots_created_at
+    ON video_snapshots (created_at);
+CREATE INDEX idx_snapshots_delta_views
+    ON video_snapshots (delta_views_count);
+CREATE INDEX idx_snapshots_video_created_at
+    ON video_snapshots (video_id, created_at) INCLUDE (delta_views_count);
+CREATE INDEX idx_snapshots_positive_views
+    ON video_snapshots (created_at, video_id) WHERE delta_views_count > 0;
+CREATE INDEX idx_snapshots_negative_views
+    ON video_snapshots (created_at) WHERE delta_views_count < 0;
+CREATE INDEX idx_snapshots_negative_likes
+    ON video_snapshots (created_at) WHERE delta_likes_count < 0;
+CREATE INDEX idx_snapshots_negative_comments
+    ON video_snapshots (created_at) WHERE delta_comments_count < 0;
+CREATE INDEX idx_snapshots_negative_reports
+    ON video_snapshots (created_at) WHERE delta_reports_count < 0;
+
+COMMIT;
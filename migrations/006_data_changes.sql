@@ -0,0 +1,27 @@
+-- Журнал изменений данных для инвалидации кэша результатов (result_cache.py).
+-- load_data в каждой транзакции с новыми строками увеличивает data_version
+-- и пишет в data_changes, какие диапазоны каких таблиц затронуты.
+
+-- единственная строка; UPDATE берёт её блокировку до коммита, поэтому
+-- номера версий становятся видимыми строго по возрастанию
+CREATE TABLE IF NOT EXISTS data_version (
+    id       BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version  BIGINT NOT NULL
+);
+
+INSERT INTO data_version (id, version) VALUES (TRUE, 0)
+ON CONFLICT (id) DO NOTHING;
+
+-- [ts_from; ts_to] включительно: video_created_at для videos,
+-- created_at для video_snapshots; NULL — граница неизвестна
+CREATE TABLE IF NOT EXISTS data_changes (
+    version     BIGINT NOT NULL,
+    table_name  TEXT NOT NULL,
+    ts_from     TIMESTAMPTZ,
+    ts_to       TIMESTAMPTZ,
+    rows        BIGINT NOT NULL,
+    changed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_data_changes_version
+    ON data_changes (version);
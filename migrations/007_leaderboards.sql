@@ -0,0 +1,104 @@
+-- Лидерборды для query_type top_n: прирост по метрике за час / день / неделю
+-- у креаторов и видео. Поддерживаются load_data так же, как 003_rollups.sql
+-- (rollups.ROLLUPS); после миграции на загруженной базе — `python rollups.py rebuild`.
+--
+-- На каждую таблицу и метрику — индекс (интервал, прирост DESC, ключ):
+-- топ-K за интервал читается index-only сканом первых K строк.
+
+-- креатор × день
+CREATE TABLE IF NOT EXISTS creator_daily_stats (
+    creator_id                   TEXT NOT NULL,
+    day                          DATE NOT NULL,
+    snapshots                    BIGINT NOT NULL DEFAULT 0,
+    delta_views                  BIGINT NOT NULL DEFAULT 0,
+    delta_likes                  BIGINT NOT NULL DEFAULT 0,
+    delta_comments               BIGINT NOT NULL DEFAULT 0,
+    delta_reports                BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (creator_id, day)
+);
+
+-- креатор × неделя (week — понедельник)
+CREATE TABLE IF NOT EXISTS creator_weekly_stats (
+    creator_id                   TEXT NOT NULL,
+    week                         DATE NOT NULL,
+    snapshots                    BIGINT NOT NULL DEFAULT 0,
+    delta_views                  BIGINT NOT NULL DEFAULT 0,
+    delta_likes                  BIGINT NOT NULL DEFAULT 0,
+    delta_comments               BIGINT NOT NULL DEFAULT 0,
+    delta_reports                BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (creator_id, week)
+);
+
+-- видео × час
+CREATE TABLE IF NOT EXISTS video_hourly_stats (
+    video_id                     TEXT NOT NULL,
+    hour                         TIMESTAMPTZ NOT NULL,
+    snapshots                    BIGINT NOT NULL DEFAULT 0,
+    delta_views                  BIGINT NOT NULL DEFAULT 0,
+    delta_likes                  BIGINT NOT NULL DEFAULT 0,
+    delta_comments               BIGINT NOT NULL DEFAULT 0,
+    delta_reports                BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (video_id, hour)
+);
+
+-- видео × неделя
+CREATE TABLE IF NOT EXISTS video_weekly_stats (
+    video_id                     TEXT NOT NULL,
+    week                         DATE NOT NULL,
+    snapshots                    BIGINT NOT NULL DEFAULT 0,
+    delta_views                  BIGINT NOT NULL DEFAULT 0,
+    delta_likes                  BIGINT NOT NULL DEFAULT 0,
+    delta_comments               BIGINT NOT NULL DEFAULT 0,
+    delta_reports                BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (video_id, week)
+);
+
+-- индексы лидербордов, включая уже существующие video_daily_stats и creator_hourly_stats
+CREATE INDEX IF NOT EXISTS idx_creator_hourly_stats_top_views
+    ON creator_hourly_stats (hour, delta_views DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_hourly_stats_top_likes
+    ON creator_hourly_stats (hour, delta_likes DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_hourly_stats_top_comments
+    ON creator_hourly_stats (hour, delta_comments DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_hourly_stats_top_reports
+    ON creator_hourly_stats (hour, delta_reports DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_daily_stats_top_views
+    ON creator_daily_stats (day, delta_views DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_daily_stats_top_likes
+    ON creator_daily_stats (day, delta_likes DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_daily_stats_top_comments
+    ON creator_daily_stats (day, delta_comments DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_daily_stats_top_reports
+    ON creator_daily_stats (day, delta_reports DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_weekly_stats_top_views
+    ON creator_weekly_stats (week, delta_views DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_weekly_stats_top_likes
+    ON creator_weekly_stats (week, delta_likes DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_weekly_stats_top_comments
+    ON creator_weekly_stats (week, delta_comments DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_creator_weekly_stats_top_reports
+    ON creator_weekly_stats (week, delta_reports DESC, creator_id);
+CREATE INDEX IF NOT EXISTS idx_video_hourly_stats_top_views
+    ON video_hourly_stats (hour, delta_views DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_hourly_stats_top_likes
+    ON video_hourly_stats (hour, delta_likes DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_hourly_stats_top_comments
+    ON video_hourly_stats (hour, delta_comments DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_hourly_stats_top_reports
+    ON video_hourly_stats (hour, delta_reports DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_daily_stats_top_views
+    ON video_daily_stats (day, delta_views DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_daily_stats_top_likes
+    ON video_daily_stats (day, delta_likes DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_daily_stats_top_comments
+    ON video_daily_stats (day, delta_comments DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_daily_stats_top_reports
+    ON video_daily_stats (day, delta_reports DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_weekly_stats_top_views
+    ON video_weekly_stats (week, delta_views DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_weekly_stats_top_likes
+    ON video_weekly_stats (week, delta_likes DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_weekly_stats_top_comments
+    ON video_weekly_stats (week, delta_comments DESC, video_id);
+CREATE INDEX IF NOT EXISTS idx_video_weekly_stats_top_reports
+    ON video_weekly_stats (week, delta_reports DESC, video_id);
@@ -0,0 +1,14 @@
+-- Водяные знаки инкрементальной загрузки (python load_data.py --incremental).
+-- На поток (--feed) — самый поздний загруженный created_at снапшота: следующий
+-- запуск читает из файлов только снапшоты новее watermark - INGEST_LOOKBACK_HOURS.
+-- Сдвигается в конце успешной загрузки; после обрыва запуск повторяется
+-- с прежним знаком, уже загруженные строки пропускаются.
+CREATE TABLE IF NOT EXISTS ingest_watermarks (
+    feed                TEXT PRIMARY KEY,
+    watermark           TIMESTAMPTZ NOT NULL,
+    runs                BIGINT NOT NULL DEFAULT 0,
+    -- счётчики последнего запуска
+    videos_touched      BIGINT NOT NULL DEFAULT 0,
+    snapshots_inserted  BIGINT NOT NULL DEFAULT 0,
+    updated_at          TIMESTAMPTZ NOT NULL DEFAULT now()
+);
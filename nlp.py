@@ -1,13 +1,64 @@
 import os
+import re
 import json
-from openai import OpenAI
-api_key=os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY не задан в окружении/.env")
+import time
+import random
+import asyncio
+import logging
+import threading
 
+import metrics
+from normalize import extract_slots
+from queries import MULTI_TYPE
+from query_cache import QueryCache
 
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+# ограничения асинхронного клиента
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
 
-client = OpenAI(api_key=api_key)
+log = logging.getLogger("nlp")
+
+# клиенты модели создаются при первом вызове: openai импортируется ~0.5 с,
+# а вопросы, разобранные правилами и кэшем, без модели обходятся
+client = None
+async_client = None
+_client_lock = threading.Lock()
+query_cache = QueryCache()
+
+
+def _api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY не задан в окружении/.env")
+    return api_key
+
+
+def get_client():
+    global client
+    with _client_lock:
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI(api_key=_api_key())
+    return client
+
+
+def get_async_client():
+    """
+    Асинхронный клиент; первый вызов импортирует openai — из цикла
+    событий лучше через asyncio.to_thread (так делает _acall_model).
+    """
+    global async_client
+    with _client_lock:
+        if async_client is None:
+            from openai import AsyncOpenAI
+
+            # повторы делаем сами, с jitter, поэтому встроенные отключены
+            async_client = AsyncOpenAI(api_key=_api_key(), max_retries=0)
+    return async_client
 
 SYSTEM_PROMPT_JSON = """
 Ты – сервис разбора аналитических запросов по статистике видео.
@@ -129,38 +180,360 @@ SYSTEM_PROMPT_JSON = """
 
 Интервал понимаем как включительно: [date time_from; date time_to].
 
+9) Динамика метрики по часам / дням / неделям за период (ряд, а не одно число),
+по всем видео или по видео одного креатора:
+{
+  "query_type": "metric_series",
+  "metric": "views" | "likes" | "comments" | "reports",
+  "bucket": "hour" | "day" | "week",
+  "date_from": "YYYY-MM-DD",
+  "date_to": "YYYY-MM-DD",
+  "creator_id": "<строка или null>"
+}
+
+Например: "как росли просмотры по часам 28 ноября 2025",
+"прирост лайков по дням с 1 по 7 ноября 2025 у креатора 42".
+
+10) Динамика метрики за период у топ-N креаторов или видео по приросту
+(по ряду на каждого):
+{
+  "query_type": "top_series",
+  "metric": "views" | "likes" | "comments" | "reports",
+  "bucket": "hour" | "day" | "week",
+  "date_from": "YYYY-MM-DD",
+  "date_to": "YYYY-MM-DD",
+  "group_by": "creator" | "video",
+  "top_n": <целое число, по умолчанию 5>
+}
+
+Например: "динамика просмотров по дням у топ-3 креаторов с 1 по 10 ноября 2025".
+
+11) Какие креаторы или видео больше всего выросли по метрике за конкретный
+час / день / неделю (список лидеров):
+{
+  "query_type": "top_n",
+  "entity": "creator" | "video",
+  "metric": "views" | "likes" | "comments" | "reports",
+  "period": "hour" | "day" | "week",
+  "date": "YYYY-MM-DD",
+  "hour": "HH:00 или null (только для period = hour)",
+  "limit": <целое число, по умолчанию 10>
+}
+
+Для недели date — любой день этой недели (неделя с понедельника).
+Например: "топ 10 видео по приросту лайков за неделю 3 ноября 2025",
+"какие креаторы быстрее всего росли по просмотрам 28 ноября 2025".
+
+12) Несколько вопросов в одном сообщении — по объекту форматов 1–11
+на каждый вопрос, в том же порядке:
+{
+  "query_type": "multi",
+  "queries": [{...}, {...}]
+}
+
+Например: "сколько видео у креатора 42 вышло с 1 по 30 ноября 2025, сколько
+у него видео набрало больше 10000 просмотров и на сколько выросли его просмотры
+28 ноября 2025 с 10:00 до 15:00" — три объекта типов 2, 6 и 8.
+Если вопрос опирается на предыдущий ("у него", "из них"), переноси условия
+предыдущего вопроса (креатора, даты) в его объект; если подходящего типа нет —
+{"query_type": "unknown"} на его месте.
+
 Важно:
 - Всегда возвращай ТОЛЬКО JSON без пояснений, текста до и после.
 - Если запрос не подходит ни под один тип, верни:
   {"query_type": "unknown"}
 - Даты из естественного языка ("28 ноября 2025", "с 1 по 5 ноября 2025") нужно перевести в формат YYYY-MM-DD.
 - Диапазоны дат "с 1 ноября 2025 по 5 ноября 2025" — обе границы включительно.
+- Для одного дня в типах 9 и 10 date_from и date_to совпадают.
+- Ряд по интервалам (динамика) — типы 9 и 10, лидеры за один интервал — тип 11.
+- Тип 12 — только если вопросов несколько; внутри queries multi не бывает.
 """
 
+RULES_MIN_CONFIDENCE = float(os.getenv("RULES_MIN_CONFIDENCE", "0.9"))
+
+METRICS = {"просмотр": "views", "лайк": "likes", "коммент": "comments", "жалоб": "reports"}
+SERIES_BUCKETS = {"час": "hour", "дн": "day", "недел": "week"}
+TOP_PERIODS = {"час": "hour", "недел": "week"}
+ENTITIES = {"креатор": "creator", "автор": "creator", "видео": "video"}
+_PUNCT_RE = re.compile(r"[,;!?«»\"()]")
+# граница вопросов в одном сообщении: ?, ; и перевод строки, а также запятая
+# или "и"/"а" перед вопросительным словом ("..., и на сколько ...")
+_SPLIT_RE = re.compile(
+    r"[?;\n]+|(?:,\s*(?:(?:и|а|также)\s+)?|\s+(?:и|а|также)\s+)"
+    r"(?=(?:сколько|на сколько|какое|какой|какие|как|топ)\b)",
+    re.IGNORECASE,
+)
+
+# отрицание переворачивает смысл вопроса ("не набрало больше", "меньше 1000"):
+# такие вопросы правила не разбирают, их разбирает модель
+_NOT = r"(?!.*\b(?:не|ни|меньше|менее|ниже)\b)"
+
+# (регулярка по шаблону из normalize.extract_slots, сборка query_desc из слотов)
+RULES = [
+    (
+        re.compile(r"^сколько (?:всего )?видео(?: всего)?(?: есть)?(?: в (?:системе|базе))?(?: всего)?$"),
+        lambda m, s: {"query_type": "total_videos"},
+    ),
+    (
+        re.compile(
+            _NOT + r".*видео у (?:креатора|автора)(?: с id| id)? <id0> "
+            r".*(?:вышл|опубликова|выпущ|выложи)\w*.* с <date0> по <date1>(?: включительно)?$"
+        ),
+        lambda m, s: {
+            "query_type": "creator_videos_in_date_range",
+            "creator_id": s["id0"], "date_from": s["date0"], "date_to": s["date1"],
+        },
+    ),
+    (
+        re.compile(r"^" + _NOT + r"(?!.*<id0>)сколько видео .*(?:больше|более|свыше) <num0> просмотр\w*(?: за все время| по итоговой статистике)?$"),
+        lambda m, s: {"query_type": "videos_with_min_views", "views_threshold": s["num0"]},
+    ),
+    (
+        re.compile(
+            r"^" + _NOT + r"(?!.*<id0>)(?=.*(?:сумм|всего|набрал|собрал))(?=.*просмотр).*видео\w* "
+            r"(?:опубликован|вышедш|вышл|выложен)\w*.* с <date0> по <date1>(?: включительно)?$"
+        ),
+        lambda m, s: {"query_type": "sum_views_for_videos_in_date_range", "date_from": s["date0"], "date_to": s["date1"]},
+    ),
+    (
+        re.compile(r"^" + _NOT + r"(?!.*<id0>)сколько .*видео (?:получал|получил)\w* (?:новые )?просмотр\w*(?: за)? <date0>$"),
+        lambda m, s: {"query_type": "videos_with_new_views_on_date", "date": s["date0"]},
+    ),
+    (
+        re.compile(r"^" + _NOT + r".*видео у (?:креатора|автора)(?: с id| id)? <id0> .*(?:больше|более|свыше) <num0> просмотр\w*(?: за все время| по итоговой статистике)?$"),
+        lambda m, s: {"query_type": "creator_videos_with_min_views", "creator_id": s["id0"], "views_threshold": s["num0"]},
+    ),
+    (
+        re.compile(
+            r"^(?!.*\bне\b)(?!.*<id0>)(?=.*(?:замер|снапшот))(?=.*(?:отрицательн|уменьш|меньше|снизил|упал))"
+            r"(?=.*(просмотр|лайк|коммент|жалоб))(?!.*<date1>)"
+        ),
+        lambda m, s: {"query_type": "snapshots_with_negative_delta", "metric": METRICS[m.group(1)], "date": s.get("date0")},
+    ),
+    (
+        re.compile(
+            r"^" + _NOT + r"(?=.*(?:креатор|автор))(?=.*(?:вырос|прирост))(?=.*просмотр)(?=.*<id0>)(?=.*<date0>)"
+            r".*с <time0> (?:до|по) <time1>(?: включительно)?(?: <date0>)?$"
+        ),
+        lambda m, s: {
+            "query_type": "creator_views_delta_in_time_range",
+            "creator_id": s["id0"], "date": s["date0"], "time_from": s["time0"], "time_to": s["time1"],
+        },
+    ),
+    (
+        re.compile(
+            r"^" + _NOT + r"(?!.*(?:топ|<time0>))(?=.*(?:динамик|рост|росл|вырос|изменял))"
+            r"(?=.*(просмотр|лайк|коммент|жалоб))(?=.*по (час|дн|недел)\w*)(?=.*<date0>)"
+        ),
+        lambda m, s: {
+            "query_type": "metric_series", "metric": METRICS[m.group(1)], "bucket": SERIES_BUCKETS[m.group(2)],
+            "date_from": s["date0"], "date_to": s.get("date1", s["date0"]), "creator_id": s.get("id0"),
+        },
+    ),
+    (
+        re.compile(
+            r"^" + _NOT + r"(?!.*(?:<id0>|<date1>|по (?:час|дн|недел)|потер|упал|снизил|уменьш|падени))(?=.*(?:топ|лидер|быстрее всего|сильнее всего))"
+            r"(?=.*(креатор|автор|видео))(?=.*(просмотр|лайк|коммент|жалоб))(?=.*<date0>)"
+            r"(?=(?:.*(час|недел))?)"
+        ),
+        lambda m, s: _top_n(ENTITIES[m.group(1)], METRICS[m.group(2)], TOP_PERIODS.get(m.group(3), "day"), s),
+    ),
+]
+
+
+def _top_n(entity: str, metric: str, period: str, s: dict) -> dict:
+    """
+    query_desc для top_n. Время берётся только для периода "час": у дня
+    и недели его нет, неиспользованный слот снижает уверенность rule_parse,
+    и вопрос уходит модели.
+    """
+    return {
+        "query_type": "top_n", "entity": entity, "metric": metric, "period": period, "date": s["date0"],
+        "hour": s.get("time0") if period == "hour" else None, "limit": s.get("num0"),
+    }
+
+
+def rule_parse(user_text: str) -> tuple[dict | None, float]:
+    """
+    Локальный разбор типов запросов по шаблонам, без обращения к модели.
+
+    Возвращает (query_desc, уверенность). Уверенность 1.0 — сработало ровно
+    одно правило и оно использовало все найденные в тексте даты/числа/id;
+    если что-то осталось неиспользованным или правил несколько — 0.5.
+    """
+    template, slots = extract_slots(user_text)
+    text = " ".join(_PUNCT_RE.sub(" ", template).split())
+
+    matches = []
+    for pattern, build in RULES:
+        m = pattern.search(text)
+        if m:
+            matches.append(build(m, slots))
+
+    if not matches:
+        return None, 0.0
+
+    query_desc = matches[0]
+    values = list(query_desc.values())
+    all_used = all(v in values for v in slots.values())
+    confidence = 1.0 if len(matches) == 1 and all_used else 0.5
+    return query_desc, confidence
+
+
+def split_questions(user_text: str) -> list[str]:
+    """
+    Текст → отдельные вопросы по _SPLIT_RE; один вопрос — список из одного.
+    """
+    parts = [part.strip(" ,.!") for part in _SPLIT_RE.split(user_text)]
+    return [part for part in parts if part]
+
+
+def rule_parse_multi(user_text: str) -> dict | None:
+    """
+    Несколько вопросов в одном сообщении ("сколько ..., и сколько ...?"):
+    multi, если текст делится на части и каждую правила разбирают
+    уверенно. Части, которые опираются на предыдущий вопрос
+    ("а из них ..."), правилам не по силам — такой текст уходит дальше.
+    """
+    parts = split_questions(user_text)
+    if len(parts) < 2:
+        return None
+
+    queries = []
+    for part in parts:
+        query_desc, confidence = rule_parse(part)
+        if query_desc is None or confidence < RULES_MIN_CONFIDENCE:
+            return None
+        queries.append(query_desc)
+    return {"query_type": MULTI_TYPE, "queries": queries}
+
+
+def _parse_rules(user_text: str) -> dict | None:
+    """
+    Уверенный разбор правилами или None: сначала как несколько вопросов —
+    иначе "сколько видео всего и сколько набрало больше N" целиком
+    совпадает с одним правилом и второй вопрос теряется.
+    """
+    query_desc = rule_parse_multi(user_text)
+    if query_desc is None:
+        query_desc, confidence = rule_parse(user_text)
+        if confidence < RULES_MIN_CONFIDENCE:
+            return None
+    return query_desc
+
+
+route_stats = {"rules": 0, "cache": 0, "llm": 0}
+
+
+def resolve_user_query(user_text: str) -> tuple[dict, str]:
+    """
+    Разбор запроса самым дешёвым доступным способом:
+    правила → кэш → модель. Возвращает (query_desc, "rules" | "cache" | "llm").
+    """
+    query_desc = _parse_rules(user_text)
+    if query_desc is not None:
+        source = "rules"
+    else:
+        query_desc, source = _parse_cached(user_text)
+
+    route_stats[source] += 1
+    return query_desc, source
+
+
 def parse_user_query(user_text: str) -> dict:
     """
     Берём текст пользователя → возвращаем dict с query_type и параметрами.
+    Вопросы того же вида, что уже разбирались, отвечаются из query_cache.
+    """
+    return _parse_cached(user_text)[0]
+
+
+def _cached(user_text: str) -> dict | None:
     """
+    Разбор из query_cache: весь текст по шаблону, а если его нет и вопросов
+    несколько — каждая часть правилами или по своему шаблону. Шаблон
+    составного вопроса зависит от набора и порядка частей и повторяется
+    редко, а шаблоны частей — часто.
+    """
+    cached = query_cache.get(user_text)
+    if cached is not None:
+        return cached
+
+    parts = split_questions(user_text)
+    if len(parts) < 2:
+        return None
+    queries = []
+    for part in parts:
+        query_desc = _parse_rules(part) or query_cache.get(part)
+        if query_desc is None:
+            return None
+        queries.append(query_desc)
+    return {"query_type": MULTI_TYPE, "queries": queries}
+
+
+def _remember(user_text: str, data: dict, llm_seconds: float):
+    """
+    Ответ модели — в query_cache; у multi, если текст делится на столько же
+    частей, сколько подзапросов, ещё и каждая часть по своему шаблону.
+    """
+    query_cache.put(user_text, data, llm_seconds)
+    if data["query_type"] != MULTI_TYPE:
+        return
+    parts = split_questions(user_text)
+    if len(parts) == len(data["queries"]):
+        for part, query_desc in zip(parts, data["queries"]):
+            query_cache.put(part, query_desc, None)
+
+
+def _parse_cached(user_text: str) -> tuple[dict, str]:
+    cached = _cached(user_text)
+    if cached is not None:
+        return cached, "cache"
+
+    started = time.perf_counter()
+    data = _parse_with_llm(user_text)
+    _remember(user_text, data, time.perf_counter() - started)
+    return data, "llm"
+
+
+def _parse_with_llm(user_text: str) -> dict:
     try:
-        response = client.responses.create(
-            model="gpt-4.1-mini",
+        response = get_client().responses.create(
+            model=OPENAI_MODEL,
             input=[
                 {"role": "system", "content": SYSTEM_PROMPT_JSON},
                 {"role": "user", "content": user_text},
             ],
-            response_format={"type": "json_object"},
+            text={"format": {"type": "json_object"}},
         )
         raw = response.output_text 
         data = json.loads(raw)
     except Exception as e:
-      
-        print("ERROR in parse_user_query:", repr(e))
+        log.error("parse_user_query: %r", e)
         data = {"query_type": "unknown"}
 
+    return _checked(data)
+
+
+def _checked(data: dict) -> dict:
+    """
+    Ответ модели → query_desc: без query_type — unknown; у multi каждый
+    подзапрос без query_type или сам multi — unknown, из одного подзапроса — он сам.
+    """
     if "query_type" not in data:
         data["query_type"] = "unknown"
+    if data["query_type"] != MULTI_TYPE:
+        return data
 
-    return data
+    queries = [
+        q if isinstance(q, dict) and q.get("query_type") not in (None, MULTI_TYPE) else {"query_type": "unknown"}
+        for q in data.get("queries") or []
+    ]
+    if not queries:
+        return {"query_type": "unknown"}
+    if len(queries) == 1:
+        return queries[0]
+    return {"query_type": MULTI_TYPE, "queries": queries}
 
 
 
@@ -199,6 +572,9 @@ TABLE video_snapshots (
 Требования:
 - Пиши только один SQL-запрос, без пояснений и без кавычек вокруг.
 - Запрос должен быть безопасным: только SELECT, без INSERT/UPDATE/DELETE/DDL.
+- Используй только таблицы и колонки выше, без системных каталогов, комментариев
+  и идентификаторов в кавычках; из функций — агрегатные и для работы с датами.
+- Ответ — одно число: не выбирай строки целиком, всегда агрегируй.
 - Если нужно посчитать количество, используй COUNT(*) или COUNT(DISTINCT ...).
 - Если нужно сумму, используй SUM(...).
 """
@@ -207,8 +583,8 @@ def nl_to_sql(user_text: str, dsn_hint: str | None = None) -> str:
     """
     Фолбэк: просим модель сразу написать SQL.
     """
-    response = client.responses.create(
-        model="gpt-4.1-mini",
+    response = get_client().responses.create(
+        model=OPENAI_MODEL,
         input=[
             {"role": "system", "content": SQL_SYSTEM_PROMPT},
             {"role": "user", "content": user_text},
@@ -216,3 +592,124 @@ def nl_to_sql(user_text: str, dsn_hint: str | None = None) -> str:
     )
     sql = response.output_text.strip()
     return sql
+
+
+# --- асинхронный путь для бота ---------------------------------------------
+
+_llm_slots: asyncio.Semaphore | None = None
+_inflight: dict[tuple, asyncio.Task] = {}
+
+
+async def _acall_model(system_prompt: str, user_text: str, **kwargs) -> str:
+    """
+    Один запрос к модели: не больше LLM_MAX_CONCURRENCY одновременно,
+    таймаут LLM_TIMEOUT на попытку, повтор с экспоненциальной задержкой и jitter.
+    """
+    global _llm_slots
+    if _llm_slots is None:
+        _llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    llm = async_client or await asyncio.to_thread(get_async_client)
+    from openai import APIConnectionError, RateLimitError, InternalServerError
+
+    async with _llm_slots:
+        with metrics.span("llm"):
+            for attempt in range(LLM_RETRIES + 1):
+                try:
+                    response = await asyncio.wait_for(
+                        llm.responses.create(
+                            model=OPENAI_MODEL,
+                            input=[
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": user_text},
+                            ],
+                            **kwargs,
+                        ),
+                        LLM_TIMEOUT,
+                    )
+                    return response.output_text
+                except (asyncio.TimeoutError, APIConnectionError, RateLimitError, InternalServerError) as e:
+                    if attempt == LLM_RETRIES:
+                        raise
+                    delay = LLM_RETRY_BASE_DELAY * 2 ** attempt
+                    delay = random.uniform(delay / 2, delay * 1.5)
+                    metrics.LLM_RETRIES.inc(error=type(e).__name__)
+                    log.warning("LLM attempt %d failed: %r, retry in %.2fs", attempt + 1, e, delay)
+                    await asyncio.sleep(delay)
+
+
+async def _single_flight(key: tuple, factory):
+    """
+    Одинаковые запросы, пришедшие, пока первый ещё в полёте, ждут его результат,
+    а не идут в модель повторно.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: отмена одного ожидающего не должна отменять общий запрос
+    return await asyncio.shield(task)
+
+
+def _flight_key(kind: str, user_text: str) -> tuple:
+    return kind, " ".join(user_text.lower().split())
+
+
+async def _aparse_with_llm(user_text: str) -> dict:
+    try:
+        raw = await _acall_model(
+            SYSTEM_PROMPT_JSON, user_text, text={"format": {"type": "json_object"}}
+        )
+        data = json.loads(raw)
+    except Exception as e:
+        log.error("aparse_user_query: %r", e)
+        data = {"query_type": "unknown"}
+
+    return _checked(data)
+
+
+async def _aparse_cached(user_text: str) -> tuple[dict, str]:
+    with metrics.span("parse_cache"):
+        cached = _cached(user_text)
+    if cached is not None:
+        return cached, "cache"
+
+    async def call():
+        started = time.perf_counter()
+        data = await _aparse_with_llm(user_text)
+        _remember(user_text, data, time.perf_counter() - started)
+        return data
+
+    data = await _single_flight(_flight_key("parse", user_text), call)
+    return dict(data), "llm"
+
+
+async def aparse_user_query(user_text: str) -> dict:
+    """
+    Асинхронный parse_user_query: не блокирует event loop бота.
+    """
+    return (await _aparse_cached(user_text))[0]
+
+
+async def aresolve_user_query(user_text: str) -> tuple[dict, str]:
+    """
+    Асинхронный resolve_user_query: правила → кэш → модель.
+    """
+    query_desc = _parse_rules(user_text)
+    if query_desc is not None:
+        source = "rules"
+    else:
+        query_desc, source = await _aparse_cached(user_text)
+
+    route_stats[source] += 1
+    return query_desc, source
+
+
+async def anl_to_sql(user_text: str, dsn_hint: str | None = None) -> str:
+    """
+    Асинхронный nl_to_sql с объединением одинаковых запросов в полёте.
+    """
+    async def call():
+        return (await _acall_model(SQL_SYSTEM_PROMPT, user_text)).strip()
+
+    return await _single_flight(_flight_key("sql", user_text), call)
@@ -0,0 +1,111 @@
+"""
+Нормализация текста запроса в шаблон со слотами.
+
+"Сколько видео у креатора с id aca1061a вышло с 1 по 5 ноября 2025?"
+→ шаблон "сколько видео у креатора с id <id0> вышло с <date0> по <date1>"
+  и слоты {"id0": "aca1061a", "date0": "2025-11-01", "date1": "2025-11-05"}.
+
+Одинаковые по смыслу вопросы с разными датами/числами/id дают один шаблон.
+"""
+import re
+from datetime import date
+
+MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4,
+    "мая": 5, "июня": 6, "июля": 7, "августа": 8,
+    "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12,
+}
+_MONTH = "(" + "|".join(MONTHS) + ")"
+_YEAR = r"(\d{4})(?:\s*(?:года|год|г\.?))?"
+
+DATE_RANGE_RE = re.compile(
+    rf"\bс\s+(\d{{1,2}})(?:\s+{_MONTH})?(?:\s+{_YEAR})?\s+по\s+(\d{{1,2}})\s+{_MONTH}\s+{_YEAR}"
+)
+DATE_TEXT_RE = re.compile(rf"\b(\d{{1,2}})\s+{_MONTH}\s+{_YEAR}")
+DATE_ISO_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+DATE_DOTS_RE = re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b")
+TIME_RE = re.compile(r"\b(\d{1,2}):(\d{2})\b")
+# id креатора/видео: латиница вперемешку с цифрами, не короче 6 символов
+ID_RE = re.compile(r"\b(?=[\w-]*\d)(?=[\w-]*[a-z])[a-z0-9][a-z0-9_-]{5,}\b", re.IGNORECASE)
+NUMBER_RE = re.compile(
+    r"\b(\d{1,3}(?:[  ]\d{3})+|\d+(?:[.,]\d+)?)"
+    r"(?:\s*(тыс\.?|тысяч[аи]?|к|k|млн\.?|миллион(?:а|ов)?)(?=\W|$))?",
+    re.IGNORECASE,
+)
+_MULTIPLIERS = {"т": 1_000, "к": 1_000, "k": 1_000, "м": 1_000_000}
+
+
+def _iso(day: str, month: int, year: str) -> str | None:
+    try:
+        return date(int(year), month, int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def _number(digits: str, unit: str | None) -> int | None:
+    value = float(digits.replace(" ", "").replace(" ", "").replace(",", "."))
+    if unit:
+        value *= _MULTIPLIERS[unit[0].lower()]
+    return int(value) if value == int(value) else None
+
+
+def extract_slots(text: str) -> tuple[str, dict]:
+    """
+    Текст → (шаблон, слоты). Значения слотов уже в том виде,
+    в каком их возвращает parse_user_query: даты YYYY-MM-DD, время HH:MM,
+    числа int, id как есть (с исходным регистром).
+    """
+    slots: dict = {}
+    counters: dict[str, int] = {}
+
+    def slot(kind: str, value) -> str:
+        n = counters.get(kind, 0)
+        counters[kind] = n + 1
+        slots[f"{kind}{n}"] = value
+        return f"<{kind}{n}>"
+
+    s = " ".join(text.replace("ё", "е").replace("Ё", "Е").split())
+    s = s.rstrip("?!. ")
+
+    # id вырезаем до lower(), чтобы сохранить регистр
+    s = ID_RE.sub(lambda m: slot("id", m.group(0)), s)
+    s = s.lower()
+
+    def date_range(m: re.Match) -> str:
+        d1, m1, y1, d2, m2, y2 = m.groups()
+        first = _iso(d1, MONTHS[m1 or m2], y1 or y2)
+        second = _iso(d2, MONTHS[m2], y2)
+        if not first or not second:
+            return m.group(0)
+        return f"с {slot('date', first)} по {slot('date', second)}"
+
+    def date_text(m: re.Match) -> str:
+        iso = _iso(m.group(1), MONTHS[m.group(2)], m.group(3))
+        return slot("date", iso) if iso else m.group(0)
+
+    def date_iso(m: re.Match) -> str:
+        iso = _iso(m.group(3), int(m.group(2)), m.group(1))
+        return slot("date", iso) if iso else m.group(0)
+
+    def date_dots(m: re.Match) -> str:
+        iso = _iso(m.group(1), int(m.group(2)), m.group(3))
+        return slot("date", iso) if iso else m.group(0)
+
+    def time_(m: re.Match) -> str:
+        hh, mm = int(m.group(1)), int(m.group(2))
+        if hh > 24 or mm > 59:
+            return m.group(0)
+        return slot("time", f"{hh:02d}:{mm:02d}")
+
+    def number(m: re.Match) -> str:
+        value = _number(m.group(1), m.group(2))
+        return slot("num", value) if value is not None else m.group(0)
+
+    s = DATE_RANGE_RE.sub(date_range, s)
+    s = DATE_TEXT_RE.sub(date_text, s)
+    s = DATE_ISO_RE.sub(date_iso, s)
+    s = DATE_DOTS_RE.sub(date_dots, s)
+    s = TIME_RE.sub(time_, s)
+    s = NUMBER_RE.sub(number, s)
+
+    return s, slots
@@ -0,0 +1,205 @@
+"""
+Выгрузка PostgreSQL → Parquet для бэкенда duckdb (backends.py).
+
+  data/parquet/videos.parquet                          — целиком при каждой выгрузке
+  data/parquet/video_snapshots/month=YYYY-MM/data.parquet — по месяцу в DB_TIMEZONE
+
+Месяц выгружается через COPY ... TO STDOUT во временный CSV, DuckDB
+сортирует его по created_at (статистика row group'ов отсекает лишнее при
+фильтре по времени) и пишет Parquet рядом; готовый файл встаёт на место
+через os.replace, так что читатели видят либо старый месяц, либо новый.
+
+  python parquet_export.py --full                 # все месяцы
+  python parquet_export.py --since-version 41     # только изменённые после версии 41 (data_changes)
+
+load_data с --parquet делает второе сам после загрузки.
+
+В конце выгрузка пишет в data_changes свою версию с теми же диапазонами:
+ответы duckdb, посчитанные по старым файлам уже после коммита загрузки,
+иначе остались бы в кэше результатов (result_cache.py) навсегда.
+"""
+import os
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+import psycopg2
+
+import partitions
+import result_cache
+from backends import PARQUET_DIR, load_duckdb
+
+DB_DSN = os.getenv("DB_DSN", "dbname=video_analytics")
+
+VIDEO_COLUMNS = {
+    "id": "VARCHAR",
+    "creator_id": "VARCHAR",
+    "video_created_at": "TIMESTAMPTZ",
+    "views_count": "BIGINT",
+    "likes_count": "BIGINT",
+    "comments_count": "BIGINT",
+    "reports_count": "BIGINT",
+    "created_at": "TIMESTAMPTZ",
+    "updated_at": "TIMESTAMPTZ",
+}
+
+SNAPSHOT_COLUMNS = {
+    "id": "VARCHAR",
+    "video_id": "VARCHAR",
+    "views_count": "BIGINT",
+    "likes_count": "BIGINT",
+    "comments_count": "BIGINT",
+    "reports_count": "BIGINT",
+    "delta_views_count": "BIGINT",
+    "delta_likes_count": "BIGINT",
+    "delta_comments_count": "BIGINT",
+    "delta_reports_count": "BIGINT",
+    "created_at": "TIMESTAMPTZ",
+    "updated_at": "TIMESTAMPTZ",
+}
+
+
+def current_version(cur) -> int:
+    cur.execute("SELECT version FROM data_version;")
+    return cur.fetchone()[0]
+
+
+def changed_range(cur, since_version: int | None) -> tuple[datetime | None, datetime | None]:
+    """
+    Диапазон created_at снапшотов, изменённых после since_version
+    (None — все снапшоты таблицы).
+    """
+    if since_version is not None:
+        cur.execute(
+            """
+            SELECT MIN(ts_from), MAX(ts_to), bool_or(ts_from IS NULL OR ts_to IS NULL)
+            FROM data_changes
+            WHERE version > %s AND table_name = 'video_snapshots';
+            """,
+            (since_version,),
+        )
+        lo, hi, unbounded = cur.fetchone()
+        if not unbounded:
+            return lo, hi
+
+    cur.execute("SELECT MIN(created_at), MAX(created_at) FROM video_snapshots;")
+    return cur.fetchone()
+
+
+def videos_range(cur, since_version: int | None) -> tuple[datetime | None, datetime | None] | None:
+    """
+    Диапазон video_created_at видео, изменённых после since_version;
+    (None, None) — все видео, None — видео не менялись.
+    """
+    if since_version is None:
+        return None, None
+    cur.execute(
+        """
+        SELECT MIN(ts_from), MAX(ts_to), bool_or(ts_from IS NULL OR ts_to IS NULL)
+        FROM data_changes
+        WHERE version > %s AND table_name = 'videos';
+        """,
+        (since_version,),
+    )
+    lo, hi, unbounded = cur.fetchone()
+    if unbounded:
+        return None, None
+    return None if lo is None else (lo, hi)
+
+
+def months(lo: datetime, hi: datetime) -> list[datetime]:
+    result = []
+    start = partitions.period_start(lo, "month")
+    while start <= hi:
+        result.append(start)
+        start = partitions.next_period(start, "month")
+    return result
+
+
+def _copy_to_parquet(cur, duck, query: str, params: tuple, columns: dict, order_by: str, target: Path) -> int:
+    """
+    Результат query из PostgreSQL → target (Parquet), с атомарной заменой.
+    Возвращает число строк.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=target.parent) as tmp:
+        csv_path = Path(tmp) / "rows.csv"
+        with csv_path.open("w", encoding="utf-8") as f:
+            cur.copy_expert(f"COPY ({cur.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT csv)", f)
+        rows = cur.rowcount
+
+        parquet_path = Path(tmp) / target.name
+        duck.execute(
+            f"""
+            COPY (
+                SELECT * FROM read_csv(?, header = false, columns = {columns!r})
+                ORDER BY {order_by}
+            ) TO '{parquet_path}' (FORMAT parquet, COMPRESSION zstd);
+            """,
+            [str(csv_path)],
+        )
+        os.replace(parquet_path, target)
+    return rows
+
+
+def export_parquet(out_dir: Path = PARQUET_DIR, since_version: int | None = None) -> list[str]:
+    """
+    Выгрузить videos и месяцы video_snapshots (все или изменённые после
+    since_version). Возвращает выгруженные месяцы YYYY-MM.
+    """
+    duckdb = load_duckdb()
+    if duckdb is None:
+        raise RuntimeError("для выгрузки в Parquet нужен пакет duckdb: pip install duckdb pytz")
+
+    out_dir = Path(out_dir)
+    duck = duckdb.connect()
+    conn = psycopg2.connect(DB_DSN, options="-c TimeZone=UTC")
+    exported = []
+    snapshots = 0
+    try:
+        with conn.cursor() as cur:
+            videos = _copy_to_parquet(
+                cur, duck, f"SELECT {', '.join(VIDEO_COLUMNS)} FROM videos", (),
+                VIDEO_COLUMNS, "video_created_at", out_dir / "videos.parquet",
+            )
+
+            lo, hi = changed_range(cur, since_version)
+            starts = months(lo, hi) if lo is not None else []
+            for start in starts:
+                month = f"{start:%Y-%m}"
+                snapshots += _copy_to_parquet(
+                    cur, duck,
+                    f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM video_snapshots "
+                    "WHERE created_at >= %s AND created_at < %s",
+                    (start, partitions.next_period(start, "month")),
+                    SNAPSHOT_COLUMNS, "created_at",
+                    out_dir / "video_snapshots" / f"month={month}" / "data.parquet",
+                )
+                exported.append(month)
+
+            changes = []
+            changed_videos = videos_range(cur, since_version)
+            if changed_videos is not None:
+                changes.append(("videos", *changed_videos, videos))
+            if starts:
+                changes.append(("video_snapshots", starts[0], partitions.next_period(starts[-1], "month"), snapshots))
+            result_cache.record_changes(cur, changes)
+        conn.commit()
+    finally:
+        conn.close()
+        duck.close()
+
+    print(f"[PARQUET] {out_dir}: videos, месяцы снапшотов {', '.join(exported) or '—'}")
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка videos и video_snapshots в Parquet")
+    parser.add_argument("--dir", type=Path, default=PARQUET_DIR)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--full", action="store_true", help="выгрузить все месяцы")
+    group.add_argument("--since-version", type=int, help="только месяцы, изменённые после этой версии данных")
+    args = parser.parse_args()
+
+    export_parquet(args.dir, None if args.full else args.since_version)
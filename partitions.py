@@ -0,0 +1,228 @@
+"""
+Управление секциями video_snapshots (migrations/005_partition_snapshots.sql).
+
+  python partitions.py list
+  python partitions.py ensure --ahead 3             # секции на 3 периода вперёд
+  python partitions.py detach --older-than 2025-01-01
+  python partitions.py archive --older-than 2025-01-01 --dir archive/
+
+Период секции — SNAPSHOT_PARTITION_INTERVAL: month (по умолчанию) или day.
+Границы считаются в DB_TIMEZONE, как и даты в запросах бота, поэтому
+запрос за день или месяц попадает ровно в одну секцию.
+"""
+import os
+import gzip
+import argparse
+from pathlib import Path
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import psycopg2
+
+import rollups
+import result_cache
+
+DB_DSN = os.getenv("DB_DSN", "dbname=video_analytics")
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "UTC")
+PARTITION_INTERVAL = os.getenv("SNAPSHOT_PARTITION_INTERVAL", "month")
+
+PARENT = "video_snapshots"
+DEFAULT_PARTITION = "video_snapshots_default"
+# держим на время создания секций, чтобы параллельные загрузчики не создавали одну и ту же
+LOCK_KEY = 5_040_001
+
+TZ = ZoneInfo(DB_TIMEZONE)
+
+
+def period_start(ts: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    local = ts.astimezone(TZ)
+    d = local.date() if interval == "day" else local.date().replace(day=1)
+    return datetime.combine(d, time.min, tzinfo=TZ)
+
+
+def next_period(start: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    d = start.date()
+    if interval == "day":
+        d += timedelta(days=1)
+    else:
+        d = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return datetime.combine(d, time.min, tzinfo=TZ)
+
+
+def partition_name(start: datetime, interval: str = PARTITION_INTERVAL) -> str:
+    return f"{PARENT}_p{start:%Y%m%d}" if interval == "day" else f"{PARENT}_p{start:%Y%m}"
+
+
+def is_partitioned(cur) -> bool:
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass;", (PARENT,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def existing_partitions(cur) -> list[tuple[str, datetime, datetime]]:
+    """
+    Секции с диапазонами [from; to), по возрастанию. DEFAULT не включается.
+    """
+    cur.execute(
+        """
+        SELECT c.relname, b[1]::timestamptz, b[2]::timestamptz
+        FROM pg_inherits AS i
+        JOIN pg_class AS c ON c.oid = i.inhrelid
+        CROSS JOIN LATERAL regexp_match(
+            pg_get_expr(c.relpartbound, c.oid),
+            'FROM \\(''([^'']+)''\\) TO \\(''([^'']+)''\\)'
+        ) AS b
+        WHERE i.inhparent = %s::regclass
+          AND b IS NOT NULL
+        ORDER BY 2;
+        """,
+        (PARENT,),
+    )
+    return cur.fetchall()
+
+
+def create_partition(cur, start: datetime, end: datetime, name: str):
+    """
+    Новая секция [start; end). Строки этого диапазона, уже попавшие
+    в DEFAULT, переносятся в неё до подключения.
+    """
+    cur.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+    cur.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE created_at >= %s AND created_at < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+        """,
+        (start, end),
+    )
+    cur.execute(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);",
+        (start, end),
+    )
+    print(f"[partitions] создана {name} [{start:%Y-%m-%d}; {end:%Y-%m-%d})")
+
+
+def _missing_periods(cur, lo: datetime, hi: datetime, interval: str) -> list[tuple[datetime, datetime]]:
+    existing = existing_partitions(cur)
+    missing = []
+    start = period_start(lo, interval)
+    while start <= hi:
+        end = next_period(start, interval)
+        if not any(p_from < end and start < p_to for _, p_from, p_to in existing):
+            missing.append((start, end))
+        start = end
+    return missing
+
+
+def ensure_range(cur, lo: datetime, hi: datetime, interval: str = PARTITION_INTERVAL) -> int:
+    """
+    Создать недостающие секции, покрывающие [lo; hi]. Возвращает число созданных.
+
+    Вызывать до вставки в video_snapshots в текущей транзакции: тогда ожидание
+    блокировки родителя не образует цикла с другими загрузчиками.
+    """
+    if not _missing_periods(cur, lo, hi, interval):
+        return 0
+
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (LOCK_KEY,))
+    missing = _missing_periods(cur, lo, hi, interval)
+    for start, end in missing:
+        create_partition(cur, start, end, partition_name(start, interval))
+    return len(missing)
+
+
+def ensure_ahead(cur, periods: int, interval: str = PARTITION_INTERVAL) -> int:
+    now = datetime.now(TZ)
+    hi = now
+    for _ in range(periods):
+        hi = next_period(period_start(hi, interval), interval)
+    return ensure_range(cur, now, hi, interval)
+
+
+def old_partitions(cur, older_than: date) -> list[str]:
+    """
+    Секции, целиком лежащие раньше older_than.
+    """
+    cutoff = datetime.combine(older_than, time.min, tzinfo=TZ)
+    return [name for name, _, p_to in existing_partitions(cur) if p_to <= cutoff]
+
+
+def detach(cur, name: str):
+    """
+    Отключить секцию. Её строки пропадают из запросов, поэтому в той же
+    транзакции они вычитаются из агрегатов (rollups.py), а диапазон
+    отмечается в data_changes, чтобы кэш результатов сбросил ответы по нему.
+    """
+    p_from, p_to = next((f, t) for n, f, t in existing_partitions(cur) if n == name)
+    cur.execute(f"SELECT COUNT(*) FROM {name};")
+    rows = cur.fetchone()[0]
+    rollups.apply_new_snapshots(cur, source=name, sign=-1)
+    cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name};")
+    result_cache.record_changes(cur, [(PARENT, p_from, p_to - timedelta(microseconds=1), rows)])
+    print(f"[partitions] отключена {name}")
+
+
+def archive(conn, name: str, directory: Path):
+    """
+    Отключить секцию, выгрузить её в gzip-CSV и удалить.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.csv.gz"
+
+    with conn.cursor() as cur:
+        detach(cur, name)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            cur.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        cur.execute(f"DROP TABLE {name};")
+    conn.commit()
+    print(f"[partitions] {name} → {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Секции video_snapshots")
+    parser.add_argument("command", choices=["list", "ensure", "detach", "archive"])
+    parser.add_argument("--interval", choices=["month", "day"], default=PARTITION_INTERVAL)
+    parser.add_argument("--ahead", type=int, default=2, help="ensure: сколько периодов вперёд")
+    parser.add_argument("--older-than", type=date.fromisoformat, help="detach/archive: граница, YYYY-MM-DD")
+    parser.add_argument("--dir", type=Path, default=Path("archive"), help="archive: куда писать выгрузки")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(DB_DSN, options=f"-c TimeZone={DB_TIMEZONE}")
+    with conn.cursor() as cur:
+        if not is_partitioned(cur):
+            raise SystemExit(f"{PARENT} не секционирована, сначала migrations/005_partition_snapshots.sql")
+
+        if args.command == "list":
+            for name, p_from, p_to in existing_partitions(cur):
+                cur.execute(f"SELECT COUNT(*) FROM {name};")
+                print(f"{name}: [{p_from:%Y-%m-%d}; {p_to:%Y-%m-%d}) rows={cur.fetchone()[0]}")
+            cur.execute(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION};")
+            print(f"{DEFAULT_PARTITION}: rows={cur.fetchone()[0]}")
+
+        elif args.command == "ensure":
+            created = ensure_ahead(cur, args.ahead, args.interval)
+            conn.commit()
+            print(f"создано секций: {created}")
+
+        elif args.command in ("detach", "archive"):
+            if not args.older_than:
+                parser.error("нужен --older-than")
+            names = old_partitions(cur, args.older_than)
+            if args.command == "detach":
+                for name in names:
+                    detach(cur, name)
+                conn.commit()
+            else:
+                conn.commit()
+                for name in names:
+                    archive(conn, name, args.dir)
+            print(f"обработано секций: {len(names)}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
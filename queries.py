@@ -0,0 +1,671 @@
+import os
+import time as clock
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import db
+import backends
+import metrics
+from rollups import LEADERBOARDS
+
+# отвечать из агрегатов migrations/003_rollups.sql, где это возможно;
+# включать после `python rollups.py rebuild`
+USE_ROLLUPS = os.getenv("USE_ROLLUPS", "0") == "1"
+
+# в каком поясе пользователь называет даты и время
+APP_TZ = ZoneInfo(db.DB_TIMEZONE)
+
+NEGATIVE_DELTA_COLUMNS = {
+    "views": "delta_views_count",
+    "likes": "delta_likes_count",
+    "comments": "delta_comments_count",
+    "reports": "delta_reports_count",
+}
+
+# query_type, которые отвечают рядом по интервалам, а не одним числом
+SERIES_TYPES = ("metric_series", "top_series")
+BUCKETS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(days=7),
+}
+# больше точек — интервал укрупняется: hour → day → week
+SERIES_MAX_BUCKETS = int(os.getenv("SERIES_MAX_BUCKETS", "168"))
+SERIES_DEFAULT_TOP_N = 5
+SERIES_MAX_TOP_N = 20
+
+TOP_N_DEFAULT_LIMIT = 10
+TOP_N_MAX_LIMIT = 50
+
+# несколько вопросов в одном сообщении: {"query_type": "multi", "queries": [query_desc, ...]}
+MULTI_TYPE = "multi"
+MULTI_MAX_QUERIES = int(os.getenv("MULTI_MAX_QUERIES", "8"))
+# откуда читают подзапросы multi, которые считаются общим проходом (fused_part)
+FUSED_SOURCES = {
+    "videos": "videos AS v",
+    "snapshots": "video_snapshots AS s",
+    "creator_snapshots": "video_snapshots AS s JOIN videos AS v ON v.id = s.video_id",
+}
+
+# ответ не одним числом: в /batch не входят, бот рендерит отдельно
+NON_SCALAR_TYPES = SERIES_TYPES + ("top_n", MULTI_TYPE)
+
+log = logging.getLogger("queries")
+
+
+def day_start(day: str | date) -> datetime:
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return datetime.combine(day, time.min, tzinfo=APP_TZ)
+
+
+def day_range(day: str | date) -> tuple[datetime, datetime]:
+    """
+    Календарный день → [начало дня; начало следующего дня) в APP_TZ.
+
+    Вместо created_at::date = X: сравнение самой колонки с границами
+    использует индекс, а длина суток при переходе на летнее время учтена.
+    """
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return day_start(day), day_start(day + timedelta(days=1))
+
+
+def date_range(date_from: str | date, date_to: str | date) -> tuple[datetime, datetime]:
+    """
+    Даты "с ... по ... включительно" → [начало date_from; начало дня после date_to).
+    """
+    return day_range(date_from)[0], day_range(date_to)[1]
+
+
+def parse_time(value: str) -> time:
+    """
+    Время из запроса. LLM иногда пишет час одной цифрой ("9:00"),
+    fromisoformat такое не берёт — дополняем нулём.
+    """
+    value = value.strip()
+    if value[1:2] == ":":
+        value = "0" + value
+    return time.fromisoformat(value)
+
+
+def time_range(day: str, time_from: str, time_to: str) -> tuple[datetime, datetime]:
+    """
+    Интервал внутри дня, обе границы включительно → полуоткрытый
+    [time_from; time_to + 1 мкс). Точность timestamptz — микросекунда,
+    так что это ровно то же множество моментов, что и [from; to].
+    """
+    d = date.fromisoformat(day)
+    start = datetime.combine(d, parse_time(time_from), tzinfo=APP_TZ)
+    end = datetime.combine(d, parse_time(time_to), tzinfo=APP_TZ)
+    return start, end + timedelta(microseconds=1)
+
+
+def period_range(query_desc: dict) -> tuple[datetime, datetime, datetime | date]:
+    """
+    Окно top_n: час, день или неделя (с понедельника), содержащие date/hour.
+    Возвращает (начало, конец, ключ окна в таблице лидерборда).
+    """
+    d = date.fromisoformat(query_desc["date"])
+    period = query_desc.get("period") or "day"
+    if period == "hour":
+        start = datetime.combine(d, parse_time(query_desc.get("hour") or "00:00"), tzinfo=APP_TZ)
+        start = start.replace(minute=0, second=0, microsecond=0)
+        return start, start + timedelta(hours=1), start
+    if period == "week":
+        monday = d - timedelta(days=d.weekday())
+        return day_start(monday), day_start(monday + timedelta(days=7)), monday
+    return (*day_range(d), d)
+
+
+def series_range(query_desc: dict) -> tuple[str, datetime, datetime]:
+    """
+    (интервал, начало, конец) ряда. Интервал — из запроса (по умолчанию day),
+    но не мельче, чем нужно, чтобы уложиться в SERIES_MAX_BUCKETS точек.
+    Если даже недель больше, ряд обрезается до последних SERIES_MAX_BUCKETS
+    недель перед date_to: date_bin умеет только фиксированный шаг, месяцев нет.
+    """
+    date_from = date.fromisoformat(str(query_desc["date_from"]))
+    date_to = date.fromisoformat(str(query_desc["date_to"]))
+    ts_from, ts_to = date_range(date_from, date_to)
+    names = list(BUCKETS)
+    bucket = query_desc.get("bucket") if query_desc.get("bucket") in BUCKETS else "day"
+    while (ts_to - ts_from) / BUCKETS[bucket] > SERIES_MAX_BUCKETS and bucket != names[-1]:
+        bucket = names[names.index(bucket) + 1]
+    if (ts_to - ts_from) / BUCKETS[bucket] > SERIES_MAX_BUCKETS:
+        # обрезаем по календарным дням, чтобы начало осталось полуночью APP_TZ
+        date_from = date_to + timedelta(days=1) - BUCKETS[bucket] * SERIES_MAX_BUCKETS
+        ts_from = day_start(date_from)
+    return bucket, ts_from, ts_to
+
+
+def build_query(query_desc: dict, use_rollups: bool = USE_ROLLUPS) -> tuple[str, tuple] | None:
+    """
+    query_desc → (SQL, параметры), или None для неизвестного query_type.
+
+    Фильтры по датам всегда полуоткрытые диапазоны timestamptz по самой
+    колонке (sargable), под них заведены индексы из 004_query_indexes.sql.
+    """
+    qt = query_desc.get("query_type")
+
+    if qt == "total_videos":
+        return "SELECT COUNT(*) FROM videos;", ()
+
+    elif qt == "creator_videos_with_min_views":
+        return (
+            """
+            SELECT COUNT(*)
+            FROM videos
+            WHERE creator_id = %s
+              AND views_count > %s;
+            """,
+            (query_desc["creator_id"], query_desc["views_threshold"]),
+        )
+
+    elif qt == "creator_videos_in_date_range":
+        ts_from, ts_to = date_range(query_desc["date_from"], query_desc["date_to"])
+        return (
+            """
+            SELECT COUNT(*)
+            FROM videos
+            WHERE creator_id = %s
+              AND video_created_at >= %s
+              AND video_created_at < %s;
+            """,
+            (query_desc["creator_id"], ts_from, ts_to),
+        )
+
+    elif qt == "videos_with_min_views":
+        return (
+            """
+            SELECT COUNT(*)
+            FROM videos
+            WHERE views_count > %s;
+            """,
+            (query_desc["views_threshold"],),
+        )
+
+    elif qt == "videos_with_new_views_on_date":
+        if use_rollups:
+            return (
+                """
+                SELECT COUNT(*)
+                FROM video_daily_stats
+                WHERE day = %s
+                  AND positive_views_snapshots > 0;
+                """,
+                (date.fromisoformat(query_desc["date"]),),
+            )
+
+        ts_from, ts_to = day_range(query_desc["date"])
+        return (
+            """
+            SELECT COUNT(DISTINCT video_id)
+            FROM video_snapshots
+            WHERE created_at >= %s
+              AND created_at < %s
+              AND delta_views_count > 0;
+            """,
+            (ts_from, ts_to),
+        )
+
+    elif qt == "sum_views_for_videos_in_date_range":
+        ts_from, ts_to = date_range(query_desc["date_from"], query_desc["date_to"])
+        return (
+            """
+            SELECT COALESCE(SUM(views_count), 0)
+            FROM videos
+            WHERE video_created_at >= %s
+              AND video_created_at < %s;
+            """,
+            (ts_from, ts_to),
+        )
+
+    elif qt == "snapshots_with_negative_delta":
+        metric = query_desc["metric"]
+        day = query_desc.get("date")
+
+        # имена колонок берутся только из словаря, не из запроса
+        col = NEGATIVE_DELTA_COLUMNS.get(metric)
+        if not col:
+            return "SELECT 0;", ()
+
+        if use_rollups:
+            rollup_col = f"negative_{metric}_snapshots"
+            if day:
+                return (
+                    f"SELECT COALESCE(SUM({rollup_col}), 0) FROM daily_stats WHERE day = %s;",
+                    (date.fromisoformat(day),),
+                )
+            return f"SELECT COALESCE(SUM({rollup_col}), 0) FROM daily_stats;", ()
+
+        if day:
+            ts_from, ts_to = day_range(day)
+            return (
+                f"""
+                SELECT COUNT(*)
+                FROM video_snapshots
+                WHERE {col} < 0
+                  AND created_at >= %s
+                  AND created_at < %s;
+                """,
+                (ts_from, ts_to),
+            )
+        return (
+            f"""
+            SELECT COUNT(*)
+            FROM video_snapshots
+            WHERE {col} < 0;
+            """,
+            (),
+        )
+
+    elif qt == "creator_views_delta_in_time_range":
+        creator_id = query_desc["creator_id"]
+        time_from = query_desc["time_from"]
+        time_to = query_desc["time_to"]
+        ts_from, ts_to = time_range(query_desc["date"], time_from, time_to)
+
+        # почасовой агрегат покрывает [from; to) для целых часов,
+        # правую включительную границу добираем точечным запросом
+        if (
+            use_rollups
+            and time_from.endswith(":00")
+            and time_to.endswith(":00")
+            and time_from <= time_to
+        ):
+            hour_to = ts_to - timedelta(microseconds=1)
+            return (
+                """
+                SELECT
+                    (SELECT COALESCE(SUM(delta_views), 0)
+                     FROM creator_hourly_stats
+                     WHERE creator_id = %s
+                       AND hour >= %s
+                       AND hour < %s)
+                  + (SELECT COALESCE(SUM(s.delta_views_count), 0)
+                     FROM video_snapshots AS s
+                     JOIN videos AS v ON v.id = s.video_id
+                     WHERE v.creator_id = %s
+                       AND s.created_at >= %s
+                       AND s.created_at < %s);
+                """,
+                (creator_id, ts_from, hour_to, creator_id, hour_to, ts_to),
+            )
+
+        return (
+            """
+            SELECT COALESCE(SUM(s.delta_views_count), 0)
+            FROM video_snapshots AS s
+            JOIN videos AS v ON v.id = s.video_id
+            WHERE v.creator_id = %s
+              AND s.created_at >= %s
+              AND s.created_at < %s;
+            """,
+            (creator_id, ts_from, ts_to),
+        )
+
+    elif qt in SERIES_TYPES:
+        # ряды считаются по сырым снапшотам за один проход: date_bin от начала
+        # date_from в APP_TZ шагает по абсолютному времени, поэтому после
+        # перехода на летнее/зимнее время границы суток сдвигаются на час
+        col = NEGATIVE_DELTA_COLUMNS.get(query_desc.get("metric") or "views")
+        if not col:
+            return None
+        bucket, ts_from, ts_to = series_range(query_desc)
+        step = BUCKETS[bucket]
+
+        if qt == "metric_series":
+            creator_id = query_desc.get("creator_id")
+            join = "JOIN videos AS v ON v.id = s.video_id AND v.creator_id = %s" if creator_id else ""
+            return (
+                f"""
+                SELECT NULL, date_bin(%s, s.created_at, %s) AS bucket, SUM(s.{col})
+                FROM video_snapshots AS s
+                {join}
+                WHERE s.created_at >= %s
+                  AND s.created_at < %s
+                GROUP BY 2
+                ORDER BY 2;
+                """,
+                (step, ts_from, *([creator_id] if creator_id else []), ts_from, ts_to),
+            )
+
+        group_by = query_desc.get("group_by")
+        key, join = ("s.video_id", "") if group_by == "video" else \
+            ("v.creator_id", "JOIN videos AS v ON v.id = s.video_id")
+        top_n = min(int(query_desc.get("top_n") or SERIES_DEFAULT_TOP_N), SERIES_MAX_TOP_N)
+        return (
+            f"""
+            WITH per_bucket AS (
+                SELECT {key} AS key, date_bin(%s, s.created_at, %s) AS bucket, SUM(s.{col}) AS value
+                FROM video_snapshots AS s
+                {join}
+                WHERE s.created_at >= %s
+                  AND s.created_at < %s
+                GROUP BY 1, 2
+            ),
+            top AS (
+                SELECT key, SUM(value) AS total
+                FROM per_bucket
+                GROUP BY key
+                ORDER BY total DESC, key
+                LIMIT %s
+            )
+            SELECT p.key, p.bucket, p.value
+            FROM per_bucket AS p
+            JOIN top AS t USING (key)
+            ORDER BY t.total DESC, p.key, p.bucket;
+            """,
+            (step, ts_from, ts_from, ts_to, top_n),
+        )
+
+    elif qt == "top_n":
+        metric = query_desc.get("metric") or "views"
+        col = NEGATIVE_DELTA_COLUMNS.get(metric)
+        entity = query_desc.get("entity") or "creator"
+        period = query_desc.get("period") or "day"
+        table = LEADERBOARDS.get((entity, period))
+        if not col or not table:
+            return None
+        limit = min(int(query_desc.get("limit") or TOP_N_DEFAULT_LIMIT), TOP_N_MAX_LIMIT)
+        ts_from, ts_to, bucket = period_range(query_desc)
+        key = f"{entity}_id"
+
+        if use_rollups:
+            # index-only по (окно, delta_<метрика> DESC, ключ) из 007_leaderboards.sql
+            return (
+                f"""
+                SELECT {key}, delta_{metric}
+                FROM {table}
+                WHERE {period} = %s
+                ORDER BY delta_{metric} DESC, {key}
+                LIMIT %s;
+                """,
+                (bucket, limit),
+            )
+
+        join = "JOIN videos AS v ON v.id = s.video_id" if entity == "creator" else ""
+        source = "v.creator_id" if entity == "creator" else "s.video_id"
+        return (
+            f"""
+            SELECT {source} AS key, SUM(s.{col}) AS value
+            FROM video_snapshots AS s
+            {join}
+            WHERE s.created_at >= %s
+              AND s.created_at < %s
+            GROUP BY 1
+            ORDER BY value DESC, key
+            LIMIT %s;
+            """,
+            (ts_from, ts_to, limit),
+        )
+
+    return None
+
+
+def fused_part(query_desc: dict, use_rollups: bool = USE_ROLLUPS) -> tuple[str, tuple, str, tuple] | None:
+    """
+    Подзапрос multi как часть общего прохода: (источник из FUSED_SOURCES,
+    область, агрегат с местом {filter} под FILTER, условие). Область и
+    условие — пары (SQL, параметры): область — фильтр, по которому подзапрос
+    читает таблицу (по индексу из 004_query_indexes.sql или целиком, "TRUE"),
+    условие — всё остальное.
+
+    В один проход объединяются только части с одной областью: строки читаются
+    один раз, как и по отдельности. Части с разными областями остаются
+    отдельными запросами — OR их условий лишил бы каждую своего индекса.
+
+    None — подзапрос считается отдельно через build_query: ряды, лидеры
+    и то, что при use_rollups читается из агрегатов.
+    """
+    qt = query_desc.get("query_type")
+
+    if qt in ("total_videos", "videos_with_min_views"):
+        condition = ("v.views_count > %s", (query_desc["views_threshold"],)) if qt == "videos_with_min_views" \
+            else ("TRUE", ())
+        return "videos", ("TRUE", ()), "COUNT(*){filter}", condition
+
+    elif qt == "creator_videos_with_min_views":
+        return (
+            "videos", ("v.creator_id = %s", (query_desc["creator_id"],)), "COUNT(*){filter}",
+            ("v.views_count > %s", (query_desc["views_threshold"],)),
+        )
+
+    elif qt == "creator_videos_in_date_range":
+        return (
+            "videos", ("v.creator_id = %s", (query_desc["creator_id"],)), "COUNT(*){filter}",
+            (
+                "v.video_created_at >= %s AND v.video_created_at < %s",
+                date_range(query_desc["date_from"], query_desc["date_to"]),
+            ),
+        )
+
+    elif qt == "sum_views_for_videos_in_date_range":
+        return (
+            "videos",
+            (
+                "v.video_created_at >= %s AND v.video_created_at < %s",
+                date_range(query_desc["date_from"], query_desc["date_to"]),
+            ),
+            "COALESCE(SUM(v.views_count){filter}, 0)", ("TRUE", ()),
+        )
+
+    # снапшоты за день читаются по частичным индексам (delta > 0, delta < 0
+    # по метрике): условие индекса входит в область, иначе общий проход
+    # читал бы все снапшоты дня вместо нескольких маленьких индексов
+    elif qt == "videos_with_new_views_on_date" and not use_rollups:
+        return (
+            "snapshots",
+            ("s.delta_views_count > 0 AND s.created_at >= %s AND s.created_at < %s", day_range(query_desc["date"])),
+            "COUNT(DISTINCT s.video_id){filter}", ("TRUE", ()),
+        )
+
+    elif qt == "snapshots_with_negative_delta" and not use_rollups:
+        col = NEGATIVE_DELTA_COLUMNS.get(query_desc["metric"])
+        if not col:
+            return None
+        if query_desc.get("date"):
+            return (
+                "snapshots", (f"s.{col} < 0 AND s.created_at >= %s AND s.created_at < %s", day_range(query_desc["date"])),
+                "COUNT(*){filter}", ("TRUE", ()),
+            )
+        return "snapshots", (f"s.{col} < 0", ()), "COUNT(*){filter}", ("TRUE", ())
+
+    elif qt == "creator_views_delta_in_time_range" and not use_rollups:
+        ts_from, ts_to = time_range(query_desc["date"], query_desc["time_from"], query_desc["time_to"])
+        return (
+            "creator_snapshots",
+            ("v.creator_id = %s AND s.created_at >= %s AND s.created_at < %s",
+             (query_desc["creator_id"], *day_range(query_desc["date"]))),
+            "COALESCE(SUM(s.delta_views_count){filter}, 0)",
+            ("s.created_at >= %s AND s.created_at < %s", (ts_from, ts_to)),
+        )
+
+    return None
+
+
+def build_fused(parts: list[tuple[str, tuple, str, tuple]]) -> tuple[str, tuple]:
+    """
+    Части fused_part с общими источником и областью → один SELECT:
+    область в WHERE, по агрегату с FILTER (WHERE условие) на каждую часть.
+    """
+    source, (scope, scope_params), _, _ = parts[0]
+    columns = ",\n       ".join(agg.format(filter=f" FILTER (WHERE {cond})") for _, _, agg, (cond, _) in parts)
+    params = tuple(p for *_, (_, cond_params) in parts for p in cond_params)
+    sql = f"SELECT {columns}\nFROM {FUSED_SOURCES[source]}"
+    if scope != "TRUE":
+        sql += f"\nWHERE {scope}"
+        params += tuple(scope_params)
+    return sql + ";", params
+
+
+def plan_multi(descs: list[dict], use_rollups: bool = USE_ROLLUPS, backend: str | None = None) -> list[list[int]]:
+    """
+    Подзапросы multi по группам (номера в descs): в группе — то, что
+    считается одним проходом (общие бэкенд, источник и область fused_part),
+    остальное — по одному. Группы независимы и могут выполняться параллельно.
+    """
+    groups: dict[tuple, list[int]] = {}
+    for i, query_desc in enumerate(descs):
+        executor = backends.backend_for(query_desc.get("query_type"), backend)
+        part = fused_part(query_desc, use_rollups and executor.rollups)
+        key = (executor.name, part[0], part[1][0], tuple(part[1][1])) if part else (i,)
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
+
+
+def query_dependencies(query_desc: dict) -> list[tuple[str, datetime | None, datetime | None]] | None:
+    """
+    От каких данных зависит ответ: [(таблица, from, to)], диапазон
+    полуоткрытый по video_created_at / created_at, None — без границы.
+    None для неизвестного query_type.
+
+    Агрегаты обновляются в той же транзакции, что и снапшоты,
+    поэтому отдельно не указываются.
+    """
+    qt = query_desc.get("query_type")
+
+    if qt in ("total_videos", "creator_videos_with_min_views", "videos_with_min_views"):
+        return [("videos", None, None)]
+
+    elif qt in ("creator_videos_in_date_range", "sum_views_for_videos_in_date_range"):
+        return [("videos", *date_range(query_desc["date_from"], query_desc["date_to"]))]
+
+    elif qt == "videos_with_new_views_on_date":
+        return [("video_snapshots", *day_range(query_desc["date"]))]
+
+    elif qt == "snapshots_with_negative_delta":
+        day = query_desc.get("date")
+        return [("video_snapshots", *day_range(day)) if day else ("video_snapshots", None, None)]
+
+    elif qt == "creator_views_delta_in_time_range":
+        return [("video_snapshots", *time_range(query_desc["date"], query_desc["time_from"], query_desc["time_to"]))]
+
+    elif qt in SERIES_TYPES:
+        return [("video_snapshots", *date_range(query_desc["date_from"], query_desc["date_to"]))]
+
+    elif qt == "top_n":
+        return [("video_snapshots", *period_range(query_desc)[:2])]
+
+    elif qt == MULTI_TYPE:
+        deps = [query_dependencies(d) for d in query_desc.get("queries") or []]
+        if not deps or None in deps:
+            return None
+        return [dep for part in deps for dep in part]
+
+    return None
+
+
+def series_result(query_desc: dict, rows: list[tuple]) -> dict:
+    """
+    Строки (ключ, интервал, значение) → ряд с нулями в пустых интервалах:
+    {"metric", "bucket", "buckets": [ISO-время], "series": {ключ: [числа]}}.
+    Только JSON-типы, чтобы ряд можно было положить в кэш результатов.
+    """
+    bucket, ts_from, ts_to = series_range(query_desc)
+    # шаги в UTC, как у date_bin: сложение с datetime в APP_TZ идёт по
+    # настенным часам и при смене смещения расходится с интервалами SQL
+    buckets = []
+    t = ts_from.astimezone(timezone.utc)
+    while t < ts_to:
+        buckets.append(t)
+        t += BUCKETS[bucket]
+    index = {b: i for i, b in enumerate(buckets)}
+
+    series = {}
+    for key, ts, value in rows:
+        label = key if key is not None else (query_desc.get("creator_id") or "все видео")
+        values = series.setdefault(label, [0] * len(buckets))
+        values[index[ts.astimezone(timezone.utc)]] = int(value or 0)
+
+    return {
+        "metric": query_desc.get("metric") or "views",
+        "bucket": bucket,
+        "buckets": [b.astimezone(APP_TZ).isoformat() for b in buckets],
+        "series": series,
+    }
+
+
+def top_result(query_desc: dict, rows: list[tuple]) -> dict:
+    """
+    Строки (ключ, прирост) → {"entity", "metric", "period", "start", "rows": [[ключ, прирост]]}.
+    """
+    return {
+        "entity": query_desc.get("entity") or "creator",
+        "metric": query_desc.get("metric") or "views",
+        "period": query_desc.get("period") or "day",
+        "start": period_range(query_desc)[0].isoformat(),
+        "rows": [[key, int(value)] for key, value in rows],
+    }
+
+
+def execute_query(query_desc: dict, use_rollups: bool = USE_ROLLUPS, backend: str | None = None) -> int | dict | list:
+    """
+    Число для обычных query_type, ряд (см. series_result) для SERIES_TYPES,
+    таблица лидеров (см. top_result) для top_n, список ответов для multi.
+
+    Бэкенд — по QUERY_BACKENDS (backends.py) или явно: "postgres" / "duckdb".
+    Агрегаты используются, только если они есть у бэкенда.
+    """
+    qt = query_desc.get("query_type")
+    if qt == MULTI_TYPE:
+        return execute_multi(query_desc.get("queries") or [], use_rollups, backend)
+
+    executor = backends.backend_for(qt, backend)
+    built = build_query(query_desc, use_rollups and executor.rollups)
+    if built is None:
+        log.warning("unknown query_type: %s", qt)
+        return 0
+
+    sql, params = built
+    started = clock.perf_counter()
+    rows = executor.fetch(sql, params)
+    elapsed = clock.perf_counter() - started
+    metrics.observe_span("sql", elapsed, qt)
+    metrics.slow_query(query_desc, sql, params, elapsed, executor.name, lambda: executor.explain(sql, params))
+    if qt in SERIES_TYPES:
+        result = series_result(query_desc, rows)
+    elif qt == "top_n":
+        result = top_result(query_desc, rows)
+    else:
+        result = rows[0][0]
+
+    log.debug("%s/%s params=%s result=%s", qt, executor.name, params, result)
+    return result
+
+
+def execute_group(descs: list[dict], use_rollups: bool = USE_ROLLUPS, backend: str | None = None) -> list:
+    """
+    Ответы на группу из plan_multi: один подзапрос — обычный execute_query,
+    несколько — один запрос build_fused.
+    """
+    if len(descs) == 1:
+        return [execute_query(descs[0], use_rollups, backend)]
+
+    executor = backends.backend_for(descs[0]["query_type"], backend)
+    sql, params = build_fused([fused_part(d, use_rollups and executor.rollups) for d in descs])
+    started = clock.perf_counter()
+    rows = executor.fetch(sql, params)
+    elapsed = clock.perf_counter() - started
+    metrics.observe_span("sql", elapsed, MULTI_TYPE)
+    metrics.slow_query(
+        {"query_type": MULTI_TYPE, "queries": descs}, sql, params, elapsed, executor.name,
+        lambda: executor.explain(sql, params),
+    )
+    log.debug("%s/%s fused %d: %s", MULTI_TYPE, executor.name, len(descs), rows[0])
+    return list(rows[0])
+
+
+def execute_multi(descs: list[dict], use_rollups: bool = USE_ROLLUPS, backend: str | None = None) -> list:
+    """
+    Ответы на подзапросы multi в том же порядке; группы plan_multi — по очереди.
+    Бот выполняет группы параллельно, каждую через db.run.
+    """
+    results = [None] * len(descs)
+    for group in plan_multi(descs, use_rollups, backend):
+        values = execute_group([descs[i] for i in group], use_rollups, backend)
+        for i, value in zip(group, values):
+            results[i] = value
+    return results
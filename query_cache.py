@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from normalize import extract_slots, DATE_ISO_RE, TIME_RE
+
+NLP_CACHE_SIZE = int(os.getenv("NLP_CACHE_SIZE", "1000"))
+# время жизни записи, сек; 0 — без ограничения
+NLP_CACHE_TTL = float(os.getenv("NLP_CACHE_TTL", "86400"))
+# файл для сохранения кэша между перезапусками; пусто — только в памяти
+NLP_CACHE_PATH = os.getenv("NLP_CACHE_PATH", "")
+# через сколько секунд после первой новой записи сохранять файл, сек:
+# промахи за это время уходят на диск одной записью в фоновом потоке
+NLP_CACHE_SAVE_DELAY = float(os.getenv("NLP_CACHE_SAVE_DELAY", "5"))
+
+log = logging.getLogger("query_cache")
+
+
+def to_template(query_desc: dict, slots: dict) -> dict | None:
+    """
+    Заменить значения query_desc, взятые из текста, на ссылки {"$slot": имя}.
+
+    Если в ответе есть дата/время/число, которое не удаётся однозначно
+    сопоставить со слотом (модель вывела его сама: "вчера", "10 тысяч"...),
+    такой ответ кэшировать нельзя — возвращаем None.
+    """
+    template = {}
+    for key, value in query_desc.items():
+        if key == "query_type" or value is None or isinstance(value, bool):
+            template[key] = value
+            continue
+
+        # подзапросы multi — каждый со своими ссылками на те же слоты
+        if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+            items = [to_template(item, slots) for item in value]
+            if any(item is None for item in items):
+                return None
+            template[key] = items
+            continue
+
+        names = [name for name, slot_value in slots.items() if slot_value == value]
+        if len(names) == 1:
+            template[key] = {"$slot": names[0]}
+        elif names:
+            return None
+        elif isinstance(value, (int, float)):
+            return None
+        elif isinstance(value, str) and (DATE_ISO_RE.search(value) or TIME_RE.search(value)):
+            return None
+        elif isinstance(value, str) and any(c.isdigit() for c in value):
+            return None
+        else:
+            template[key] = value
+
+    return template
+
+
+def fill_template(template: dict, slots: dict) -> dict | None:
+    query_desc = {}
+    for key, value in template.items():
+        if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+            value = [fill_template(item, slots) for item in value]
+            if any(item is None for item in value):
+                return None
+        elif isinstance(value, dict) and "$slot" in value:
+            if value["$slot"] not in slots:
+                return None
+            value = slots[value["$slot"]]
+        query_desc[key] = value
+    return query_desc
+
+
+class QueryCache:
+    """
+    Кэш parse_user_query по шаблону вопроса.
+
+    Ключ — нормализованный текст, где даты, время, числа и id заменены
+    на слоты; значение — query_desc со ссылками на слоты. При попадании
+    слоты заполняются из нового текста, поэтому "с 1 по 5 ноября" и
+    "с 3 по 9 декабря" обслуживаются одной записью.
+    """
+
+    def __init__(
+        self,
+        max_size: int = NLP_CACHE_SIZE,
+        ttl: float = NLP_CACHE_TTL,
+        path: str | Path | None = NLP_CACHE_PATH,
+        save_delay: float = NLP_CACHE_SAVE_DELAY,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.save_delay = save_delay
+        self._save_timer: threading.Timer | None = None
+
+        self._entries: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.saved_seconds = 0.0
+
+        if self.path and self.path.exists():
+            self._load()
+
+    def _expired(self, stored_at: float) -> bool:
+        return bool(self.ttl) and time.time() - stored_at > self.ttl
+
+    def get(self, user_text: str) -> dict | None:
+        key, slots = extract_slots(user_text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+
+            query_desc = fill_template(entry[0], slots) if entry else None
+            if query_desc is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if self.llm_calls:
+                self.saved_seconds += self.llm_seconds / self.llm_calls
+            return query_desc
+
+    def put(self, user_text: str, query_desc: dict, llm_seconds: float | None):
+        """
+        Запомнить ответ модели. llm_seconds — сколько занял вызов,
+        из среднего по ним считается сэкономленное время; None — ответ
+        не от отдельного вызова (часть составного вопроса).
+        """
+        if llm_seconds is not None:
+            with self._lock:
+                self.llm_calls += 1
+                self.llm_seconds += llm_seconds
+
+        if query_desc.get("query_type") in (None, "unknown"):
+            return
+
+        key, slots = extract_slots(user_text)
+        template = to_template(query_desc, slots)
+        if template is None:
+            with self._lock:
+                self.uncacheable += 1
+            return
+
+        with self._lock:
+            self._entries[key] = (template, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        # put вызывается из event loop: файл пишет фоновый таймер, не чаще
+        # раза в save_delay секунд
+        if self.path:
+            self._schedule_save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "uncacheable": self.uncacheable,
+                "llm_calls": self.llm_calls,
+                "llm_avg_seconds": self.llm_seconds / self.llm_calls if self.llm_calls else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def flush(self):
+        """
+        Сохранить несохранённые записи сразу (при остановке бота).
+        """
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self._save()
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self._save_scheduled)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _save_scheduled(self):
+        with self._lock:
+            self._save_timer = None
+        self._save()
+
+    def _load(self):
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("не удалось прочитать кэш запросов: %r", e)
+            return
+
+        for key, template, stored_at in data.get("entries", []):
+            if not self._expired(stored_at):
+                self._entries[key] = (template, stored_at)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        with self._lock:
+            data = {"entries": [[k, t, ts] for k, (t, ts) in self._entries.items()]}
+
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            tmp.replace(self.path)
+        except OSError as e:
+            log.warning("не удалось сохранить кэш запросов: %r", e)
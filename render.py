@@ -0,0 +1,171 @@
+"""
+Текстовое представление рядов (queries.SERIES_TYPES), лидеров (top_n)
+и ответов на несколько вопросов сразу (multi) для Telegram.
+
+Один ряд — спарклайн и таблица «интервал → значение», несколько рядов —
+спарклайн с итогом на каждый и общая таблица по первым SERIES_TABLE_COLUMNS,
+лидеры — нумерованный список «ключ → прирост», multi — нумерованный список
+«подпись — ответ». Всё моноширинным <pre>; длинный ответ режется по строкам на сообщения
+не длиннее лимита Telegram, бот отправляет их по очереди.
+"""
+import html
+from datetime import date, datetime, timedelta
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+SERIES_TABLE_COLUMNS = 5
+SPARK = "▁▂▃▄▅▆▇█"
+
+METRIC_NAMES = {"views": "просмотры", "likes": "лайки", "comments": "комментарии", "reports": "жалобы"}
+BUCKET_NAMES = {"hour": "по часам", "day": "по дням", "week": "по неделям"}
+ENTITY_NAMES = {"creator": "креаторы", "video": "видео"}
+PERIOD_NAMES = {"hour": "за час", "day": "за день", "week": "за неделю с"}
+
+
+def sparkline(values: list[int]) -> str:
+    if not values:
+        return ""
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return SPARK[0] * len(values)
+    return "".join(SPARK[round((v - lo) / (hi - lo) * (len(SPARK) - 1))] for v in values)
+
+
+def bucket_label(iso: str, bucket: str) -> str:
+    ts = datetime.fromisoformat(iso)
+    if bucket == "hour":
+        return ts.strftime("%d.%m %H:%M")
+    # после смены летнего времени сутки начинаются в 23:00 или 01:00 — дата по середине интервала
+    return (ts + timedelta(hours=12)).strftime("%d.%m.%Y")
+
+
+def series_lines(result: dict) -> list[str]:
+    """
+    Ряд из queries.series_result → строки текста без разметки.
+    """
+    bucket = result["bucket"]
+    labels = [bucket_label(b, bucket) for b in result["buckets"]]
+    series = result["series"]
+    lines = [f"{METRIC_NAMES.get(result['metric'], result['metric'])} {BUCKET_NAMES[bucket]}"]
+    if labels:
+        lines[0] += f", {labels[0]} — {labels[-1]}"
+    if not series:
+        return lines + ["нет данных за период"]
+
+    width = max(len(label) for label in labels)
+    if len(series) == 1:
+        (values,) = series.values()
+        lines += [f"{sparkline(values)}  Σ {sum(values)}", ""]
+        lines += [f"{label:<{width}} {value:>10}" for label, value in zip(labels, values)]
+        return lines
+
+    names = list(series)
+    key_width = min(max(len(name) for name in names), 20)
+    for i, name in enumerate(names, 1):
+        values = series[name]
+        lines.append(f"#{i:<2} {name[:key_width]:<{key_width}} {sparkline(values)}  Σ {sum(values)}")
+
+    shown = names[:SERIES_TABLE_COLUMNS]
+    lines += ["", " " * width + "".join(f"{'#' + str(i):>10}" for i in range(1, len(shown) + 1))]
+    for row, label in enumerate(labels):
+        lines.append(f"{label:<{width}}" + "".join(f"{series[name][row]:>10}" for name in shown))
+    return lines
+
+
+def top_lines(result: dict) -> list[str]:
+    """
+    Лидеры из queries.top_result → строки текста без разметки.
+    """
+    start = datetime.fromisoformat(result["start"])
+    when = start.strftime("%d.%m.%Y %H:%M") if result["period"] == "hour" else start.strftime("%d.%m.%Y")
+    lines = [
+        f"{ENTITY_NAMES[result['entity']]}: прирост, "
+        f"{METRIC_NAMES.get(result['metric'], result['metric'])} {PERIOD_NAMES[result['period']]} {when}"
+    ]
+    if not result["rows"]:
+        return lines + ["нет данных за период"]
+    width = max(len(key) for key, _ in result["rows"])
+    lines += [f"{i:>2}. {key:<{width}} {value:>10}" for i, (key, value) in enumerate(result["rows"], 1)]
+    return lines
+
+
+def _day(iso: str) -> str:
+    return date.fromisoformat(iso).strftime("%d.%m.%Y")
+
+
+def describe(query_desc: dict) -> str:
+    """
+    Короткая подпись к ответу на подзапрос multi.
+    """
+    qt = query_desc.get("query_type")
+    d = query_desc
+    if qt == "total_videos":
+        return "всего видео"
+    if qt == "creator_videos_in_date_range":
+        return f"видео креатора {d['creator_id']} с {_day(d['date_from'])} по {_day(d['date_to'])}"
+    if qt == "creator_videos_with_min_views":
+        return f"видео креатора {d['creator_id']} больше {d['views_threshold']} просмотров"
+    if qt == "videos_with_min_views":
+        return f"видео больше {d['views_threshold']} просмотров"
+    if qt == "sum_views_for_videos_in_date_range":
+        return f"просмотры видео, вышедших с {_day(d['date_from'])} по {_day(d['date_to'])}"
+    if qt == "videos_with_new_views_on_date":
+        return f"видео с новыми просмотрами {_day(d['date'])}"
+    if qt == "snapshots_with_negative_delta":
+        metric = METRIC_NAMES.get(d.get("metric"), d.get("metric"))
+        return f"замеры, где уменьшились {metric}" + (f", {_day(d['date'])}" if d.get("date") else "")
+    if qt == "creator_views_delta_in_time_range":
+        return f"прирост просмотров креатора {d['creator_id']} {_day(d['date'])} {d['time_from']}–{d['time_to']}"
+    return qt or "запрос"
+
+
+def multi_lines(descs: list[dict], values: list) -> list[str]:
+    """
+    Ответы на подзапросы multi → строки: число — «N. подпись — ответ»,
+    ряд и лидеры — их строки под номером, None — не понятый вопрос.
+    """
+    lines = []
+    for i, (query_desc, value) in enumerate(zip(descs, values), 1):
+        qt = query_desc.get("query_type")
+        if value is None:
+            lines.append(f"{i}. не понял вопрос")
+        elif isinstance(value, dict):
+            part = top_lines(value) if qt == "top_n" else series_lines(value)
+            lines += [f"{i}. {part[0]}", *part[1:]]
+        else:
+            lines.append(f"{i}. {describe(query_desc)} — {value}")
+    return lines
+
+
+def render_lines(lines: list[str], limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """
+    Сообщения (HTML): строки режутся на куски, каждый в своём <pre>.
+    """
+    overhead = len("<pre></pre>")
+    messages = []
+    chunk: list[str] = []
+    size = overhead
+    for line in lines:
+        line = html.escape(line)
+        if chunk and size + len(line) + 1 > limit:
+            messages.append("<pre>" + "\n".join(chunk) + "</pre>")
+            chunk, size = [], overhead
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        messages.append("<pre>" + "\n".join(chunk) + "</pre>")
+    return messages
+
+
+def render_result(query_type: str, result: dict, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """
+    Сообщения для ответа не-скалярного query_type (queries.NON_SCALAR_TYPES).
+    """
+    lines = top_lines(result) if query_type == "top_n" else series_lines(result)
+    return render_lines(lines, limit)
+
+
+def render_multi(descs: list[dict], values: list, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """
+    Сообщения для ответа на multi: values — ответы в порядке descs.
+    """
+    return render_lines(multi_lines(descs, values), limit)
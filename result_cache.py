@@ -0,0 +1,343 @@
+"""
+Кэш результатов execute_query по нормализованному query_desc.
+
+Запись помнит версию данных (migrations/006_data_changes.sql), при которой
+её посчитали, и диапазоны, от которых зависит ответ (queries.query_dependencies).
+Запись устарела, если после её версии в data_changes появилось изменение
+той же таблицы с пересекающимся диапазоном — остальные записи живут дальше.
+
+Ответы про закрытые прошлые периоды хранятся без TTL: их меняет только
+загрузка задним числом, а её видно по журналу. Для открытых периодов
+и вопросов по всей таблице действует RESULT_CACHE_TTL.
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from decimal import Decimal
+from pathlib import Path
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+import db
+from queries import USE_ROLLUPS, execute_group, execute_query, query_dependencies
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+# сек для ответов, которые зависят от открытого периода; 0 — без ограничения
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+# как часто бот читает data_changes, сек
+RESULT_CACHE_POLL = float(os.getenv("RESULT_CACHE_POLL", "2"))
+# SQLite-файл, общий для нескольких процессов бота; пусто — только в памяти
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+# сколько последних изменений держать для проверки записей
+RESULT_CACHE_LOG_SIZE = int(os.getenv("RESULT_CACHE_LOG_SIZE", "10000"))
+
+log = logging.getLogger("result_cache")
+
+
+def record_changes(cur, changes: list[tuple[str, datetime | None, datetime | None, int]]) -> int | None:
+    """
+    Записать изменения текущей транзакции: [(таблица, min, max, строк)].
+
+    Вызывать последним шагом перед коммитом: блокировка строки data_version
+    держится до конца транзакции. Возвращает новую версию, или None,
+    если менять нечего.
+    """
+    changes = [c for c in changes if c[3]]
+    if not changes:
+        return None
+
+    cur.execute("UPDATE data_version SET version = version + 1 RETURNING version;")
+    version = cur.fetchone()[0]
+    for table, ts_from, ts_to, rows in changes:
+        cur.execute(
+            "INSERT INTO data_changes (version, table_name, ts_from, ts_to, rows) VALUES (%s, %s, %s, %s, %s);",
+            (version, table, ts_from, ts_to, rows),
+        )
+    return version
+
+
+def cache_key(query_desc: dict) -> str:
+    return json.dumps(
+        {k: v for k, v in query_desc.items() if v is not None},
+        sort_keys=True, ensure_ascii=False,
+    )
+
+
+def _overlaps(dep: tuple, change: tuple) -> bool:
+    table, lo, hi = dep
+    _, changed_table, ts_from, ts_to = change
+    return (
+        table == changed_table
+        and (lo is None or ts_to is None or ts_to >= lo)
+        and (hi is None or ts_from is None or ts_from < hi)
+    )
+
+
+def _plain(value):
+    # SUM(bigint) приходит как Decimal, в JSON и SQLite храним число
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+class ResultCache:
+    """
+    LRU/TTL кэш в памяти и, если задан path, общий SQLite-файл.
+
+    В памяти запись: key → (результат, версия, зависимости, истекает_в | None).
+    """
+
+    def __init__(
+        self,
+        max_size: int = RESULT_CACHE_SIZE,
+        ttl: float = RESULT_CACHE_TTL,
+        path: str | Path | None = RESULT_CACHE_PATH,
+        log_size: int = RESULT_CACHE_LOG_SIZE,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        # (версия, таблица, ts_from, ts_to) по возрастанию версии
+        self._changes: deque = deque(maxlen=log_size)
+        # последняя прочитанная версия; None — журнал ещё не читали
+        self.version: int | None = None
+        # изменения с версией <= _floor уже выпали из _changes
+        self._floor = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+        self._store = None
+        # SQLite-соединение одно на процесс: запросы к нему по очереди, под своим
+        # замком — _lock держится только на время работы с памятью
+        self._store_lock = threading.Lock()
+        if self.path:
+            self._store = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._store.execute("PRAGMA journal_mode=WAL;")
+            self._store.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key         TEXT PRIMARY KEY,
+                    value       TEXT NOT NULL,
+                    version     INTEGER NOT NULL,
+                    deps        TEXT NOT NULL,
+                    expires_at  REAL
+                );
+                """
+            )
+            self._store.commit()
+
+    def _stale(self, version: int, deps: list) -> bool:
+        if self.version is None or version < self._floor:
+            return True
+        return any(
+            change[0] > version and _overlaps(dep, change)
+            for change in self._changes
+            for dep in deps
+        )
+
+    def _expires_at(self, deps: list) -> float | None:
+        now = datetime.now(timezone.utc)
+        closed = all(hi is not None and hi <= now for _, _, hi in deps)
+        if closed or not self.ttl:
+            return None
+        return time.time() + self.ttl
+
+    def get(self, query_desc: dict, memory_only: bool = False):
+        """
+        Результат из кэша или None. К базе не обращается.
+
+        С memory_only — только память, без чтения SQLite-файла: так можно
+        звать из event loop, а промах добирать через db.run (execute);
+        промах при этом не считается, его посчитает чтение файла.
+        """
+        key = cache_key(query_desc)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self._store is not None:
+            if memory_only:
+                return None
+            entry = self._read_store(key)
+
+        with self._lock:
+            if entry is not None:
+                value, version, deps, expires_at = entry
+                if (expires_at and expires_at < time.time()) or self._stale(version, deps):
+                    self._entries.pop(key, None)
+                    entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.hits += 1
+            return entry[0]
+
+    def get_many(self, descs: list[dict]) -> list:
+        """
+        get для каждого описания, с чтением SQLite. Вызывать в потоке.
+        """
+        return [self.get(query_desc) for query_desc in descs]
+
+    def put(self, query_desc: dict, value, version: int):
+        """
+        Запомнить результат, посчитанный на данных не старее version.
+        """
+        deps = query_dependencies(query_desc)
+        if deps is None:
+            return
+
+        key = cache_key(query_desc)
+        entry = (_plain(value), version, deps, self._expires_at(deps))
+        with self._lock:
+            if self._stale(version, deps):
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        if self._store is not None:
+            self._write_store(key, entry)
+
+    def compute(self, query_desc: dict, use_rollups: bool = USE_ROLLUPS):
+        """
+        Выполнить execute_query и запомнить результат. Вызывать в потоке (db.run).
+        """
+        if self.version is None:
+            self.refresh()
+        # версия до запроса: всё, что закоммичено позже, проверяется по журналу
+        version = self.version
+        value = execute_query(query_desc, use_rollups)
+        self.put(query_desc, value, version)
+        return value
+
+    def compute_group(self, descs: list[dict], use_rollups: bool = USE_ROLLUPS) -> list:
+        """
+        Выполнить группу подзапросов multi (queries.plan_multi) одним
+        execute_group и запомнить каждый ответ отдельно. Вызывать в потоке (db.run).
+        """
+        if self.version is None:
+            self.refresh()
+        version = self.version
+        values = execute_group(descs, use_rollups)
+        for query_desc, value in zip(descs, values):
+            self.put(query_desc, value, version)
+        return values
+
+    def execute(self, query_desc: dict, use_rollups: bool = USE_ROLLUPS):
+        value = self.get(query_desc)
+        if value is None:
+            value = self.compute(query_desc, use_rollups)
+        return value
+
+    def refresh(self) -> int:
+        """
+        Дочитать data_changes и выбросить затронутые записи из памяти.
+        Возвращает число выброшенных записей.
+        """
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                since = self.version
+                if since is None:
+                    # первый запуск: вся доступная история в пределах log_size
+                    cur.execute("SELECT version FROM data_version;")
+                    current = cur.fetchone()[0]
+                    since = max(current - self._changes.maxlen, 0)
+                cur.execute(
+                    """
+                    SELECT version, table_name, ts_from, ts_to FROM data_changes
+                    WHERE version > %s ORDER BY version;
+                    """,
+                    (since,),
+                )
+                rows = cur.fetchall()
+
+        with self._lock:
+            if self.version is None:
+                self._floor = since
+                self.version = current
+            for row in rows:
+                if len(self._changes) == self._changes.maxlen:
+                    self._floor = self._changes[0][0]
+                self._changes.append(tuple(row))
+                self.version = max(self.version, row[0])
+
+            if not rows:
+                return 0
+            stale = [key for key, (_, version, deps, _) in self._entries.items() if self._stale(version, deps)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidated += len(stale)
+
+        if stale:
+            log.info("версия данных %s, сброшено записей: %d", self.version, len(stale))
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidated": self.invalidated,
+                "version": self.version,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._store is not None:
+            with self._store_lock:
+                self._store.execute("DELETE FROM results;")
+                self._store.commit()
+
+    def _read_store(self, key: str) -> tuple | None:
+        try:
+            with self._store_lock:
+                row = self._store.execute(
+                    "SELECT value, version, deps, expires_at FROM results WHERE key = ?;", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            log.warning("не удалось прочитать кэш результатов: %r", e)
+            return None
+        if row is None:
+            return None
+
+        value, version, deps, expires_at = row
+        deps = [
+            (table, lo and datetime.fromisoformat(lo), hi and datetime.fromisoformat(hi))
+            for table, lo, hi in json.loads(deps)
+        ]
+        return json.loads(value), version, deps, expires_at
+
+    def _write_store(self, key: str, entry: tuple):
+        value, version, deps, expires_at = entry
+        deps = [(table, lo and lo.isoformat(), hi and hi.isoformat()) for table, lo, hi in deps]
+        try:
+            with self._store_lock:
+                self._store.execute(
+                    """
+                    INSERT INTO results (key, value, version, deps, expires_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = excluded.value, version = excluded.version,
+                        deps = excluded.deps, expires_at = excluded.expires_at
+                    WHERE excluded.version >= results.version;
+                    """,
+                    (key, json.dumps(value), version, json.dumps(deps), expires_at),
+                )
+                self._store.commit()
+        except sqlite3.Error as e:
+            log.warning("не удалось сохранить кэш результатов: %r", e)
@@ -0,0 +1,204 @@
+"""
+Агрегаты по video_snapshots (migrations/003_rollups.sql, 007_leaderboards.sql).
+
+load_data после каждой пачки вызывает apply_new_snapshots() только для
+реально вставленных снапшотов, так что агрегаты растут вместе с таблицей.
+Для уже загруженных данных:
+
+  python rollups.py rebuild   # пересчитать с нуля
+  python rollups.py check     # сравнить ответы по агрегатам и по сырым данным
+"""
+import os
+import argparse
+
+import psycopg2
+
+DB_DSN = os.getenv("DB_DSN", "dbname=video_analytics")
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "UTC")
+
+METRICS = ("views", "likes", "comments", "reports")
+
+_DELTAS = [(f"delta_{m}", f"SUM(delta_{m}_count)") for m in METRICS]
+_NEGATIVE = [(f"negative_{m}_snapshots", f"COUNT(*) FILTER (WHERE delta_{m}_count < 0)") for m in METRICS]
+
+# таблица → (ключ, выражения ключа, агрегаты)
+ROLLUPS = {
+    "video_daily_stats": (
+        ("video_id", "day"),
+        ("s.video_id", "s.created_at::date"),
+        [("snapshots", "COUNT(*)")] + _DELTAS
+        + [("positive_views_snapshots", "COUNT(*) FILTER (WHERE delta_views_count > 0)")]
+        + _NEGATIVE,
+    ),
+    "creator_hourly_stats": (
+        ("creator_id", "hour"),
+        ("v.creator_id", "date_trunc('hour', s.created_at)"),
+        [("snapshots", "COUNT(*)")] + _DELTAS,
+    ),
+    "daily_stats": (
+        ("day",),
+        ("s.created_at::date",),
+        [("snapshots", "COUNT(*)")] + _NEGATIVE,
+    ),
+    # лидерборды (migrations/007_leaderboards.sql)
+    "creator_daily_stats": (
+        ("creator_id", "day"),
+        ("v.creator_id", "s.created_at::date"),
+        [("snapshots", "COUNT(*)")] + _DELTAS,
+    ),
+    "creator_weekly_stats": (
+        ("creator_id", "week"),
+        ("v.creator_id", "date_trunc('week', s.created_at)::date"),
+        [("snapshots", "COUNT(*)")] + _DELTAS,
+    ),
+    "video_hourly_stats": (
+        ("video_id", "hour"),
+        ("s.video_id", "date_trunc('hour', s.created_at)"),
+        [("snapshots", "COUNT(*)")] + _DELTAS,
+    ),
+    "video_weekly_stats": (
+        ("video_id", "week"),
+        ("s.video_id", "date_trunc('week', s.created_at)::date"),
+        [("snapshots", "COUNT(*)")] + _DELTAS,
+    ),
+}
+
+# (creator | video, hour | day | week) → таблица с приростами delta_<метрика>
+LEADERBOARDS = {
+    ("creator", "hour"): "creator_hourly_stats",
+    ("creator", "day"): "creator_daily_stats",
+    ("creator", "week"): "creator_weekly_stats",
+    ("video", "hour"): "video_hourly_stats",
+    ("video", "day"): "video_daily_stats",
+    ("video", "week"): "video_weekly_stats",
+}
+
+
+def create_new_snapshots_table(cur):
+    """
+    Временная таблица для снапшотов, вставленных текущей пачкой
+    (заполняется через INSERT ... RETURNING в load_data.flush_batch).
+    """
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS new_snapshots (
+            video_id              TEXT,
+            created_at            TIMESTAMPTZ,
+            delta_views_count     BIGINT,
+            delta_likes_count     BIGINT,
+            delta_comments_count  BIGINT,
+            delta_reports_count   BIGINT
+        );
+        """
+    )
+
+
+def apply_new_snapshots(cur, source: str = "new_snapshots", sign: int = 1):
+    """
+    Прибавить к агрегатам снапшоты из таблицы source (sign=-1 — вычесть,
+    строки агрегатов без снапшотов после этого удаляются).
+
+    Строки вставляются в порядке ключа, чтобы параллельные загрузчики
+    брали блокировки в одном порядке и не упирались в deadlock.
+    """
+    for table, (key, key_exprs, aggs) in ROLLUPS.items():
+        columns = list(key) + [name for name, _ in aggs]
+        select = list(key_exprs) + [expr if sign > 0 else f"-{expr}" for _, expr in aggs]
+        join = "JOIN videos AS v ON v.id = s.video_id" if "v.creator_id" in key_exprs else ""
+        group = ", ".join(str(i + 1) for i in range(len(key)))
+        updates = ", ".join(f"{name} = t.{name} + EXCLUDED.{name}" for name, _ in aggs)
+
+        cur.execute(
+            f"""
+            INSERT INTO {table} AS t ({', '.join(columns)})
+            SELECT {', '.join(select)}
+            FROM {source} AS s {join}
+            GROUP BY {group}
+            ORDER BY {group}
+            ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates};
+            """
+        )
+        if sign < 0:
+            cur.execute(f"DELETE FROM {table} WHERE snapshots = 0;")
+
+
+def rebuild(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(ROLLUPS)};")
+        apply_new_snapshots(cur, source="video_snapshots")
+    conn.commit()
+
+
+def check(days: int = 7, creators: int = 5) -> int:
+    """
+    Сравнить ответы execute_query по агрегатам и по сырым таблицам
+    для последних days дней. Возвращает число расхождений.
+    """
+    from queries import execute_query
+
+    with psycopg2.connect(DB_DSN, options=f"-c TimeZone={DB_TIMEZONE}") as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT day FROM daily_stats ORDER BY day DESC LIMIT %s;", (days,))
+            day_list = [row[0].isoformat() for row in cur.fetchall()]
+            cur.execute(
+                """
+                SELECT creator_id, hour FROM (
+                    SELECT creator_id, hour,
+                           row_number() OVER (PARTITION BY creator_id ORDER BY delta_views DESC) AS rn
+                    FROM creator_hourly_stats
+                ) AS t
+                WHERE rn = 1
+                LIMIT %s;
+                """,
+                (creators,),
+            )
+            creator_hours = cur.fetchall()
+    conn.close()
+
+    descs = [{"query_type": "snapshots_with_negative_delta", "metric": m, "date": None} for m in METRICS]
+    for day in day_list:
+        descs.append({"query_type": "videos_with_new_views_on_date", "date": day})
+        descs += [{"query_type": "snapshots_with_negative_delta", "metric": m, "date": day} for m in METRICS]
+    for creator_id, hour in creator_hours:
+        descs.append({
+            "query_type": "creator_views_delta_in_time_range",
+            "creator_id": creator_id,
+            "date": hour.date().isoformat(),
+            "time_from": f"{max(hour.hour - 2, 0):02d}:00",
+            "time_to": f"{hour.hour:02d}:00",
+        })
+
+    for day in day_list[:2]:
+        for (entity, period) in LEADERBOARDS:
+            descs += [
+                {"query_type": "top_n", "entity": entity, "period": period, "metric": m,
+                 "date": day, "hour": f"{creator_hours[0][1].hour:02d}:00" if creator_hours else "12:00",
+                 "limit": 10}
+                for m in METRICS
+            ]
+
+    mismatches = 0
+    for desc in descs:
+        raw = execute_query(desc, use_rollups=False)
+        rolled = execute_query(desc, use_rollups=True)
+        if raw != rolled:
+            mismatches += 1
+            print(f"MISMATCH {desc}: raw={raw}, rollup={rolled}")
+
+    print(f"проверено запросов: {len(descs)}, расхождений: {mismatches}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Агрегаты по video_snapshots")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--days", type=int, default=7, help="для check: сколько последних дней сверять")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        conn = psycopg2.connect(DB_DSN, options=f"-c TimeZone={DB_TIMEZONE}")
+        rebuild(conn)
+        conn.close()
+        print("агрегаты пересчитаны")
+    else:
+        raise SystemExit(1 if check(args.days) else 0)
@@ -0,0 +1,136 @@
+"""
+Отправка ответов в Telegram с учётом лимитов Bot API.
+
+Ответы не отправляются из обработчика напрямую, а встают в очередь чата:
+  - в один чат — не чаще TELEGRAM_CHAT_INTERVAL секунд;
+  - всего — не больше TELEGRAM_GLOBAL_RATE сообщений в секунду
+    (в режиме webhook.py делится между воркерами);
+  - пока чат ждёт своей очереди, накопившиеся ответы с одинаковыми
+    параметрами склеиваются в одно сообщение до TELEGRAM_MESSAGE_LIMIT символов;
+  - на 429 (TelegramRetryAfter) — пауза retry_after и повтор, порядок
+    сообщений в чате сохраняется.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+import metrics
+from render import TELEGRAM_MESSAGE_LIMIT
+
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1.0"))
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", "3"))
+
+log = logging.getLogger("sender")
+
+
+class Sender:
+    def __init__(
+        self,
+        bot,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+        limit: int = TELEGRAM_MESSAGE_LIMIT,
+        retries: int = TELEGRAM_SEND_RETRIES,
+    ):
+        self.bot = bot
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.chat_interval = chat_interval
+        self.limit = limit
+        self.retries = retries
+
+        self._queues: dict[int, deque] = {}
+        self._next_chat: dict[int, float] = {}
+        self._next_global = 0.0
+        self._tasks: set[asyncio.Task] = set()
+
+    def send(self, chat_id: int, text: str, **kwargs):
+        """
+        Поставить сообщение в очередь чата и сразу вернуться.
+        """
+        queue = self._queues.get(chat_id)
+        if queue is not None:
+            queue.append((text, kwargs))
+            return
+        self._queues[chat_id] = deque([(text, kwargs)])
+        task = asyncio.create_task(self._flush(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _global_slot(self):
+        now = time.monotonic()
+        at = max(now, self._next_global)
+        self._next_global = at + self.global_interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def _take(self, queue: deque) -> tuple[str, dict, int]:
+        text, kwargs = queue.popleft()
+        merged = 1
+        while queue and queue[0][1] == kwargs and len(text) + 2 + len(queue[0][0]) <= self.limit:
+            text += "\n\n" + queue.popleft()[0]
+            merged += 1
+        return text, kwargs, merged
+
+    async def _flush(self, chat_id: int):
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                wait = self._next_chat.get(chat_id, 0.0) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self._global_slot()
+                # склеиваем после ожидания: за это время могли прийти ещё ответы
+                text, kwargs, merged = self._take(queue)
+                await self._deliver(chat_id, text, kwargs)
+                metrics.SENT_MESSAGES.inc()
+                if merged > 1:
+                    metrics.COALESCED_MESSAGES.inc(merged - 1)
+                self._next_chat[chat_id] = time.monotonic() + self.chat_interval
+        finally:
+            del self._queues[chat_id]
+            if len(self._next_chat) > 10000:
+                now = time.monotonic()
+                self._next_chat = {k: v for k, v in self._next_chat.items() if v > now}
+
+    async def _deliver(self, chat_id: int, text: str, kwargs: dict):
+        for attempt in range(self.retries + 1):
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return
+            except TelegramRetryAfter as e:
+                metrics.SEND_RETRIES.inc(reason="retry_after")
+                if attempt == self.retries:
+                    log.error("send_message: retry_after исчерпан", extra={"chat_id": chat_id})
+                    return
+                # лимит общий: остальные чаты этого процесса тоже ждут
+                self._next_global = max(self._next_global, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except TelegramAPIError as e:
+                metrics.SEND_RETRIES.inc(reason="error")
+                log.error("send_message: %r", e, extra={"chat_id": chat_id})
+                return
+            except Exception:
+                # сеть, клиент и прочее: без этого задача _flush падала бы
+                # и остальные ответы чата молча пропадали
+                metrics.SEND_RETRIES.inc(reason="error")
+                log.exception("send_message", extra={"chat_id": chat_id})
+                return
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    async def close(self, timeout: float = 30.0):
+        """
+        Дождаться отправки всего, что уже в очередях.
+        """
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                log.warning("не отправлено при остановке: %d чатов", len(pending))
@@ -0,0 +1,431 @@
+"""
+snapbin — колоночный бинарный формат videos со снапшотами для загрузки.
+
+Вместо разбора JSON и перевода строк в числа — готовые массивы int64,
+которые читатель отображает в память (mmap) и отдаёт как memoryview без
+копирования:
+
+  MAGIC (8 байт) | длина заголовка (uint64) | заголовок JSON | столбцы
+
+  videos.id, creators.id          — словари строк: offsets (int64, k+1) + data (utf-8)
+  videos.creator                  — int32, номер креатора в creators.id
+  videos.<счётчик>, videos.<время> — int64; время — микросекунды от эпохи (UTC)
+  videos.snapshots                — int64, n+1: снапшоты видео i — [s[i], s[i+1])
+  snapshots.video                 — int32, номер видео в videos.id
+  snapshots.id                    — 16 байт на id, пока все id — 32 hex-символа,
+                                    иначе словарь строк, как videos.id
+  snapshots.<счётчик/delta/время> — int64
+
+Столбцы выровнены по 8 байт, порядок байт — как у машины, записавшей файл
+(в заголовке; на другой порядок читатель не соглашается).
+
+  python snapbin.py convert data/videos.json data/videos.snapbin
+  python snapbin.py info data/videos.snapbin
+  python load_data.py data/videos.snapbin --shard-by range --workers 4
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+import tempfile
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from zoneinfo import ZoneInfo
+from datetime import datetime, timezone
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DB_TIMEZONE = os.getenv("DB_TIMEZONE", "UTC")
+
+MAGIC = b"SNAPBIN1"
+VERSION = 1
+ALIGN = 8
+# сколько значений столбца копим в памяти до записи во временный файл
+CHUNK = 1 << 16
+
+# порядок как у load_data.VIDEO_COLUMNS / SNAPSHOT_COLUMNS без двух строковых первых
+VIDEO_INT_COLUMNS = (
+    "video_created_at",
+    "views_count", "likes_count", "comments_count", "reports_count",
+    "created_at", "updated_at",
+)
+SNAPSHOT_INT_COLUMNS = (
+    "views_count", "likes_count", "comments_count", "reports_count",
+    "delta_views_count", "delta_likes_count", "delta_comments_count", "delta_reports_count",
+    "created_at", "updated_at",
+)
+TIMESTAMP_COLUMNS = ("video_created_at", "created_at", "updated_at")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+US = 1_000_000
+HEX = set("0123456789abcdef")
+
+
+def to_epoch_us(value: str, tz: ZoneInfo) -> int:
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=tz)
+    delta = ts - EPOCH
+    return (delta.days * 86400 + delta.seconds) * US + delta.microseconds
+
+
+def from_epoch_us(value: int) -> datetime:
+    return datetime.fromtimestamp(value // US, timezone.utc).replace(microsecond=value % US)
+
+
+# ---------- запись ----------
+
+class _Column:
+    """
+    Числовой столбец: значения копятся в array и сбрасываются во временный файл.
+    """
+
+    def __init__(self, typecode: str, tmpdir: str):
+        self.typecode = typecode
+        self.buf = array(typecode)
+        self.file = tempfile.TemporaryFile(dir=tmpdir)
+        self.count = 0
+
+    def append(self, value: int):
+        self.buf.append(value)
+        if len(self.buf) >= CHUNK:
+            self.flush()
+
+    def flush(self):
+        self.count += len(self.buf)
+        self.buf.tofile(self.file)
+        del self.buf[:]
+
+
+class _Strings:
+    """
+    Словарь строк: offsets (int64) + data (utf-8); hex=True — по 16 байт на
+    32-символьный hex, при первом не-hex значении переписывается в общий вид.
+    """
+
+    def __init__(self, tmpdir: str, hex: bool = False):
+        self.tmpdir = tmpdir
+        self.hex = hex
+        self.data = tempfile.TemporaryFile(dir=tmpdir)
+        self.size = 0
+        self.offsets = None if hex else self._offsets()
+
+    def _offsets(self) -> _Column:
+        offsets = _Column("q", self.tmpdir)
+        offsets.append(0)
+        return offsets
+
+    def append(self, value: str):
+        if self.hex:
+            if len(value) == 32 and HEX.issuperset(value):
+                self.data.write(bytes.fromhex(value))
+                self.size += 16
+                return
+            self._unhex()
+        raw = value.encode()
+        self.data.write(raw)
+        self.size += len(raw)
+        self.offsets.append(self.size)
+
+    def _unhex(self):
+        old = self.data
+        old.seek(0)
+        self.hex = False
+        self.data = tempfile.TemporaryFile(dir=self.tmpdir)
+        self.size = 0
+        self.offsets = self._offsets()
+        while chunk := old.read(16 * CHUNK):
+            for i in range(0, len(chunk), 16):
+                self.append(chunk[i:i + 16].hex())
+        old.close()
+
+    def columns(self, name: str) -> dict:
+        if self.hex:
+            return {name: ("B", self.data)}
+        self.offsets.flush()
+        return {f"{name}.offsets": ("q", self.offsets.file), f"{name}.data": ("B", self.data)}
+
+
+class Writer:
+    """
+    Потоковая запись: add(video) по одному, close() собирает файл.
+    Столбцы до close() лежат во временных файлах рядом с path,
+    в памяти — не больше CHUNK значений на столбец.
+    """
+
+    def __init__(self, path: Path, tz: str = DB_TIMEZONE):
+        self.path = Path(path)
+        self.tz = ZoneInfo(tz)
+        self._tmp = tempfile.TemporaryDirectory(dir=self.path.parent, prefix=".snapbin-")
+        tmp = self._tmp.name
+        self.video_ids = _Strings(tmp)
+        self.creator_ids = _Strings(tmp)
+        self.snapshot_ids = _Strings(tmp, hex=True)
+        self.creators: dict[str, int] = {}
+        self.video_creator = _Column("i", tmp)
+        self.video_ints = {c: _Column("q", tmp) for c in VIDEO_INT_COLUMNS}
+        self.video_snapshots = _Column("q", tmp)
+        self.video_snapshots.append(0)
+        self.snapshot_video = _Column("i", tmp)
+        self.snapshot_ints = {c: _Column("q", tmp) for c in SNAPSHOT_INT_COLUMNS}
+        self.videos = 0
+        self.snapshots = 0
+
+    def add(self, video: dict):
+        creator = self.creators.get(video["creator_id"])
+        if creator is None:
+            creator = self.creators[video["creator_id"]] = len(self.creators)
+            self.creator_ids.append(video["creator_id"])
+        self.video_ids.append(video["id"])
+        self.video_creator.append(creator)
+        for c, column in self.video_ints.items():
+            column.append(to_epoch_us(video[c], self.tz) if c in TIMESTAMP_COLUMNS else int(video[c]))
+
+        for s in video["snapshots"]:
+            if s["video_id"] != video["id"]:
+                raise ValueError(f"снапшот {s['id']} лежит в чужом видео {video['id']}")
+            self.snapshot_ids.append(s["id"])
+            self.snapshot_video.append(self.videos)
+            for c, column in self.snapshot_ints.items():
+                column.append(to_epoch_us(s[c], self.tz) if c in TIMESTAMP_COLUMNS else int(s[c]))
+            self.snapshots += 1
+        self.videos += 1
+        self.video_snapshots.append(self.snapshots)
+
+    def close(self):
+        columns = {}
+        columns |= self.video_ids.columns("videos.id")
+        columns |= self.creator_ids.columns("creators.id")
+        columns["videos.creator"] = self.video_creator
+        columns |= {f"videos.{c}": col for c, col in self.video_ints.items()}
+        columns["videos.snapshots"] = self.video_snapshots
+        columns["snapshots.video"] = self.snapshot_video
+        columns |= self.snapshot_ids.columns("snapshots.id")
+        columns |= {f"snapshots.{c}": col for c, col in self.snapshot_ints.items()}
+
+        files = {}
+        for name, col in columns.items():
+            if isinstance(col, _Column):
+                col.flush()
+                col = (col.typecode, col.file)
+            typecode, f = col
+            files[name] = (typecode, f, f.seek(0, os.SEEK_END))
+
+        header = {
+            "version": VERSION,
+            "byteorder": sys.byteorder,
+            "videos": self.videos,
+            "snapshots": self.snapshots,
+            "creators": len(self.creators),
+            "snapshot_ids": "hex128" if self.snapshot_ids.hex else "str",
+            "columns": {},
+        }
+        # смещения зависят от длины заголовка, а она — от смещений: считаем с запасом
+        reserve = len(json.dumps(header)) + len(files) * 80
+        offset = _align(len(MAGIC) + 8 + reserve)
+        for name, (typecode, _, size) in files.items():
+            header["columns"][name] = [offset, size, typecode]
+            offset = _align(offset + size)
+        raw = json.dumps(header).encode()
+        if len(raw) > reserve:
+            raise RuntimeError("заголовок snapbin не поместился в резерв")
+
+        part = self.path.with_name(self.path.name + ".part")
+        with part.open("wb") as out:
+            out.write(MAGIC + struct.pack("<Q", reserve) + raw.ljust(reserve))
+            for name, (_, f, size) in files.items():
+                out.seek(header["columns"][name][0])
+                f.seek(0)
+                while chunk := f.read(1 << 20):
+                    out.write(chunk)
+                f.close()
+            out.truncate(offset)
+        os.replace(part, self.path)
+        self._tmp.cleanup()
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def convert(paths: list[Path], out: Path, tz: str = DB_TIMEZONE) -> tuple[int, int]:
+    """
+    videos.json / *.jsonl → один snapbin. Возвращает (видео, снапшотов).
+    """
+    from load_data import iter_videos, iter_videos_jsonl
+
+    writer = Writer(out, tz)
+    for p in paths:
+        p = Path(p)
+        videos = (v for v, _ in iter_videos_jsonl(p)) if p.suffix == ".jsonl" else iter_videos(p)
+        for v in videos:
+            writer.add(v)
+    writer.close()
+    return writer.videos, writer.snapshots
+
+
+# ---------- чтение ----------
+
+class SnapBin:
+    """
+    Файл snapbin, отображённый в память.
+
+      with SnapBin(path) as sb:
+          views = sb.column("snapshots.delta_views_count")   # memoryview int64
+          videos_rows, snapshots_rows = sb.rows(0, 1000)      # для COPY в load_data
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = self.path.open("rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: не snapbin")
+        (size,) = struct.unpack_from("<Q", self._mm, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mm[start:start + size])
+        if self.header["version"] != VERSION:
+            raise ValueError(f"{path}: версия snapbin {self.header['version']}, поддерживается {VERSION}")
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path}: записан на машине с порядком байт {self.header['byteorder']}")
+        self.videos = self.header["videos"]
+        self.snapshots = self.header["snapshots"]
+        self._views: dict[str, memoryview] = {}
+        self._creators: list[str] | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+        try:
+            self._mm.close()
+        except BufferError:
+            # снаружи ещё держат срезы столбцов — отображение закроется вместе с ними
+            pass
+        self._file.close()
+
+    def column(self, name: str) -> memoryview:
+        """
+        Столбец целиком как memoryview нужного типа, без копирования.
+        """
+        view = self._views.get(name)
+        if view is None:
+            offset, size, typecode = self.header["columns"][name]
+            view = self._views[name] = memoryview(self._mm)[offset:offset + size].cast(typecode)
+        return view
+
+    def array(self, name: str):
+        """
+        Столбец как numpy-массив поверх того же отображения (нужен numpy).
+        """
+        if numpy is None:
+            raise RuntimeError("для SnapBin.array нужен пакет numpy: pip install numpy")
+        return numpy.frombuffer(self.column(name), dtype=numpy.dtype(self.header["columns"][name][2]))
+
+    def strings(self, name: str, start: int, end: int) -> list[str]:
+        if name == "snapshots.id" and self.header["snapshot_ids"] == "hex128":
+            raw = self.column(name)[16 * start:16 * end].hex()
+            return [raw[i:i + 32] for i in range(0, len(raw), 32)]
+        offsets = self.column(f"{name}.offsets")[start:end + 1]
+        data = bytes(self.column(f"{name}.data")[offsets[0]:offsets[-1]]) if offsets else b""
+        base = offsets[0] if offsets else 0
+        return [data[a - base:b - base].decode() for a, b in zip(offsets, offsets[1:])]
+
+    def creators(self) -> list[str]:
+        if self._creators is None:
+            self._creators = self.strings("creators.id", 0, self.header["creators"])
+        return self._creators
+
+    def snapshot_range(self, start: int, end: int) -> tuple[int, int]:
+        bounds = self.column("videos.snapshots")
+        return bounds[start], bounds[end]
+
+    def rows(self, start: int, end: int) -> tuple[list[tuple], list[tuple]]:
+        """
+        Видео [start, end) и их снапшоты строками в порядке
+        load_data.VIDEO_COLUMNS / SNAPSHOT_COLUMNS; время — микросекунды от эпохи.
+        """
+        video_ids = self.strings("videos.id", start, end)
+        creators = self.creators()
+        creator_ids = [creators[i] for i in self.column("videos.creator")[start:end]]
+        videos_rows = list(zip(
+            video_ids, creator_ids,
+            *(self.column(f"videos.{c}")[start:end] for c in VIDEO_INT_COLUMNS),
+        ))
+
+        lo, hi = self.snapshot_range(start, end)
+        owners = [video_ids[i - start] for i in self.column("snapshots.video")[lo:hi]]
+        snapshots_rows = list(zip(
+            self.strings("snapshots.id", lo, hi), owners,
+            *(self.column(f"snapshots.{c}")[lo:hi] for c in SNAPSHOT_INT_COLUMNS),
+        ))
+        return videos_rows, snapshots_rows
+
+    def batches(self, start: int = 0, end: int | None = None, batch_size: int = 50000):
+        """
+        (videos_rows, snapshots_rows, номер следующего видео) пачками примерно
+        по batch_size строк; видео со своими снапшотами в одну пачку.
+        """
+        end = self.videos if end is None else end
+        bounds = self.column("videos.snapshots")
+        while start < end:
+            # первое видео, на котором снапшотов набирается batch_size
+            stop = bisect_left(bounds, bounds[start] + batch_size, start + 1, end + 1)
+            stop = max(start + 1, min(stop, end, start + batch_size))
+            yield *self.rows(start, stop), stop
+            start = stop
+
+
+def daily_totals(sb: SnapBin, column: str = "delta_views_count") -> dict:
+    """
+    Сумма snapshots.<column> по суткам created_at (UTC), {date: сумма}.
+    С numpy — векторно поверх отображения, без него — циклом по memoryview.
+    """
+    values = sb.column(f"snapshots.{column}")
+    stamps = sb.column("snapshots.created_at")
+    if numpy is not None and sb.snapshots:
+        days = sb.array("snapshots.created_at") // (86400 * US)
+        first = int(days.min())
+        sums = numpy.bincount(days - first, weights=sb.array(f"snapshots.{column}"))
+        return {from_epoch_us((first + i) * 86400 * US).date(): int(s) for i, s in enumerate(sums) if s}
+
+    totals: dict[int, int] = {}
+    day_us = 86400 * US
+    for ts, value in zip(stamps, values):
+        day = ts // day_us
+        totals[day] = totals.get(day, 0) + value
+    return {from_epoch_us(day * day_us).date(): s for day, s in sorted(totals.items()) if s}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Колоночный бинарный формат videos со снапшотами")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_convert = sub.add_parser("convert", help="videos.json / *.jsonl → snapbin")
+    p_convert.add_argument("paths", nargs="+", type=Path)
+    p_convert.add_argument("out", type=Path)
+    p_info = sub.add_parser("info", help="заголовок и размеры столбцов")
+    p_info.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        videos, snapshots = convert(args.paths, args.out)
+        print(f"{args.out}: videos {videos}, snapshots {snapshots}, {args.out.stat().st_size / 1e6:.1f} МБ")
+    else:
+        with SnapBin(args.path) as sb:
+            h = sb.header
+            print(f"videos {h['videos']}, snapshots {h['snapshots']}, creators {h['creators']}, "
+                  f"snapshot_ids {h['snapshot_ids']}")
+            for name, (_, size, typecode) in h["columns"].items():
+                print(f"  {name:34} {typecode} {size / 1e6:10.2f} МБ")
@@ -0,0 +1,408 @@
+"""
+Ограниченное выполнение SQL, который сгенерировала модель (фолбэк nl_to_sql).
+
+  1. validate_sql: один SELECT/WITH, только таблицы и колонки из ALLOWED_TABLES,
+     функции из ALLOWED_FUNCTIONS, без комментариев и блокировок.
+  2. run_guarded: READ ONLY транзакция со своим statement_timeout,
+     EXPLAIN до выполнения — слишком дорогой план отклоняется,
+     результат ограничен FALLBACK_MAX_ROWS строками.
+  3. FallbackSqlCache: проверенный SQL по нормализованному вопросу,
+     повтор вопроса не идёт ни в модель, ни в EXPLAIN.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import db
+
+FALLBACK_STATEMENT_TIMEOUT_MS = int(os.getenv("FALLBACK_STATEMENT_TIMEOUT_MS", "3000"))
+# предел оценки стоимости плана (Total Cost из EXPLAIN)
+FALLBACK_MAX_COST = float(os.getenv("FALLBACK_MAX_COST", "500000"))
+FALLBACK_MAX_ROWS = int(os.getenv("FALLBACK_MAX_ROWS", "100"))
+FALLBACK_SQL_CACHE_SIZE = int(os.getenv("FALLBACK_SQL_CACHE_SIZE", "500"))
+
+_COMMON = {"id", "views_count", "likes_count", "comments_count", "reports_count", "created_at", "updated_at"}
+
+ALLOWED_TABLES = {
+    "videos": _COMMON | {"creator_id", "video_created_at"},
+    "video_snapshots": _COMMON | {
+        "video_id",
+        "delta_views_count", "delta_likes_count", "delta_comments_count", "delta_reports_count",
+    },
+}
+ALLOWED_COLUMNS = set().union(*ALLOWED_TABLES.values())
+
+ALLOWED_FUNCTIONS = {
+    "count", "sum", "avg", "min", "max", "coalesce", "nullif", "greatest", "least",
+    "round", "abs", "floor", "ceil", "date_trunc", "date_part", "date_bin", "extract",
+    "date", "now", "make_date", "make_timestamptz", "to_char", "lower", "upper",
+    "cast", "row_number", "rank", "dense_rank", "lag", "lead",
+}
+
+ALLOWED_TYPES = {
+    "date", "timestamptz", "timestamp", "time", "interval", "int", "integer", "bigint",
+    "numeric", "float", "real", "double", "precision", "text",
+}
+
+# поля EXTRACT(поле FROM ...): после них FROM — не таблица
+EXTRACT_FIELDS = {"epoch", "year", "month", "week", "day", "hour", "minute", "second", "dow"}
+
+KEYWORDS = EXTRACT_FIELDS | {
+    "select", "from", "where", "and", "or", "not", "as", "on", "join", "inner", "left",
+    "right", "full", "outer", "cross", "group", "by", "order", "having", "limit", "offset",
+    "distinct", "case", "when", "then", "else", "end", "is", "null", "true", "false", "in",
+    "between", "like", "ilike", "asc", "desc", "with", "union", "all", "intersect", "except",
+    "exists", "filter", "over", "partition", "interval", "at", "time", "zone", "nulls", "first",
+    "last", "using", "any", "rows", "range", "preceding", "following", "unbounded", "current",
+    "row", "date", "timestamp", "timestamptz",
+}
+
+# всё, что меняет данные, схему, настройки или берёт блокировки
+FORBIDDEN = {
+    "insert", "update", "delete", "merge", "drop", "alter", "create", "truncate", "grant",
+    "revoke", "copy", "call", "do", "execute", "prepare", "deallocate", "lock", "vacuum",
+    "analyze", "explain", "set", "reset", "listen", "notify", "unlisten", "into", "for",
+    "refresh", "cluster", "reindex", "comment", "security", "load", "import", "discard",
+    "checkpoint", "begin", "commit", "rollback", "savepoint", "declare", "fetch", "move",
+    "close", "lateral", "tablesample", "returning",
+    # функции без скобок, которые возвращают сведения о сессии и сервере
+    "user", "current_user", "session_user", "current_role", "system_user",
+    "current_schema", "current_catalog",
+}
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<space>\s+)
+    | (?P<comment>--|/\*)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<dollar>\$)
+    | (?P<quoted>"(?:[^"]|"")*")
+    | (?P<number>\d+(?:\.\d+)?)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<cast>::)
+    | (?P<op><=|>=|<>|!=|\|\||[-+*/%<>=])
+    | (?P<punct>[(),.;])
+    """,
+    re.VERBOSE,
+)
+
+
+class SqlRejected(ValueError):
+    """
+    SQL не прошёл проверку; текст — причина для лога.
+    """
+
+
+def tokenize(sql: str) -> list[tuple[str, str]]:
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if m is None:
+            raise SqlRejected(f"недопустимый символ {sql[pos]!r}")
+        kind = m.lastgroup
+        if kind == "comment":
+            raise SqlRejected("комментарии запрещены")
+        if kind == "dollar":
+            raise SqlRejected("параметры и $-строки запрещены")
+        if kind == "quoted":
+            raise SqlRejected("идентификаторы в кавычках запрещены")
+        if kind != "space":
+            value = m.group()
+            tokens.append((kind, value.lower() if kind == "ident" else value))
+        pos = m.end()
+    return tokens
+
+
+def validate_sql(sql: str) -> str:
+    """
+    Проверить SQL модели и вернуть его без завершающей ";".
+    Бросает SqlRejected.
+    """
+    tokens = tokenize(sql.strip())
+    while tokens and tokens[-1] == ("punct", ";"):
+        tokens.pop()
+    if not tokens:
+        raise SqlRejected("пустой запрос")
+    if ("punct", ";") in tokens:
+        raise SqlRejected("больше одного запроса")
+    if tokens[0] not in (("ident", "select"), ("ident", "with")):
+        raise SqlRejected("разрешён только SELECT")
+
+    idents = [value for kind, value in tokens if kind == "ident"]
+    forbidden = sorted(set(idents) & FORBIDDEN)
+    if forbidden:
+        raise SqlRejected(f"запрещённые слова: {', '.join(forbidden)}")
+
+    ctes = _ctes(tokens)
+    tables, source_aliases, column_aliases, context, alias_defs, cast_types = _scan(tokens, ctes)
+    # алиасы источников и имена CTE — в выражениях где угодно, таблицами не считаются
+    names = source_aliases | set(ctes)
+
+    for i, (kind, value) in enumerate(tokens):
+        if kind != "ident":
+            continue
+        prev = tokens[i - 1] if i else ("", "")
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else ("", "")
+
+        if i in cast_types:
+            if value not in ALLOWED_TYPES and value not in _TYPE_WORDS:
+                raise SqlRejected(f"тип {value} не разрешён")
+        elif i in alias_defs:
+            continue
+        elif prev[0] == "cast":
+            if value not in ALLOWED_TYPES:
+                raise SqlRejected(f"тип {value} не разрешён")
+        elif nxt == ("punct", "("):
+            if value not in ALLOWED_FUNCTIONS and value not in KEYWORDS:
+                raise SqlRejected(f"функция {value} не разрешена")
+        elif nxt == ("punct", "."):
+            if value not in ALLOWED_TABLES and value not in names:
+                raise SqlRejected(f"неизвестный источник {value}")
+        elif value in KEYWORDS or value in names or value in ALLOWED_TABLES or value in ALLOWED_COLUMNS:
+            continue
+        elif not _alias_visible(column_aliases.get(value, ()), *context[i]):
+            raise SqlRejected(f"колонка {value} не разрешена")
+
+    if not tables:
+        raise SqlRejected("запрос не читает ни одной разрешённой таблицы")
+
+    return re.sub(r"[\s;]+$", "", sql.strip())
+
+
+def _alias_visible(levels, level: int, clause: str | None) -> bool:
+    """
+    Алиас колонки можно назвать в GROUP BY / ORDER BY своего запроса
+    или во внешнем запросе (колонка подзапроса или CTE), но не в том
+    выражении, которое он называет: иначе "current_user AS current_user"
+    разрешил бы что угодно.
+    """
+    return any(level < defined or (level == defined and clause in ("group", "order")) for defined in levels)
+
+
+def _closing(tokens: list[tuple[str, str]], start: int) -> int:
+    """
+    Индекс ")", парной к "(" на позиции start.
+    """
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i] == ("punct", "("):
+            depth += 1
+        elif tokens[i] == ("punct", ")"):
+            depth -= 1
+            if depth == 0:
+                return i
+    raise SqlRejected("непарные скобки")
+
+
+def _ctes(tokens: list[tuple[str, str]]) -> dict[str, int]:
+    """
+    Имена CTE из WITH в начале запроса → индекс конца тела.
+
+    Имя видно только после своего тела: без RECURSIVE ссылка на него
+    внутри тела — это уже настоящая таблица с таким именем. WITH
+    во вложенных запросах не разрешён, чтобы имя не затеняло таблицу
+    только в части запроса.
+    """
+    if any(t == ("ident", "with") and tokens[i + 2:i + 3] != [("ident", "time")] for i, t in enumerate(tokens[1:])):
+        raise SqlRejected("WITH разрешён только в начале запроса")
+    ctes = {}
+    if tokens[0] != ("ident", "with"):
+        return ctes
+    i = 1
+    while True:
+        kind, name = tokens[i] if i < len(tokens) else ("", "")
+        if kind != "ident" or name in KEYWORDS:
+            raise SqlRejected("ожидалось имя CTE")
+        i += 1
+        if tokens[i:i + 1] == [("punct", "(")]:
+            i = _closing(tokens, i) + 1
+        if tokens[i:i + 2] != [("ident", "as"), ("punct", "(")]:
+            raise SqlRejected(f"ожидалось {name} AS (...)")
+        i = _closing(tokens, i + 1)
+        ctes[name] = i
+        i += 1
+        if tokens[i:i + 1] != [("punct", ",")]:
+            return ctes
+        i += 1
+
+
+# слово → часть запроса, в которой оказываются следующие за ним токены
+_CLAUSES = {
+    "select": "select", "from": "from", "where": "where", "group": "group", "order": "order",
+    "having": "having", "limit": "limit", "offset": "limit",
+    "union": None, "intersect": None, "except": None,
+}
+# слова после AS в cast(x AS тип) помимо ALLOWED_TYPES
+_TYPE_WORDS = {"with", "without", "time", "zone"}
+
+
+def _scan(tokens: list[tuple[str, str]], ctes: dict[str, int]) -> tuple:
+    """
+    Проход по запросу с учётом вложенных подзапросов.
+
+    Возвращает (разрешённые таблицы, которые читает запрос; алиасы
+    источников; алиас колонки → уровни подзапросов, где он объявлен;
+    (уровень, часть запроса) для каждого токена; индексы объявлений
+    алиасов колонок; индексы типов в cast(x AS тип)).
+
+    Источником после FROM, JOIN и запятой в списке FROM может быть только
+    таблица из ALLOWED_TABLES, видимое в этом месте CTE или подзапрос.
+    Алиасы источником не бывают.
+    """
+    tables = set()
+    source_aliases = set()
+    column_aliases: dict[str, set[int]] = {}
+    context = []
+    alias_defs = set()
+    cast_types = set()
+    # по скобкам: слово перед "(", уровень подзапроса, часть запроса, состояние списка FROM
+    stack = [{"opener": "", "level": 0, "clause": None, "state": None}]
+
+    def column_alias(i: int, level: int):
+        alias_defs.add(i)
+        column_aliases.setdefault(tokens[i][1], set()).add(level)
+
+    for i, (kind, value) in enumerate(tokens):
+        prev = tokens[i - 1] if i else ("", "")
+        nxt = tokens[i + 1] if i + 1 < len(tokens) else ("", "")
+        top = stack[-1]
+        context.append((top["level"], top["clause"]))
+
+        if (kind, value) == ("punct", "("):
+            query = nxt == ("ident", "select")
+            if top["state"] == "source":
+                if not query:
+                    raise SqlRejected("в FROM в скобках допустим только подзапрос")
+                top["state"] = "subquery"
+            stack.append({
+                "opener": prev[1],
+                "level": top["level"] + 1 if query else top["level"],
+                "clause": None if query else top["clause"],
+                "state": None,
+            })
+            continue
+        if (kind, value) == ("punct", ")"):
+            stack.pop()
+            if not stack:
+                raise SqlRejected("непарные скобки")
+            top = stack[-1]
+            if top["state"] == "subquery":
+                top["state"] = "after_source"
+            elif top["clause"] == "select" and nxt[0] == "ident" \
+                    and nxt[1] not in KEYWORDS and nxt[1] not in FORBIDDEN:
+                column_alias(i + 1, top["level"])
+            continue
+
+        if top["state"] == "source":
+            if kind != "ident" or value in KEYWORDS or nxt[1] in ("(", "."):
+                raise SqlRejected(f"недопустимый источник {value}")
+            if value in ALLOWED_TABLES:
+                tables.add(value)
+            elif i <= ctes.get(value, len(tokens)):
+                raise SqlRejected(f"таблица {value} не разрешена")
+            top["state"] = "after_source"
+            continue
+
+        if value == "as" and top["opener"] == "cast":
+            j = i + 1
+            while j < len(tokens) and tokens[j][0] == "ident":
+                cast_types.add(j)
+                j += 1
+        elif value == "from" and top["opener"] == "extract":
+            continue
+        elif value in _CLAUSES:
+            top["clause"] = _CLAUSES[value]
+            top["state"] = "source" if value == "from" else None
+        elif value == "join":
+            top["state"] = "source"
+        elif value in ("on", "using"):
+            top["state"] = "in_from"
+        elif value == "," and top["state"] in ("after_source", "in_from"):
+            top["state"] = "source"
+        elif value == "as" and nxt[0] == "ident":
+            if top["state"] == "after_source":
+                source_aliases.add(nxt[1])
+                alias_defs.add(i + 1)
+            elif top["clause"] == "select":
+                column_alias(i + 1, top["level"])
+        elif top["state"] == "after_source" and kind == "ident" and value not in KEYWORDS:
+            source_aliases.add(value)
+            alias_defs.add(i)
+            top["state"] = "in_from"
+    return tables, source_aliases, column_aliases, context, alias_defs, cast_types
+
+
+def run_guarded(sql: str, check_cost: bool = True) -> tuple[int, float | None]:
+    """
+    Выполнить проверенный SQL и вернуть (первое значение, оценка стоимости).
+
+    Транзакция только на чтение, statement_timeout — FALLBACK_STATEMENT_TIMEOUT_MS.
+    При check_cost сначала EXPLAIN: план дороже FALLBACK_MAX_COST не выполняется.
+    """
+    bounded = f"SELECT * FROM ({sql}) AS fallback LIMIT {FALLBACK_MAX_ROWS}"
+    cost = None
+
+    with db.connection(statement_timeout_ms=FALLBACK_STATEMENT_TIMEOUT_MS) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION READ ONLY;")
+            if check_cost:
+                cur.execute("EXPLAIN (FORMAT JSON) " + bounded)
+                cost = cur.fetchone()[0][0]["Plan"]["Total Cost"]
+                if cost > FALLBACK_MAX_COST:
+                    raise SqlRejected(f"слишком дорогой план: {cost:.0f} > {FALLBACK_MAX_COST:.0f}")
+
+            cur.execute(bounded)
+            rows = cur.fetchall()
+
+    value = rows[0][0] if rows and rows[0] and rows[0][0] is not None else 0
+    return value, cost
+
+
+def normalize_question(user_text: str) -> str:
+    return " ".join(user_text.lower().split())
+
+
+class FallbackSqlCache:
+    """
+    Нормализованный вопрос → SQL, который прошёл validate_sql и EXPLAIN.
+    """
+
+    def __init__(self, max_size: int = FALLBACK_SQL_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def get(self, user_text: str) -> str | None:
+        key = normalize_question(user_text)
+        with self._lock:
+            sql = self._entries.get(key)
+            if sql is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sql
+
+    def put(self, user_text: str, sql: str):
+        with self._lock:
+            self._entries[normalize_question(user_text)] = sql
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+            }
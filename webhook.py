@@ -0,0 +1,281 @@
+"""
+Режим webhook: приём обновлений и N процессов-воркеров.
+
+  ingress (этот процесс) — aiohttp принимает POST от Telegram на
+      WEBHOOK_PATH, проверяет секрет и кладёт обновление в очередь воркера
+      chat_id % N. Все обновления одного чата попадают в один воркер.
+      Очередь полна — 503, Telegram повторит доставку позже.
+  воркер — свой event loop, пул БД, кэши и bot.dp; обновления одного чата
+      обрабатываются строго по очереди, разные чаты — параллельно (до
+      WORKER_CONCURRENCY). Ответы уходят через sender.Sender, общий лимит
+      TELEGRAM_GLOBAL_RATE делится между воркерами поровну.
+
+SIGTERM/SIGINT: ingress перестаёт принимать запросы, воркеры дорабатывают
+очередь, досылают ответы и закрывают пулы; кто не уложился в
+WORKER_STOP_TIMEOUT — terminate.
+
+  python webhook.py --workers 4
+  WEBHOOK_URL=https://bot.example.com/webhook WEBHOOK_SECRET=... python webhook.py
+"""
+import os
+import sys
+import queue
+import signal
+import asyncio
+import logging
+import argparse
+import multiprocessing as mp
+from collections import deque
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import metrics
+
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# публичный адрес для setWebhook; пусто — webhook уже настроен снаружи
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", str(os.cpu_count() or 1)))
+# обновлений в очереди одного воркера, сверх этого — 503
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+# одновременно обрабатываемых чатов в воркере
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "64"))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))
+# forkserver: тяжёлые библиотеки импортируются один раз в процессе-шаблоне,
+# воркеры — его форки; spawn — каждый воркер импортирует всё заново (~3 с CPU)
+WEBHOOK_START_METHOD = os.getenv(
+    "WEBHOOK_START_METHOD", "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+)
+# только библиотеки без состояния: пулы, кэши и сессии воркер создаёт сам после форка
+PRELOAD_MODULES = ["aiogram", "openai", "psycopg2"]
+
+log = logging.getLogger("webhook")
+
+
+def chat_id_of(update: dict) -> int:
+    """
+    Чат обновления; у обновлений без чата (inline и т.п.) — 0.
+    """
+    for key, value in update.items():
+        if isinstance(value, dict):
+            chat = value.get("chat") or (value.get("message") or {}).get("chat")
+            if chat:
+                return chat["id"]
+            if "from" in value:
+                return value["from"]["id"]
+    return 0
+
+
+# ---------- воркер ----------
+
+class ChatLanes:
+    """
+    Очередь на чат: обновления одного чата по одному, чаты — параллельно.
+    Не больше max_pending обновлений в работе — дальше читатель ждёт.
+    """
+
+    def __init__(self, handle, concurrency: int = WORKER_CONCURRENCY, max_pending: int = WORKER_QUEUE_SIZE):
+        self._handle = handle
+        self._lanes: dict[int, deque] = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending = asyncio.Semaphore(max_pending)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def push(self, chat_id: int, update: dict):
+        await self._pending.acquire()
+        lane = self._lanes.get(chat_id)
+        if lane is not None:
+            lane.append(update)
+            return
+        self._lanes[chat_id] = deque([update])
+        task = asyncio.create_task(self._run(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, chat_id: int):
+        lane = self._lanes[chat_id]
+        try:
+            while lane:
+                async with self._slots:
+                    try:
+                        await self._handle(lane[0])
+                    except Exception:
+                        log.exception("update failed", extra={"chat_id": chat_id})
+                lane.popleft()
+                self._pending.release()
+        finally:
+            del self._lanes[chat_id]
+
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+def _read(updates: mp.Queue):
+    """
+    Следующий элемент очереди; None — остановка, в том числе если ingress умер.
+    """
+    parent = mp.parent_process()
+    while True:
+        try:
+            return updates.get(timeout=1.0)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                return None
+
+
+async def _worker(index: int, updates: mp.Queue, workers: int, ready):
+    import bot as app
+    import db
+    from backends import close_backends
+    from sender import Sender, TELEGRAM_GLOBAL_RATE
+
+    bot = app.get_bot()
+    app.sender = Sender(bot, global_rate=TELEGRAM_GLOBAL_RATE / workers)
+    server = metrics.start_http_server(metrics.METRICS_PORT + 1 + index) if metrics.METRICS_PORT else None
+    refresher = asyncio.create_task(app.refresh_results())
+    warming = asyncio.create_task(app.warm_up())
+    lanes = ChatLanes(lambda update: app.dp.feed_raw_update(bot, update))
+    loop = asyncio.get_running_loop()
+    ready.set()
+    log.info("worker started", extra={"worker": index, "pid": os.getpid()})
+    try:
+        while True:
+            item = await loop.run_in_executor(None, _read, updates)
+            if item is None:
+                break
+            chat_id, update = item
+            await lanes.push(chat_id, update)
+        await lanes.drain()
+        await app.sender.close(WORKER_STOP_TIMEOUT)
+    finally:
+        warming.cancel()
+        refresher.cancel()
+        if server is not None:
+            server.shutdown()
+        await bot.session.close()
+        close_backends()
+        db.close_pool()
+        app.query_cache.flush()
+        log.info("worker stopped", extra={"worker": index})
+
+
+def worker_main(index: int, updates: mp.Queue, workers: int, ready):
+    # останавливает ingress через None в очереди, а не сигнал группе процессов
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    metrics.setup_logging()
+    try:
+        asyncio.run(_worker(index, updates, workers, ready))
+    finally:
+        metrics.stop_logging()
+
+
+# ---------- ingress ----------
+
+def make_app(queues: list, ready: list, secret: str = WEBHOOK_SECRET, path: str = WEBHOOK_PATH) -> web.Application:
+    async def receive(request: web.Request) -> web.Response:
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+            chat_id = int(chat_id_of(update))
+        except (ValueError, TypeError, AttributeError, KeyError):
+            # тело не JSON или не объект обновления — ошибка клиента, не наша
+            return web.Response(status=400)
+        worker = chat_id % len(queues)
+        try:
+            queues[worker].put_nowait((chat_id, update))
+        except queue.Full:
+            metrics.WEBHOOK_REJECTED.inc(worker=worker)
+            return web.Response(status=503)
+        metrics.WEBHOOK_UPDATES.inc(worker=worker)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        # 503, пока не все воркеры импортировали бота и открыли очередь
+        if not all(event.is_set() for event in ready):
+            return web.Response(status=503, text="starting")
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    app.router.add_get("/healthz", health)
+    return app
+
+
+async def _set_webhook(url: str, secret: str):
+    from aiogram import Bot
+
+    bot = Bot(os.environ["BOT_TOKEN"])
+    try:
+        await bot.set_webhook(url, secret_token=secret or None)
+    finally:
+        await bot.session.close()
+
+
+async def serve(workers: int = BOT_WORKERS, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+    ctx = mp.get_context(WEBHOOK_START_METHOD)
+    if WEBHOOK_START_METHOD == "forkserver":
+        ctx.set_forkserver_preload(PRELOAD_MODULES)
+    queues = [ctx.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+    ready = [ctx.Event() for _ in range(workers)]
+    processes = [
+        ctx.Process(target=worker_main, args=(i, q, workers, e), name=f"bot-worker-{i}")
+        for i, (q, e) in enumerate(zip(queues, ready))
+    ]
+    for p in processes:
+        p.start()
+
+    runner = web.AppRunner(make_app(queues, ready))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    server = metrics.start_http_server()
+    if WEBHOOK_URL:
+        await _set_webhook(WEBHOOK_URL, WEBHOOK_SECRET)
+    log.info("webhook listening", extra={"host": host, "port": port, "path": WEBHOOK_PATH, "workers": workers})
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    log.info("stopping")
+    # сначала перестать принимать, потом отпустить воркеры дорабатывать очередь
+    await runner.cleanup()
+    for q in queues:
+        q.put(None)
+    for p in processes:
+        await loop.run_in_executor(None, p.join, WORKER_STOP_TIMEOUT)
+        if p.is_alive():
+            log.warning("worker did not stop in time, terminating", extra={"worker": p.name})
+            p.terminate()
+    if server is not None:
+        server.shutdown()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бот в режиме webhook с несколькими воркерами")
+    parser.add_argument("--workers", type=int, default=BOT_WORKERS)
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    args = parser.parse_args()
+
+    if not os.getenv("BOT_TOKEN"):
+        raise RuntimeError("Не задан BOT_TOKEN в .env")
+    metrics.setup_logging()
+    try:
+        asyncio.run(serve(args.workers, args.host, args.port))
+    finally:
+        metrics.stop_logging()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())